@@ -10,6 +10,7 @@ Locations of the xDD are hard-coded in the configuration file.
 """
 
 import os, sys
+import posfile
 from config import TOPICS_DIR, TOPICS, DATA_DIRS
 
 def analyze_topics(write_overview: bool):
@@ -61,13 +62,8 @@ def ping_results():
         pos_dir = os.path.join(TOPICS_DIR, topic, 'processed_pos')
         docs = os.listdir(pos_dir)
         for doc in docs:
-            tokens = []
             path = os.path.join(pos_dir, doc)
-            with open(path) as fh:
-                for line in fh:
-                    fields = line.strip().split('\t')
-                    if len(fields) > 3:
-                        tokens.append(fields[1])
+            tokens = [token.text for token in posfile.tokens(path)]
             print(f'{doc}  {len(tokens):6d}  {sum([len(t) for t in tokens]):8d}')
         break
 
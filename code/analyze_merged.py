@@ -1,10 +1,13 @@
 """Pinging the merged files
 
-Prints a few statistics for each merged file in processed_mer for each topic.
+Prints a few statistics for each merged file in processed_mer for each topic. The
+merged files can also be in a JSON lines store (see mergedstore.py), which is read
+from start to end.
 
 """
 
-import os, sys, json
+import os, sys
+import mergedstore
 from config import TOPICS_DIR, TOPICS
 
 data_dir = 'processed_mer'
@@ -12,14 +15,13 @@ data_dir = 'processed_mer'
 
 def analyze_topic(topic: str):
     path = os.path.join(TOPICS_DIR, topic, data_dir)
-    fnames = [os.path.join(path, fname) for fname in os.listdir(path)]
-    for fname in sorted(fnames):
-        json_obj = json.load(open(fname))
+    store = mergedstore.open_merged(path)
+    for name, json_obj in store.items():
         abs_size = text_size(json_obj['abstract'])
         txt_size = text_size(json_obj['text'])
         entities = entities_size(json_obj['entities'])
-        print(f'{topic}  {os.path.basename(fname)}  {abs_size:5d}  {txt_size:6d}  {entities:4d}')
-    print(f'\nTotal documents in {topic}: {len(fnames)}')
+        print(f'{topic}  {name}.json  {abs_size:5d}  {txt_size:6d}  {entities:4d}')
+    print(f'\nTotal documents in {topic}: {len(store)}')
 
 
 def text_size(obj):
@@ -4,7 +4,8 @@ Print some statistics on availabilty of metadata and abstracts.
 
 """
 
-import os, json, collections
+import os
+import jsoncodec, metaindex
 from config import TOPICS_DIR, TOPICS, data_directory
 
 
@@ -32,12 +33,8 @@ def analyze_topic(topic: str):
     analyze_scienceparse(scpa_dir)
 
 def analyze_metadata(metadata_file: str):
-    metadata = json.load(open(metadata_file))
-    metadata_fields = collections.defaultdict(int)
-    for doc_data in metadata:
-        for key in doc_data.keys():
-            if doc_data[key]:
-                metadata_fields[key] += 1
+    # field counts are collected when the index is created, see metaindex.py
+    metadata_fields = metaindex.open_index(metadata_file).field_counts()
     print()
     for k, v in sorted(metadata_fields.items()):
         if k not in ('_gddid', 'identifier'):
@@ -48,7 +45,7 @@ def analyze_scienceparse(scpa_dir: str):
     abstracts = 0
     for n, fname in enumerate(os.listdir(scpa_dir)):
         #if n > 10: break
-        scpa = json.load(open(os.path.join(scpa_dir, fname)))
+        scpa = jsoncodec.load(os.path.join(scpa_dir, fname))
         abstract = scpa['metadata'].get('abstractText')
         if abstract:
             abstracts += 1
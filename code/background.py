@@ -0,0 +1,112 @@
+"""Running work in background threads
+
+Helpers to overlap reading and writing files with processing. Reading files and
+writing output mostly waits on I/O, during which the Python interpreter is free
+to run spaCy in the main thread. Both helpers use bounded queues so that memory
+use does not depend on how far the background thread could get ahead, and both
+run everything in the calling thread when the queue size is 0.
+
+prefetch()  - generates results of a function applied to a list of items, with
+              the function running ahead in a background thread
+Writer      - runs jobs in the order they were submitted in a background thread
+
+"""
+
+import queue, threading
+
+
+# how long a blocked thread waits before checking whether it should stop
+POLL_INTERVAL = 0.1
+
+
+def call(function, item):
+    """Returns the result of the function on the item or the exception raised."""
+    try:
+        return function(item)
+    except Exception as e:
+        return e
+
+
+def prefetch(function, items: list, size: int):
+    """Generate pairs of each item and the result of the function on the item, or
+    the exception raised by the function. The function runs in a background thread
+    and at most size results are waiting to be used. If the caller stops early the
+    background thread stops too."""
+    if size < 1:
+        for item in items:
+            yield item, call(function, item)
+        return
+    results = queue.Queue(maxsize=size)
+    stop = threading.Event()
+    end = object()
+    def put(result):
+        while not stop.is_set():
+            try:
+                results.put(result, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+    def load():
+        for item in items:
+            if not put((item, call(function, item))):
+                return
+        put(end)
+    thread = threading.Thread(target=load, daemon=True)
+    thread.start()
+    try:
+        while True:
+            result = results.get()
+            if result is end:
+                break
+            yield result
+    finally:
+        stop.set()
+
+
+class Writer:
+
+    """Runs jobs in a background thread in the order in which they were submitted,
+    with at most size jobs waiting. Jobs are expected to deal with their own errors,
+    other exceptions are raised again by close(). Can be used as a context manager,
+    which closes the writer when done."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.error = None
+        if size > 0:
+            self.jobs = queue.Queue(maxsize=size)
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def submit(self, function, *args):
+        if self.size > 0:
+            self.jobs.put((function, args))
+        else:
+            function(*args)
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            function, args = job
+            try:
+                function(*args)
+            except Exception as e:
+                if self.error is None:
+                    self.error = e
+
+    def close(self):
+        """Wait for all jobs to finish."""
+        if self.size > 0:
+            self.jobs.put(None)
+            self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,568 @@
+"""Benchmarks for the processing code
+
+Usage:
+
+$ python benchmark.py sentences [--sentences N] [--repeat N]
+$ python benchmark.py profiles [--doc DIR] [--limit N] [--batch-size N]
+$ python benchmark.py json [--size MB] [--kind scpa|doc]
+$ python benchmark.py merge [--docs N] [--rejected FRACTION] [--size KB]
+$ python benchmark.py codec [--docs N] [--size KB] [--repeat N]
+$ python benchmark.py elastic [--docs N] [--size KB] [--workers 1,2,4,8]
+$ python benchmark.py schema [--docs N] [--terms N] [--entities N]
+
+The sentences benchmark runs spaCy once over a long synthetic section and then
+compares the extraction and writing of accepted sentences in ner.py with the
+approach used before, where each sentence stored all tokens and noun chunks of
+the section and noun chunks were looked up again when writing. It prints the
+time and the peak memory used by the Python allocator for both.
+
+The profiles benchmark runs each pipeline profile from ner.PROFILES over a fixed
+corpus and prints documents per second. The corpus is either the first LIMIT
+documents from a directory with document structure parses or, without --doc, a
+set of synthetic documents.
+
+The json benchmark writes a large synthetic ScienceParse file (with the year at
+the end of the metadata, as in real files) or document structure file and reads
+what merge.py or ner.py needs from it, once with json.load() and once with
+jsonstream.load(). Each read runs in a fresh process, and the benchmark prints
+the time, the number of characters decoded and the peak resident set size.
+
+The merge benchmark creates a synthetic topic where a fraction of the documents
+lacks required ScienceParse metadata (in geoarchive about three quarters of the
+documents are rejected) and merges it twice, timing the whole run. Once with
+merge.merge_directory(), which checks the metadata before hashing and loading the
+other layers, and once hashing all layers and loading them before checking the
+metadata, as merge.py did before.
+
+The codec benchmark merges a synthetic topic and then, for each JSON backend from
+jsoncodec.py that is installed, times decoding the merged documents, encoding
+them in the pretty and compact modes and creating the bulk lines for them as
+prepare_elastic.py does. It prints the best time in seconds over the runs.
+
+The elastic benchmark merges a synthetic topic and converts the merged files into
+a bulk file with prepare_elastic.py for each number of workers, printing the
+documents per second and checking that the bulk file is the same each time.
+
+The schema benchmark creates synthetic merged documents with many terms and
+entities and, for each schema in elasticschema.py, times decoding a document,
+creating its ElasticSearch object and serializing the bulk lines, as done by
+prepare_elastic.py, and prints the size of the bulk lines.
+
+"""
+
+import os, io, sys, json, time, random, argparse, tempfile, subprocess, tracemalloc
+from collections import Counter
+import posfile
+
+
+# words used for synthetic text, mixing frequent and less frequent words so that
+# most sentences are accepted by ner.accept_sentence()
+WORDS = (
+    'the of and to in that was with is for as had not be on at by which have or '
+    'from this sediment analysis archaeological radiocarbon samples excavated '
+    'charcoal layers measured dated stratigraphy pottery Boston University').split()
+
+
+def synthetic_text(sentences: int, seed: int = 42):
+    rng = random.Random(seed)
+    text = []
+    for _ in range(sentences):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(8, 25))]
+        text.append(' '.join(words).capitalize() + '.')
+    return ' '.join(text)
+
+
+def measure(function, *args):
+    """Run the function and return the elapsed time and the peak memory in Mb."""
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    function(*args)
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1] / 1000000
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def legacy_extract_and_write(doc):
+    """The extraction and writing code from ner.py before it was made linear."""
+    import ner
+    entities = {}
+    paragraphs = []
+    for sent in doc.sents:
+        if ner.accept_sentence(sent):
+            for entity in sent.ents:
+                if entity.label_ in ner.ENTITY_TYPES:
+                    entities.setdefault(entity.label_, Counter())
+                    entities[entity.label_][entity.text] += 1
+            tokens = [t for t in doc]
+            noun_chunks = [nc for nc in doc.noun_chunks]
+            paragraphs.append((sent, tokens, noun_chunks))
+    fh = io.StringIO()
+    fh.write('<p>\n\n')
+    for paragraph in paragraphs:
+        s = paragraph[0]
+        fh.write(f'\n<s>\n\n{str(s)}\n\n')
+        for t in s:
+            posfile.write_token(fh, ner.token_fields(t))
+        fh.write('\n')
+        for nc in s.noun_chunks:
+            text = ' '.join(nc.text.replace('\n', '').split())
+            fh.write(f'{nc.start}\t{nc.end}\t{text}\n')
+    return fh.getvalue()
+
+
+def extract_and_write(doc):
+    import ner
+    entities = {}
+    paragraphs = []
+    ner.analyze_doc(doc, entities, paragraphs)
+    fh = io.StringIO()
+    posfile.write_text(fh, paragraphs)
+    return fh.getvalue()
+
+
+def benchmark_sentences(sentences: int, repeat: int):
+    import ner
+    print(f'\nParsing a section with {sentences} sentences...')
+    ner.load_pipeline()
+    doc = ner.nlp(synthetic_text(sentences))
+    if legacy_extract_and_write(doc) != extract_and_write(doc):
+        print('WARNING: output of the two approaches differs')
+    print(f'\n{"":10}  {"seconds":>8}  {"peak Mb":>8}')
+    for name, function in (('legacy', legacy_extract_and_write),
+                           ('linear', extract_and_write)):
+        results = [measure(function, doc) for _ in range(repeat)]
+        elapsed = min(r[0] for r in results)
+        peak = max(r[1] for r in results)
+        print(f'{name:10}  {elapsed:8.3f}  {peak:8.2f}')
+    print()
+
+
+def synthetic_corpus(docs: int, sections: int = 10, sentences: int = 20):
+    """Return a list of documents, where each document is a list of texts."""
+    return [[synthetic_text(sentences, seed=n * sections + i) for i in range(sections)]
+            for n in range(docs)]
+
+
+def read_corpus(doc_dir: str, limit: int):
+    import ner
+    return [ner.read_texts(doc_dir, doc) for doc in sorted(os.listdir(doc_dir))[:limit]]
+
+
+def benchmark_profiles(doc_dir: str, limit: int, batch_size: int):
+    import ner
+    if doc_dir is None:
+        corpus = synthetic_corpus(limit)
+    else:
+        corpus = read_corpus(doc_dir, limit)
+    texts = [ner.prepare_text(text) for doc_texts in corpus for text in doc_texts]
+    size = sum(len(text) for text in texts) / 1000000
+    print(f'\nRunning {len(ner.PROFILES)} profiles over {len(corpus)} documents'
+          f' with {len(texts)} texts ({size:.2f}M characters)...')
+    print(f'\n{"":15}  {"seconds":>8}  {"docs/sec":>8}  outputs')
+    for profile in ner.PROFILES:
+        ner.load_pipeline(profile)
+        t0 = time.perf_counter()
+        for spacy_doc in ner.nlp.pipe(texts, batch_size=batch_size):
+            ner.analyze_doc(spacy_doc, {}, [])
+        elapsed = time.perf_counter() - t0
+        outputs = ', '.join(ner.outputs())
+        print(f'{profile:15}  {elapsed:8.2f}  {len(corpus) / elapsed:8.2f}  {outputs}')
+    print()
+
+
+# code run in a separate process for the json benchmark, prints the elapsed time,
+# the characters decoded and the peak resident set size in Kb
+JSON_READER = """
+import sys, time, json, resource
+import jsonstream
+method, kind, fname = sys.argv[1:]
+if kind == 'scpa':
+    from merge import SCIENCEPARSE_SPEC as spec
+else:
+    from ner import doc_spec
+    spec = doc_spec()
+t0 = time.perf_counter()
+if method == 'json':
+    with open(fname) as fh:
+        json_obj = json.load(fh)
+    decoded = len(open(fname).read())
+else:
+    stats = {}
+    json_obj = jsonstream.load(fname, spec, stats)
+    decoded = stats['decoded']
+elapsed = time.perf_counter() - t0
+print(elapsed, decoded, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def synthetic_json(kind: str, size: int):
+    """Return a ScienceParse or document structure object with about size Mb."""
+    sections = []
+    while sum(len(s['text']) for s in sections) < size * 1000000:
+        sections.append({
+            'heading': synthetic_text(1, seed=len(sections)),
+            'text': synthetic_text(100, seed=len(sections)) })
+    if kind == 'doc':
+        return {
+            'title': 'A synthetic document',
+            'abstract': {'abstract': synthetic_text(10)},
+            'sections': sections }
+    references = [{'title': synthetic_text(1, seed=n), 'year': 2000 + n % 20}
+                  for n in range(len(sections))]
+    return {
+        'name': 'synthetic.pdf',
+        'metadata': {
+            'source': 'CRF',
+            'title': 'A synthetic document',
+            'authors': ['Jane Doe', 'John Doe'],
+            'sections': sections,
+            'references': references,
+            'year': 2010,
+            'abstractText': synthetic_text(10) }}
+
+
+def benchmark_json(size: int, kind: str):
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as fh:
+        json.dump(synthetic_json(kind, size), fh)
+        fname = fh.name
+    try:
+        print(f'\nReading {os.path.getsize(fname) / 1000000:.1f}Mb {kind} file...')
+        print(f'\n{"":10}  {"seconds":>8}  {"decoded Mb":>10}  {"peak RSS Mb":>11}')
+        for method in ('json', 'jsonstream'):
+            output = subprocess.run(
+                [sys.executable, '-c', JSON_READER, method, kind, fname],
+                capture_output=True, text=True, check=True,
+                cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+            elapsed, decoded, rss = output.split()
+            print(f'{method:10}  {float(elapsed):8.3f}  {int(decoded) / 1000000:10.2f}'
+                  f'  {int(rss) / 1000:11.1f}')
+        print()
+    finally:
+        os.remove(fname)
+
+
+def synthetic_topic(topic_dir: str, docs: int, rejected: float, size: int):
+    """Create the layers that merge.py needs for a synthetic topic, with documents
+    of about size Kb. Returns the list of document names."""
+    rng = random.Random(42)
+    dirs = {name: os.path.join(topic_dir, name) for name in ('scpa', 'doc', 'ner', 'sum', 'trm')}
+    for directory in dirs.values():
+        os.makedirs(directory)
+    names = [f'{n:024x}.json' for n in range(docs)]
+    terms = {}
+    records = []
+    for n, doc in enumerate(names):
+        identifier = doc[:-5]
+        sections = [{'heading': 'Section', 'text': synthetic_text(50, seed=n * 100 + i)}
+                    for i in range(max(1, size // 5))]
+        metadata = {'title': f'Document {n}', 'authors': ['Jane Doe'], 'sections': sections,
+                    'year': 2000 + n % 20}
+        if rng.random() < rejected:
+            del metadata[rng.choice(('title', 'authors', 'year'))]
+        with open(os.path.join(dirs['scpa'], identifier + '_input.pdf.json'), 'w') as fh:
+            json.dump({'name': identifier, 'metadata': metadata}, fh)
+        with open(os.path.join(dirs['doc'], doc), 'w') as fh:
+            json.dump({'title': f'Document {n}', 'abstract': {'abstract': synthetic_text(5)},
+                       'sections': sections}, fh)
+        with open(os.path.join(dirs['ner'], doc), 'w') as fh:
+            json.dump({'name': doc, 'entities': {'GPE': {'Boston': 3}}}, fh)
+        with open(os.path.join(dirs['sum'], identifier + '.txt'), 'w') as fh:
+            fh.write(synthetic_text(10, seed=n))
+        terms[identifier] = [['radiocarbon samples', 3, 1.5]]
+        records.append({'identifier': [{'type': '_xddid', 'id': identifier}],
+                        'link': [{'url': f'https://example.org/{identifier}'}]})
+    with open(os.path.join(dirs['trm'], 'frequencies.json'), 'w') as fh:
+        json.dump(terms, fh)
+    with open(os.path.join(topic_dir, 'metadata.bibjson'), 'w') as fh:
+        json.dump(records, fh)
+    return names
+
+
+def merge_late_rejection(doc: str):
+    """Merge a document the way merge.py did before, with all layers loaded before
+    the metadata are checked."""
+    import merge
+    import inventory
+    paths = inventory.paths(merge.SHARED['layers'], os.path.splitext(doc)[0])
+    scp_obj = merge.load_scienceparse(paths['scpa'])
+    doc_obj = merge.load_json(paths['doc'])
+    ner_obj = merge.load_json(paths['ner'])
+    summary = merge.get_summary(paths['sum'])
+    trm_obj = merge.SHARED['terms'].get(os.path.splitext(doc)[0], [])
+    merged_obj = merge.merge(
+        doc, scp_obj, doc_obj, ner_obj, trm_obj, summary, merge.SHARED['meta'])
+    if merge.rejection_reason(scp_obj) is None:
+        with open(os.path.join(merge.SHARED['out_dir'], doc), 'w') as fh:
+            fh.write(json.dumps(merged_obj, indent=2))
+
+
+def merge_directory_late_rejection(topic_dir: str, out_dir: str):
+    """Merge a topic the way merge.py did before, hashing all layers of all documents
+    for the manifest and then loading all layers of each document before checking
+    its metadata. Writing the manifest, the log and the coverage report is left out,
+    so this is somewhat faster than the old merge.py was."""
+    import merge, inventory, manifest, metaindex, termstore
+    layers = inventory.build({name: (os.path.join(topic_dir, name), suffix)
+                              for name, suffix in merge.LAYERS.items()})
+    docs = sorted(identifier + merge.LAYERS['doc'] for identifier in layers['doc'])
+    terms = termstore.open_store(os.path.join(topic_dir, 'trm'))
+    meta = metaindex.open_index(os.path.join(topic_dir, 'metadata.bibjson'))
+    for doc in docs:
+        paths = inventory.paths(layers, os.path.splitext(doc)[0])
+        manifest.data_hash([manifest.file_hash(*merge.input_files(paths)),
+                            terms.get(os.path.splitext(doc)[0], []),
+                            meta.get(os.path.splitext(doc)[0])])
+    merge.SHARED.clear()
+    merge.SHARED.update(terms=terms, meta=meta, layers=layers, out_dir=out_dir)
+    for doc in docs:
+        merge_late_rejection(doc)
+
+
+def merge_directory_early_rejection(topic_dir: str, out_dir: str):
+    """Merge a topic with merge.merge_directory(), which checks the metadata before
+    the other layers are hashed and loaded."""
+    import merge
+    layers = {name: os.path.join(topic_dir, name) for name in ('scpa', 'doc', 'ner', 'trm', 'sum')}
+    merge.merge_directory(
+        layers['scpa'], os.path.join(topic_dir, 'metadata.bibjson'), layers['doc'],
+        layers['ner'], layers['trm'], layers['sum'], out_dir, sys.maxsize)
+
+
+def benchmark_merge(docs: int, rejected: float, size: int):
+    import metaindex, termstore
+    with tempfile.TemporaryDirectory() as topic_dir:
+        print(f'\nCreating {docs} synthetic documents...')
+        synthetic_topic(topic_dir, docs, rejected, size)
+        # create the term store and metadata index, which both runs would reuse
+        termstore.open_store(os.path.join(topic_dir, 'trm'))
+        metaindex.open_index(os.path.join(topic_dir, 'metadata.bibjson'))
+        # merge.py writes its logs to the logs directory in the working directory
+        cwd = os.getcwd()
+        os.chdir(topic_dir)
+        os.makedirs('logs')
+        print(f'\n{"":8}  {"seconds":>8}  {"docs/sec":>8}  {"merged":>6}')
+        results = {}
+        try:
+            for name, function in (('late', merge_directory_late_rejection),
+                                   ('early', merge_directory_early_rejection)):
+                out_dir = os.path.join(topic_dir, f'mer-{name}')
+                os.makedirs(out_dir)
+                stdout, stderr = sys.stdout, sys.stderr
+                sys.stdout = sys.stderr = io.StringIO()
+                try:
+                    t0 = time.perf_counter()
+                    function(topic_dir, out_dir)
+                    elapsed = results[name] = time.perf_counter() - t0
+                finally:
+                    sys.stdout, sys.stderr = stdout, stderr
+                merged = len([fname for fname in os.listdir(out_dir)
+                              if fname.endswith('.json')])
+                print(f'{name:8}  {elapsed:8.2f}  {docs / elapsed:8.1f}  {merged:6d}')
+        finally:
+            os.chdir(cwd)
+        saved = results['late'] - results['early']
+        print(f'\nTime saved: {saved:.2f} seconds ({100 * saved / results["late"]:.0f}%)\n')
+
+
+def benchmark_codec(docs: int, size: int, repeat: int):
+    import merge, inventory, metaindex, termstore, jsoncodec, utils
+    with tempfile.TemporaryDirectory() as topic_dir:
+        print(f'\nCreating {docs} synthetic merged documents...')
+        names = synthetic_topic(topic_dir, docs, 0.0, size)
+        out_dir = os.path.join(topic_dir, 'mer')
+        os.makedirs(out_dir)
+        merge.SHARED.update(
+            terms=termstore.open_store(os.path.join(topic_dir, 'trm')),
+            meta=metaindex.open_index(os.path.join(topic_dir, 'metadata.bibjson')),
+            layers=inventory.build({name: (os.path.join(topic_dir, name), suffix)
+                                    for name, suffix in merge.LAYERS.items()}),
+            out_dir=out_dir)
+        for doc in names:
+            merge.merge_doc(doc)
+        texts = []
+        for doc in names:
+            with open(os.path.join(out_dir, doc), 'rb') as fh:
+                texts.append(fh.read())
+    objects = [json.loads(text) for text in texts]
+    megabytes = sum(len(text) for text in texts) / 1000000
+    print(f'Total size of merged files: {megabytes:.1f}Mb')
+
+    def bulk_lines(text):
+        json_obj = jsoncodec.loads(text)
+        elastic_obj = utils.create_elastic_object(json_obj, ['tag'])
+        return (jsoncodec.dumps({"index": {"_id": json_obj['name']}}) + '\n'
+                + jsoncodec.dumps(elastic_obj) + '\n')
+
+    tasks = (
+        ('decode', lambda: [jsoncodec.loads(text) for text in texts]),
+        ('pretty', lambda: [jsoncodec.dumpb(obj, pretty=True) for obj in objects]),
+        ('compact', lambda: [jsoncodec.dumpb(obj) for obj in objects]),
+        ('bulk', lambda: [bulk_lines(text) for text in texts]))
+    print(f'\n{"":8}' + ''.join(f'  {task:>8}' for task, _ in tasks) + f'  {"bulk docs/sec":>13}')
+    for backend in jsoncodec.available():
+        jsoncodec.use(backend)
+        timings = []
+        for task, function in tasks:
+            best = None
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                function()
+                elapsed = time.perf_counter() - t0
+                best = elapsed if best is None else min(best, elapsed)
+            timings.append(best)
+        print(f'{backend:8}' + ''.join(f'  {elapsed:8.3f}' for elapsed in timings)
+              + f'  {docs / timings[-1]:13.1f}')
+    jsoncodec.use()
+    print()
+
+
+def benchmark_elastic(docs: int, size: int, workers: list):
+    import merge, inventory, metaindex, termstore, prepare_elastic
+    with tempfile.TemporaryDirectory() as topic_dir:
+        print(f'\nCreating {docs} synthetic merged documents...')
+        names = synthetic_topic(topic_dir, docs, 0.0, size)
+        mer_dir = os.path.join(topic_dir, 'mer')
+        os.makedirs(mer_dir)
+        merge.SHARED.update(
+            terms=termstore.open_store(os.path.join(topic_dir, 'trm')),
+            meta=metaindex.open_index(os.path.join(topic_dir, 'metadata.bibjson')),
+            layers=inventory.build({name: (os.path.join(topic_dir, name), suffix)
+                                    for name, suffix in merge.LAYERS.items()}),
+            out_dir=mer_dir)
+        for doc in names:
+            merge.merge_doc(doc)
+        results = []
+        for count in workers:
+            ela_dir = os.path.join(topic_dir, f'ela-{count}')
+            stdout = sys.stdout
+            sys.stdout = io.StringIO()
+            try:
+                t0 = time.perf_counter()
+                prepare_elastic.prepare(mer_dir, ela_dir, ['tag'], sys.maxsize,
+                                        overwrite=True, workers=count)
+                elapsed = time.perf_counter() - t0
+            finally:
+                sys.stdout = stdout
+            with open(os.path.join(ela_dir, prepare_elastic.ELASTIC_FILE), 'rb') as fh:
+                results.append((count, elapsed, fh.read()))
+    print(f'\n{"workers":>8}  {"seconds":>8}  {"docs/sec":>8}  {"speedup":>7}  same')
+    for count, elapsed, bulk in results:
+        speedup = results[0][1] / elapsed
+        same = 'yes' if bulk == results[0][2] else 'NO'
+        print(f'{count:8d}  {elapsed:8.2f}  {docs / elapsed:8.1f}  {speedup:7.2f}  {same}')
+    print()
+
+
+def synthetic_merged(docs: int, terms: int, entities: int):
+    """Return merged documents as they are stored, with the given number of terms
+    and entities for each document."""
+    rng = random.Random(42)
+    words = synthetic_text(20).replace('.', '').split()
+    texts = []
+    for n in range(docs):
+        merged_obj = {
+            'name': f'{n:024x}', 'title': f'Document {n}', 'year': 2000 + n % 20,
+            'url': f'https://example.org/{n:024x}', 'authors': ['Jane Doe'],
+            'abstract': synthetic_text(5, seed=n), 'content': synthetic_text(200, seed=n),
+            'summary': synthetic_text(20, seed=n),
+            'entities': {
+                entity_type: {f'{rng.choice(words).title()} {i}': rng.randint(1, 20)
+                              for i in range(entities)}
+                for entity_type in ('GPE', 'ORG', 'PERSON')},
+            'terms': [[f'{rng.choice(words)} {rng.choice(words)}', rng.randint(1, 50),
+                       rng.random() * 10] for _ in range(terms)]}
+        texts.append(json.dumps(merged_obj).encode('utf8'))
+    return texts
+
+
+def benchmark_schema(docs: int, terms: int, entities: int):
+    import jsoncodec, elasticschema
+    texts = synthetic_merged(docs, terms, entities)
+    print(f'\n{docs} documents with {terms} terms and {3 * entities} entities,'
+          f' JSON backend {jsoncodec.backend()}')
+    print(f'\n{"schema":8}  {"seconds":>8}  {"docs/sec":>8}  {"Mb":>6}  {"Kb/doc":>6}')
+    for schema in elasticschema.SCHEMAS:
+        size = 0
+        t0 = time.perf_counter()
+        for text in texts:
+            json_obj = jsoncodec.loads(text)
+            elastic_obj = elasticschema.create_object(json_obj, ['tag'], schema)
+            data = (jsoncodec.dumpb({"index": {"_id": json_obj['name']}}) + b'\n'
+                    + jsoncodec.dumpb(elastic_obj) + b'\n')
+            size += len(data)
+        elapsed = time.perf_counter() - t0
+        print(f'{schema:8}  {elapsed:8.3f}  {docs / elapsed:8.1f}  {size / 1000000:6.2f}'
+              f'  {size / docs / 1000:6.2f}')
+    print()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmarks for the processing code')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+    sentences = subparsers.add_parser(
+        'sentences', help="sentence extraction and writing in ner.py")
+    sentences.add_argument('--sentences', help="number of sentences in the section",
+                           type=int, default=2000)
+    sentences.add_argument('--repeat', help="number of runs", type=int, default=3)
+    profiles = subparsers.add_parser(
+        'profiles', help="documents per second for each ner.py pipeline profile")
+    profiles.add_argument('--doc', help="directory with document structure parses")
+    profiles.add_argument('--limit', help="number of documents in the corpus",
+                          type=int, default=100)
+    profiles.add_argument('--batch-size', help="batch size for nlp.pipe()",
+                          type=int, default=50)
+    jsonreading = subparsers.add_parser(
+        'json', help="reading large JSON files with json and jsonstream")
+    jsonreading.add_argument('--size', help="approximate size of the file in Mb",
+                             type=int, default=50)
+    jsonreading.add_argument('--kind', help="ScienceParse or document structure file",
+                             choices=('scpa', 'doc'), default='scpa')
+    merging = subparsers.add_parser(
+        'merge', help="merging with early and late rejection of documents")
+    merging.add_argument('--docs', help="number of documents", type=int, default=500)
+    merging.add_argument('--rejected', help="fraction of documents that is rejected",
+                         type=float, default=0.75)
+    merging.add_argument('--size', help="approximate size of each layer in Kb",
+                         type=int, default=50)
+    codec = subparsers.add_parser(
+        'codec', help="encoding and decoding merged documents with each JSON backend")
+    codec.add_argument('--docs', help="number of documents", type=int, default=500)
+    codec.add_argument('--size', help="approximate size of each layer in Kb",
+                       type=int, default=50)
+    codec.add_argument('--repeat', help="number of runs", type=int, default=3)
+    elastic = subparsers.add_parser(
+        'elastic', help="prepare_elastic.py throughput for different numbers of workers")
+    elastic.add_argument('--docs', help="number of documents", type=int, default=2000)
+    elastic.add_argument('--size', help="approximate size of each layer in Kb",
+                         type=int, default=50)
+    elastic.add_argument('--workers', help="comma-separated numbers of workers",
+                         type=lambda counts: [int(count) for count in counts.split(',')],
+                         default=[1, 2, 4, 8])
+    schema = subparsers.add_parser(
+        'schema', help="size and creation time of documents for each schema")
+    schema.add_argument('--docs', help="number of documents", type=int, default=1000)
+    schema.add_argument('--terms', help="number of terms for each document",
+                        type=int, default=200)
+    schema.add_argument('--entities', help="number of entities of each type",
+                        type=int, default=20)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+    if args.benchmark == 'sentences':
+        benchmark_sentences(args.sentences, args.repeat)
+    elif args.benchmark == 'profiles':
+        benchmark_profiles(args.doc, args.limit, args.batch_size)
+    elif args.benchmark == 'json':
+        benchmark_json(args.size, args.kind)
+    elif args.benchmark == 'merge':
+        benchmark_merge(args.docs, args.rejected, args.size)
+    elif args.benchmark == 'codec':
+        benchmark_codec(args.docs, args.size, args.repeat)
+    elif args.benchmark == 'elastic':
+        benchmark_elastic(args.docs, args.size, args.workers)
+    elif args.benchmark == 'schema':
+        benchmark_schema(args.docs, args.terms, args.entities)
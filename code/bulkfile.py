@@ -0,0 +1,174 @@
+"""Reading and writing compressed bulk files
+
+Bulk files for ElasticSearch can be written uncompressed (elastic.json), with gzip
+(elastic.json.gz) or with zstd (elastic.json.zst), the latter needs the zstandard
+package. The compression is taken from the extension when a file is read.
+
+Compressed files are written as a sequence of independent gzip members or zstd
+frames, each with the lines for whole documents and about BLOCK_SIZE bytes before
+compression. Tools like gunzip and zstd -d read such files as one stream, but the
+file can also be split at block boundaries and each block can be decompressed and
+posted on its own.
+
+    open_write(fname, compress)  returns a writer for bytes with a close() method
+    open_read(fname)             returns a binary file object with the decompressed
+                                 lines, which also supports seek() and tell() on
+                                 positions in the decompressed data
+
+"""
+
+import io, gzip, zlib
+
+
+COMPRESSIONS = ('gzip', 'zstd')
+EXTENSIONS = { 'gzip': '.gz', 'zstd': '.zst' }
+
+# approximate size of the uncompressed data in a gzip member or zstd frame
+BLOCK_SIZE = 10 * 1000 * 1000
+
+
+def extension(compress: str = None):
+    """Returns the extension added to a bulk file for the compression."""
+    return EXTENSIONS.get(compress, '')
+
+
+def compression(fname: str):
+    """Returns the compression of a file, using its extension."""
+    for compress, ext in EXTENSIONS.items():
+        if fname.endswith(ext):
+            return compress
+    return None
+
+
+def zstandard_module():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError('zstd compression requires the zstandard package')
+    return zstandard
+
+
+def compressor(compress: str):
+    """Returns a new compressor object for a block, with compress() and flush()."""
+    if compress == 'gzip':
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+    return zstandard_module().ZstdCompressor().compressobj()
+
+
+class BlockWriter:
+
+    """Writes bytes to a file in compressed blocks, a block is ended after a write
+    when it has at least block_size bytes. Callers write the lines of a document
+    in one write so that blocks end between documents."""
+
+    def __init__(self, fname: str, compress: str, block_size: int = BLOCK_SIZE):
+        if compress == 'zstd':
+            zstandard_module()
+        self.fh = open(fname, 'wb')
+        self.compress = compress
+        self.block_size = block_size
+        self.compressor = None
+        self.size = 0
+
+    def write(self, data: bytes):
+        if self.compressor is None:
+            self.compressor = compressor(self.compress)
+        self.fh.write(self.compressor.compress(data))
+        self.size += len(data)
+        if self.size >= self.block_size:
+            self.end_block()
+        return len(data)
+
+    def end_block(self):
+        if self.compressor is not None:
+            self.fh.write(self.compressor.flush())
+        self.compressor = None
+        self.size = 0
+
+    def close(self):
+        self.end_block()
+        self.fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def open_write(fname: str, compress: str = None, block_size: int = BLOCK_SIZE):
+    """Returns a binary writer for the file name, compressed if compress is given."""
+    if compress is None:
+        return open(fname, 'wb')
+    if compress not in COMPRESSIONS:
+        raise ValueError(f'unknown compression: {compress}')
+    return BlockWriter(fname, compress, block_size)
+
+
+class DecompressingReader:
+
+    """Reader for a compressed file. Seeking forward reads and drops data, seeking
+    backward starts reading from the start of the file again, so this is efficient
+    when positions are visited in order."""
+
+    def __init__(self, fname: str):
+        self.fname = fname
+        self.open()
+
+    def open(self):
+        self.raw_fh = open(self.fname, 'rb')
+        if compression(self.fname) == 'gzip':
+            stream = gzip.GzipFile(fileobj=self.raw_fh, mode='rb')
+        else:
+            stream = zstandard_module().ZstdDecompressor().stream_reader(
+                self.raw_fh, read_across_frames=True)
+        self.fh = io.BufferedReader(stream)
+        self.position = 0
+
+    def read(self, size: int = -1):
+        data = self.fh.read(size)
+        self.position += len(data)
+        return data
+
+    def readline(self, size: int = -1):
+        line = self.fh.readline(size)
+        self.position += len(line)
+        return line
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset: int):
+        if offset < self.position:
+            self.close()
+            self.open()
+        while self.position < offset:
+            if not self.read(min(offset - self.position, 1 << 20)):
+                break
+        return self.position
+
+    def close(self):
+        self.fh.close()
+        self.raw_fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def open_read(fname: str):
+    """Returns a binary file object with the decompressed contents of the file."""
+    if compression(fname) is None:
+        return open(fname, 'rb')
+    return DecompressingReader(fname)
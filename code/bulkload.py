@@ -0,0 +1,250 @@
+"""Loading bulk files into ElasticSearch
+
+Sends a bulk file created by prepare_elastic.py or merge.py --elastic to the bulk
+API of ElasticSearch, as an alternative to the curl commands from load_commands.py,
+which post the whole file in one request.
+
+$ python bulkload.py --index INDEX --input FILE [--host HOST] [--port PORT]
+                     [--chunk-size MB] [--concurrency N] [--retries N] [--gzip]
+
+The file is split into chunks of at most --chunk-size Mb (default 10), always
+between an action line and the line with its source, so chunks stay below the
+http.max_content_length of ElasticSearch. Chunks are posted by --concurrency
+threads (default 4) over a pool of keep-alive connections. The input file can be
+compressed with gzip or zstd (see bulkfile.py), and with --gzip the chunks are sent
+compressed with gzip, ElasticSearch decompresses them.
+
+When ElasticSearch answers with 429 (Too Many Requests) or 503 (Service Unavailable),
+or the connection fails, the chunk is sent again after waiting for an increasing
+amount of time, up to --retries times. Documents that are rejected with a 429 in an
+otherwise succesful bulk response are sent again in the same way. All other errors
+for single documents are taken from the bulk response and written to a log in
+the logs directory, the number of errors for each type is printed at the end.
+
+Exits with status 1 if any document was not loaded.
+
+The tests in test_bulkload.py run the loader against a stub of the bulk API.
+
+"""
+
+import sys, gzip, time, queue, argparse, http.client
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import bulkfile, jsoncodec
+from utils import timestamp
+from load_commands import ELASTIC_HOST, ELASTIC_PORT
+
+
+# default maximum size of a request body in bytes
+CHUNK_SIZE = 10 * 1000 * 1000
+
+# statuses of a bulk request or of a document in a bulk response that mean that
+# ElasticSearch is too busy and that the request can be sent again
+RETRY_STATUSES = (429, 503)
+
+# seconds to wait before the first retry, this doubles for each next retry
+BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+
+# action lines that are not followed by a line with a source
+SOURCELESS_ACTIONS = (b'{"delete"',)
+
+
+def chunks(fname: str, chunk_size: int = CHUNK_SIZE):
+    """Generate lists of the actions in the bulk file, where each action is the bytes
+    of an action line and, for all but deletions, the line with its source, and where
+    the actions of a list add up to at most chunk_size bytes. An action that is larger
+    than chunk_size gets a list of its own."""
+    chunk = []
+    size = 0
+    with bulkfile.open_read(fname) as fh:
+        for line in fh:
+            if not line.strip():
+                continue
+            action = line if line.endswith(b'\n') else line + b'\n'
+            if not line.startswith(SOURCELESS_ACTIONS):
+                action += fh.readline()
+            if chunk and size + len(action) > chunk_size:
+                yield chunk
+                chunk = []
+                size = 0
+            chunk.append(action)
+            size += len(action)
+    if chunk:
+        yield chunk
+
+
+class ConnectionPool:
+
+    """Keep-alive connections to ElasticSearch, shared by the threads that post the
+    chunks. A connection that fails is closed and opened again on the next request."""
+
+    def __init__(self, host: str, port: int, size: int, timeout: float = 120):
+        self.connections = queue.Queue()
+        for _ in range(size):
+            self.connections.put(http.client.HTTPConnection(host, port, timeout=timeout))
+
+    def post(self, path: str, body: bytes, encoding: str = None):
+        """Post the body and return the status and the body of the response. The
+        encoding is the Content-Encoding of a compressed body."""
+        headers = {'Content-Type': 'application/x-ndjson', 'Connection': 'keep-alive'}
+        if encoding is not None:
+            headers['Content-Encoding'] = encoding
+        connection = self.connections.get()
+        try:
+            connection.request('POST', path, body=body, headers=headers)
+            response = connection.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            raise
+        finally:
+            self.connections.put(connection)
+
+    def close(self):
+        while not self.connections.empty():
+            self.connections.get().close()
+
+
+class BulkLoader:
+
+    """Posts the chunks of a bulk file to the bulk API of an index."""
+
+    def __init__(self, host: str, port: int, index: str, concurrency: int = 4,
+                 retries: int = 8, backoff: float = BACKOFF, compress: bool = False):
+        self.pool = ConnectionPool(host, port, concurrency)
+        self.path = f'/{index}/_bulk'
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.compress = compress
+
+    def load(self, fname: str, chunk_size: int = CHUNK_SIZE, log=None):
+        """Load the bulk file and return a Counter with the number of loaded documents
+        and the number of errors for each type of error. Errors are written to the
+        log if there is one."""
+        results = Counter()
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            # at most two chunks per thread are read ahead of the requests
+            pending = []
+            for chunk in chunks(fname, chunk_size):
+                pending.append(executor.submit(self.send, chunk))
+                if len(pending) >= 2 * self.concurrency:
+                    self.collect(pending.pop(0), results, log)
+            for future in pending:
+                self.collect(future, results, log)
+        return results
+
+    def collect(self, future, results: Counter, log=None):
+        loaded, errors = future.result()
+        results['loaded'] += loaded
+        for identifier, error_type, reason in errors:
+            results[error_type] += 1
+            if log is not None:
+                log.write(f'{identifier}\t{error_type}\t{reason}\n')
+        print(f'{results["loaded"]} documents loaded', end='\r')
+
+    def send(self, actions: list):
+        """Post the actions and return the number of loaded documents and a list with
+        the identifier, error type and reason for each document that failed. Actions
+        are posted again while ElasticSearch is too busy, at most self.retries times."""
+        loaded = 0
+        errors = []
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(min(MAX_BACKOFF, self.backoff * 2 ** (attempt - 1)))
+            try:
+                status, body = self.post(b''.join(actions))
+            except (OSError, http.client.HTTPException) as e:
+                retry_error = ('connection', str(e))
+                continue
+            if status in RETRY_STATUSES:
+                retry_error = (f'http-{status}', body[:200].decode('utf8', 'replace'))
+                continue
+            if status >= 300:
+                reason = body[:200].decode('utf8', 'replace')
+                return loaded, errors + [
+                    (action_identifier(action), f'http-{status}', reason) for action in actions]
+            rejected = []
+            response = jsoncodec.loads(body)
+            for action, item in zip(actions, response.get('items', [])):
+                result = next(iter(item.values()))
+                if result.get('status', 200) in RETRY_STATUSES:
+                    rejected.append(action)
+                    retry_error = (error_type(result), error_reason(result))
+                elif 'error' in result:
+                    errors.append((result.get('_id'), error_type(result), error_reason(result)))
+                else:
+                    loaded += 1
+            if not rejected:
+                return loaded, errors
+            actions = rejected
+        return loaded, errors + [
+            (action_identifier(action), *retry_error) for action in actions]
+
+    def post(self, body: bytes):
+        if self.compress:
+            return self.pool.post(self.path, gzip.compress(body, compresslevel=1), 'gzip')
+        return self.pool.post(self.path, body)
+
+    def close(self):
+        self.pool.close()
+
+
+def action_identifier(action: bytes):
+    action_obj = jsoncodec.loads(action.split(b'\n', 1)[0])
+    return next(iter(action_obj.values())).get('_id')
+
+
+def error_type(result: dict):
+    error = result.get('error')
+    if isinstance(error, dict):
+        return error.get('type', 'unknown')
+    return f'status-{result.get("status")}'
+
+
+def error_reason(result: dict):
+    error = result.get('error')
+    if isinstance(error, dict):
+        return error.get('reason', '')
+    return str(error)
+
+
+def print_results(results: Counter, log_fname: str):
+    loaded = results.pop('loaded', 0)
+    print(f'\nLoaded {loaded} documents, {sum(results.values())} failed')
+    for error, count in results.most_common():
+        print(f'    {count:7d}  {error}')
+    if results:
+        print(f'\nErrors were written to {log_fname}')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Load a bulk file into ElasticSearch')
+    parser.add_argument('--index', help="name of the index", required=True)
+    parser.add_argument('--input', help="bulk file", required=True)
+    parser.add_argument('--host', help="ElasticSearch host", default=ELASTIC_HOST)
+    parser.add_argument('--port', help="ElasticSearch port", type=int, default=ELASTIC_PORT)
+    parser.add_argument('--chunk-size', help="maximum size of a request in Mb",
+                        type=float, default=CHUNK_SIZE / 1000000)
+    parser.add_argument('--concurrency', help="number of concurrent requests",
+                        type=int, default=4)
+    parser.add_argument('--retries', help="number of retries of a rejected request",
+                        type=int, default=8)
+    parser.add_argument('--gzip', help="send requests compressed with gzip",
+                        action='store_true')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+    loader = BulkLoader(args.host, args.port, args.index, args.concurrency, args.retries,
+                        compress=args.gzip)
+    log_fname = f'logs/bulkload-{timestamp()}.log'
+    with open(log_fname, 'w') as log:
+        results = loader.load(args.input, int(args.chunk_size * 1000000), log)
+    loader.close()
+    failed = sum(count for error, count in results.items() if error != 'loaded')
+    print_results(results, log_fname)
+    sys.exit(1 if failed else 0)
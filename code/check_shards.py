@@ -0,0 +1,96 @@
+"""Check the output of sharded runs
+
+Usage:
+
+$ python check_shards.py --input DIR --shards N [--allow-missing] OUTPUT...
+
+Verifies that the outputs of running ner.py, merge.py or prepare_elastic.py with
+--shard I/N for each I from 1 to N together cover the documents in the input
+directory exactly once. Each OUTPUT is either a directory with per-document files,
+the index file of a JSON lines store written by merge.py --out-format jsonl (see
+mergedstore.py) or an ElasticSearch bulk file created by prepare_elastic.py, which
+can be compressed (see bulkfile.py). If there are N outputs they are taken to be the
+outputs of shards 1 through N, in that order, and each document is also checked to
+be in the output of the shard it was assigned to.
+
+Reports documents that are missing from all outputs, documents that occur in more
+than one output, documents that are not in the input and documents in the wrong
+shard. Missing documents are not an error with --allow-missing, which is useful
+for merge.py, which rejects documents without a title, year or authors.
+
+Exits with status 1 if the check fails.
+
+"""
+
+import os, sys, json, argparse
+from collections import Counter
+import utils, bulkfile, mergedstore
+
+
+def input_identifiers(input_dir: str):
+    return {utils.identifier(fname) for fname in os.listdir(input_dir)}
+
+
+def output_identifiers(output: str):
+    """Returns the identifiers of all documents in a shard output."""
+    if os.path.isdir(output):
+        return [utils.identifier(fname) for fname in os.listdir(output)]
+    if output.endswith(mergedstore.INDEX_EXTENSION):
+        return list(mergedstore.read_index(output))
+    identifiers = []
+    with bulkfile.open_read(output) as fh:
+        for line in fh:
+            if line.startswith(b'{"index"'):
+                identifiers.append(json.loads(line)['index']['_id'])
+    return identifiers
+
+
+def check_shards(input_dir: str, shards: int, outputs: list, allow_missing: bool):
+    expected = input_identifiers(input_dir)
+    found = Counter()
+    misplaced = []
+    for n, output in enumerate(outputs):
+        identifiers = output_identifiers(output)
+        found.update(identifiers)
+        if len(outputs) == shards:
+            misplaced.extend(
+                (identifier, output) for identifier in identifiers
+                if utils.shard_index(identifier, shards) != n + 1)
+    missing = sorted(expected - set(found))
+    duplicates = sorted(identifier for identifier, count in found.items() if count > 1)
+    unexpected = sorted(set(found) - expected)
+    print(f'\nDocuments in input:  {len(expected):7d}')
+    print(f'Documents in output: {len(found):7d}\n')
+    report('missing', missing)
+    report('duplicate', duplicates)
+    report('not in input', unexpected)
+    report('in wrong shard', [f'{identifier}  {output}' for identifier, output in misplaced])
+    ok = not (duplicates or unexpected or misplaced or (missing and not allow_missing))
+    print('OK' if ok else 'FAILED')
+    return ok
+
+
+def report(label: str, identifiers: list):
+    print(f'{label:15} {len(identifiers):7d}')
+    for identifier in identifiers[:10]:
+        print(f'    {identifier}')
+    if len(identifiers) > 10:
+        print(f'    ...')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Check the output of sharded runs')
+    parser.add_argument('--input', help="input directory of the sharded stage")
+    parser.add_argument('--shards', help="number of shards", type=int)
+    parser.add_argument('--allow-missing', help="do not fail on missing documents",
+                        action='store_true')
+    parser.add_argument('outputs', help="output directories, store indexes or bulk files",
+                        nargs='+')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+    ok = check_shards(args.input, args.shards, args.outputs, args.allow_missing)
+    sys.exit(0 if ok else 1)
@@ -21,6 +21,17 @@ ENTITY_TYPES = set(['FAC', 'GPE', 'LOC', 'NORP',  'ORG',  'PERSON'])
 MERGED_FIELDS = ('name', 'year', 'title', 'authors', 'url', 'abstract',
                  'content', 'summary', 'terms')
 
+# In addition to the abstract and text, documents get a summary, with just the data
+# that will be returned from the database. Any processing for ranking will be done
+# using just these data. Setting it higher will make ranking better but increase
+# the size of the datastructures handed from the database. Summaries are created
+# with this limit by summarize.py and cut off at it by merge.py.
+SUMMARY_MAX_TOKENS = 2000
+
+# JSON backend used by jsoncodec.py, one of 'orjson', 'ujson' and 'json', or None
+# to use the fastest one that is installed
+JSON_CODEC = None
+
 
 def data_directory(topic: str, data_dir: str):
     return os.path.join(TOPICS_DIR, topic, data_dir)
@@ -0,0 +1,107 @@
+"""Document schemas for ElasticSearch
+
+There are two schemas for the documents in the bulk files. The flat schema is what
+utils.create_elastic_object() creates, where terms are lists of three strings and
+entities are lists of an entity and a count as a string, since ElasticSearch does
+not allow arrays with values of different types. The typed schema uses objects
+with numeric fields instead:
+
+    "terms": [{"term": "radiocarbon samples", "count": 3, "score": 1.5}, ...]
+    "entities": {"GPE": [{"entity": "Boston", "count": 3}, ...], ...}
+
+Terms and entities are mapped as nested objects, so that a query can ask for a term
+with a minimum score. The index has to be created with the mapping before the bulk
+file is loaded, the mapping is printed with
+
+$ python elasticschema.py --mapping
+
+and an index can be created with it like this:
+
+$ python elasticschema.py --mapping > mapping.json
+$ curl -X PUT http://localhost:9200/xdd-bio \
+    -H "Content-Type: application/json" --data-binary @mapping.json
+
+Use "python benchmark.py schema" to compare the size of the documents and the time
+needed to create them for both schemas.
+
+"""
+
+import argparse
+import jsoncodec, utils
+from config import MERGED_FIELDS, ENTITY_TYPES
+
+
+FLAT = 'flat'
+TYPED = 'typed'
+SCHEMAS = (FLAT, TYPED)
+
+
+def create_object(json_obj: dict, tags: list, schema: str = FLAT):
+    """Creates the dictionary for a merged document that goes into the bulk file."""
+    if schema == TYPED:
+        return create_typed_object(json_obj, tags)
+    return utils.create_elastic_object(json_obj, tags)
+
+
+def create_typed_object(json_obj: dict, tags: list):
+    """Creates a dictionary for the typed schema, with numeric counts and scores."""
+    elastic_obj = {"tags": tags}
+    for field in MERGED_FIELDS:
+        if field in json_obj:
+            elastic_obj[field] = json_obj[field]
+        elif field == 'content':
+            elastic_obj[field] = json_obj['text']
+    elastic_obj['terms'] = [
+        {'term': term, 'count': count, 'score': score}
+        for term, count, score in json_obj.get('terms', [])]
+    elastic_obj['entities'] = {
+        entity_type: [{'entity': entity, 'count': count}
+                      for entity, count in dictionary.items()]
+        for entity_type, dictionary in json_obj.get('entities', {}).items()}
+    return elastic_obj
+
+
+def mapping():
+    """Returns the index mapping for the typed schema."""
+    text = {'type': 'text'}
+    keyword = {'type': 'keyword'}
+    entity = {
+        'type': 'nested',
+        'properties': {
+            'entity': {'type': 'text', 'fields': {'raw': keyword}},
+            'count': {'type': 'integer'}}}
+    return {
+        'mappings': {
+            'properties': {
+                'tags': keyword,
+                'name': keyword,
+                'year': {'type': 'integer'},
+                'title': text,
+                'authors': text,
+                'url': keyword,
+                'abstract': text,
+                'content': text,
+                'summary': text,
+                'terms': {
+                    'type': 'nested',
+                    'properties': {
+                        'term': {'type': 'text', 'fields': {'raw': keyword}},
+                        'count': {'type': 'integer'},
+                        'score': {'type': 'float'}}},
+                'entities': {
+                    'properties': {
+                        entity_type: entity for entity_type in sorted(ENTITY_TYPES)}}}}}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='ElasticSearch document schemas')
+    parser.add_argument('--mapping', help="print the mapping for the typed schema",
+                        action='store_true')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+    if args.mapping:
+        print(jsoncodec.dumps(mapping(), pretty=True))
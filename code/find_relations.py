@@ -17,6 +17,7 @@ out/relations-molecular_physics.txt
 
 import os, sys, math, collections
 from tqdm import tqdm
+import posfile
 from config import TOPICS, data_directory
 
 
@@ -50,14 +51,8 @@ def collect_verbs_in_topic(pos_dir: str, topic: str, limit: int):
 
 def count_verbs(topic_dir: str, doc: str):
     fname = os.path.join(topic_dir, doc)
-    with open(fname) as fh:
-        verbs = []
-        for line in fh:
-            fields = line.strip().split('\t')
-            # fields: (i, token, lemma, pos1, pos2)
-            if len(fields) == 5 and fields[3] == 'VERB':
-                verbs.append(fields[2])
-        return collections.Counter(verbs)
+    return collections.Counter(
+        token.lemma for token in posfile.tokens_with_pos(fname, 'VERB'))
 
 
 def calculate_tfidf(verbs):
@@ -3,13 +3,15 @@
 Select random files from a topic and write a JSON file that can serve as a ElasticSearch
 bulk upload.
 
-$ python random.py --topic TOPIC --tags TAGS -n N
+$ python random.py --topic TOPIC --tags TAGS -n N [--compress gzip|zstd]
 
 This hands in the name of the topic, a comma-separated list of tags and a count (the
 default is 25). The topic needs to be defined in the config file and the merged files
-for it need to be where the config file expects them to be.
+for it need to be where the config file expects them to be, either as files or as
+a JSON lines store (see mergedstore.py).
 
-Output is written to out/random-ela-TOPIC-NUMBER.json
+Output is written to out/random-ela-TOPIC-NUMBER.json, with --compress it is
+compressed and .gz or .zst is added to the name (see bulkfile.py).
 
 Note that the output file is not exactly json, rather they are files where each line
 is a json object (as required for an ElasticSearch bulk import).
@@ -26,25 +28,26 @@ $ python get_random_ela.py --topic random --tags random -n 1000
 
 """
 
-import os, json, random, argparse
-import utils
+import os, random, argparse
+import utils, bulkfile, jsoncodec, mergedstore
 import config
 
 
-def select_random(topic: str, topic_dir: str, tags: list, limit: int):
-    outfile = f'out/random-ela-{topic}-{limit:04d}.json'
+def select_random(topic: str, topic_dir: str, tags: list, limit: int, compress: str = None):
+    outfile = f'out/random-ela-{topic}-{limit:04d}.json{bulkfile.extension(compress)}'
     print(f'Selecting {limit} samples from {topic}')
     print(f'Writing results to {outfile}')
-    files = os.listdir(topic_dir)
-    random.shuffle(files)
-    with open(outfile, 'w') as fh:
-        for fname in files[:limit]:
-            content = json.loads(open(os.path.join(topic_dir, fname)).read())
+    store = mergedstore.open_merged(topic_dir)
+    names = list(store.names())
+    random.shuffle(names)
+    with bulkfile.open_write(outfile, compress) as fh:
+        for name in names[:limit]:
+            content = store.get(name)
             elastic_obj = utils.create_elastic_object(content, tags)
             # TODO: should scramble the contents of the content field
             # TODO: do this governed by an option
-            fh.write(json.dumps({"index": {"_id": content['name']}}) + '\n')
-            fh.write(json.dumps(elastic_obj) + '\n')
+            fh.write(jsoncodec.dumpb({"index": {"_id": content['name']}}) + b'\n'
+                     + jsoncodec.dumpb(elastic_obj) + b'\n')
 
 
 def parse_args():
@@ -55,6 +58,7 @@ def parse_args():
     parser.add_argument(
         '--tags', help="comma-separated list of tags", default=[], type=tags)
     parser.add_argument('-n', help="number to select", type=int, default=25)
+    parser.add_argument('--compress', help="compress the output", choices=bulkfile.COMPRESSIONS)
     return parser.parse_args()
 
 
@@ -62,4 +66,4 @@ if __name__ == '__main__':
 
     args = parse_args()
     topic_dir = os.path.join(config.TOPICS_DIR, args.topic, 'output/mer')
-    select_random(args.topic, topic_dir, args.tags, args.n)
+    select_random(args.topic, topic_dir, args.tags, args.n, args.compress)
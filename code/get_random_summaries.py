@@ -4,11 +4,13 @@ Select random files from each topic and write JSON files, one for each topic.
 
 $ python get_random_summaries.py -n COUNT
 
-The random files are taken from the output/mer directory for each topic. Topics
+The random files are taken from the output/mer directory for each topic, which
+has merged files or a JSON lines store (see mergedstore.py). Topics
 are taken from the config file. Each line is a summary of a document in JSON format,
-containing an identifier, the year, the title, a summary (created from abstract or
-text) and some entities of interest (skipping obscure ones like work-of-art). The -n
-option determines how many summaries to create.
+containing an identifier, the year, the title, a summary (the merged summary or,
+if there is none, one created from abstract and text with summarize.py) and some
+entities of interest (skipping obscure ones like work-of-art). The -n option
+determines how many summaries to create.
 
 Output is written to files out/random-mer-TOPIC-NUMBER.json
 
@@ -16,8 +18,8 @@ This is just meant for eye-balling the data.
 
 """
 
-import os, sys, json, random, argparse
-import utils
+import os, sys, random, argparse
+import utils, jsoncodec, mergedstore, summarize
 import config
 
 
@@ -30,24 +32,29 @@ ENTITY_TYPES = ('PERSON', 'GPE', 'ORG', 'LOC', 'FAC')
 
 def select_random(topic: str, topic_dir: str, limit: int):
     print(f'Selecting {limit} summaries from {topic}')
-    files = os.listdir(topic_dir)
-    random.shuffle(files)
-    with open(f'out/random-mer-{topic}-{limit:04d}.json', 'w') as fh:
-        for fname in files[:limit]:
-            #print('   ', fname)
-            content = json.loads(open(os.path.join(topic_dir, fname)).read())
+    store = mergedstore.open_merged(topic_dir)
+    names = list(store.names())
+    random.shuffle(names)
+    with open(f'out/random-mer-{topic}-{limit:04d}.json', 'w', encoding='utf8') as fh:
+        for name in names[:limit]:
+            #print('   ', name)
+            content = store.get(name)
             content_summary = {
                 'id': content['name'],
                 'year': content['year'],
                 'title': content['title'],
                 'summary': get_summary(content),
                 'entities': get_entities(content) }
-            fh.write(f'{json.dumps(content_summary)}\n')
+            fh.write(f'{jsoncodec.dumps(content_summary)}\n')
 
 
 def get_summary(content: dict):
-    summary = content['abstract'] or content['content']
-    return ' '.join(summary.split()[:2000])
+    """Returns the summary from merging, or if there is none a summary created from
+    the abstract and content, see summarize.py."""
+    if content.get('summary'):
+        return summarize.truncate(content['summary'], config.SUMMARY_MAX_TOKENS)
+    sentences = summarize.text_sentences([content['content']])
+    return summarize.summarize(content['abstract'], sentences, config.SUMMARY_MAX_TOKENS)
 
 
 def get_entities(content):
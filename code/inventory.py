@@ -0,0 +1,77 @@
+"""Inventory of processing layers
+
+Each processing layer is a directory with a file for each document, where file
+names start with the xDD identifier followed by a suffix that depends on the
+layer, for example 54b4324ee138239d8684aeb2_input.pdf.json for ScienceParse and
+54b4324ee138239d8684aeb2.txt for summaries. Instead of guessing the name of the
+file in each layer and checking whether it exists, scripts scan each directory
+once and join the layers on the identifier.
+
+An inventory is a dictionary with for each layer a dictionary from identifiers to
+paths. The coverage report lists for each document the layers it is missing.
+
+"""
+
+import os
+from collections import Counter
+
+
+def scan_layer(directory: str, suffix: str):
+    """Returns a dictionary from identifiers to paths for the files in the directory
+    that end in the suffix."""
+    layer = {}
+    if directory is None:
+        return layer
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith(suffix) and not entry.name.startswith('.') \
+                    and entry.is_file():
+                layer[entry.name[:-len(suffix)]] = entry.path
+    return layer
+
+
+def build(layers: dict):
+    """Takes a dictionary from layer names to pairs of a directory and a suffix and
+    returns the inventory. Layers without a directory are empty."""
+    return {name: scan_layer(directory, suffix)
+            for name, (directory, suffix) in layers.items()}
+
+
+def paths(inventory: dict, identifier: str):
+    """Returns a dictionary with the path of the document in each layer, paths are
+    None for layers that do not have the document."""
+    return {name: layer.get(identifier) for name, layer in inventory.items()}
+
+
+def missing_layers(inventory: dict, identifiers: list):
+    """Returns a dictionary from identifiers to the layers they are missing, only
+    identifiers that miss a layer are included."""
+    missing = {}
+    for identifier in identifiers:
+        names = [name for name, layer in inventory.items() if identifier not in layer]
+        if names:
+            missing[identifier] = names
+    return missing
+
+
+def write_coverage(fname: str, inventory: dict, identifiers: list):
+    """Write a coverage report for the identifiers, with the number of documents in
+    each layer and for each document that is missing a layer the names of the
+    missing layers. Returns the counts of missing documents for each layer."""
+    missing = missing_layers(inventory, identifiers)
+    counts = Counter(name for names in missing.values() for name in names)
+    with open(fname, 'w') as fh:
+        fh.write(f'# DOCUMENTS  =  {len(identifiers)}\n')
+        for name in inventory:
+            fh.write(f'# {name.upper():10} =  {len(identifiers) - counts[name]}\n')
+        fh.write('\n')
+        for identifier in sorted(missing):
+            fh.write(f'{identifier}\t{" ".join(missing[identifier])}\n')
+    return counts
+
+
+def print_coverage(inventory: dict, identifiers: list, counts: Counter, fname: str):
+    print(f'\nCoverage of {len(identifiers)} documents, see {fname}\n')
+    for name in inventory:
+        print(f'    {name:6} {len(identifiers) - counts[name]:7d}  (missing {counts[name]})')
+    print()
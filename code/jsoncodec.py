@@ -0,0 +1,146 @@
+"""Reading and writing JSON
+
+All stages encode and decode JSON through this module, which uses orjson or ujson
+when one of them is installed and the json module from the standard library if
+not. The backend can be set with JSON_CODEC in the config file, by default the
+fastest one available is used, and can be changed at runtime with use().
+
+There are two output modes, compact (no whitespace, as used for the lines in the
+bulk files and merged stores) and pretty (an indent of 2, as used for the merged
+files and the NER output). Non-ASCII characters are written as UTF-8 instead of
+being escaped, for all backends, so text is returned as a string from dumps() and
+as UTF-8 bytes from dumpb().
+
+The output of the backends is not always the same. Strings, integers and the layout
+are, but floats with an exponent are written differently, for example json writes
+1e-05 and 1e+16 where orjson writes 0.00001 and 1e16. Merged documents and bulk
+files have floats (the scores of the terms), so merge.py and prepare_elastic.py add
+the backend to the settings in their manifests (see manifest.py). Changing the
+backend makes all their documents stale once and output of different backends is
+not mixed. The NER output has no floats and does not depend on the backend.
+
+    loads(text)            decode a string or bytes
+    load(fname)            decode the contents of a file
+    dumps(obj, pretty)     encode as a string
+    dumpb(obj, pretty)     encode as UTF-8 bytes
+    dump(obj, fname, pretty)  encode and write to a file, returns the number of bytes
+
+To compare the backends on merged documents run "python benchmark.py codec".
+
+"""
+
+import json
+import config
+
+
+# backends in order of preference
+BACKENDS = ('orjson', 'ujson', 'json')
+
+
+class StdlibCodec:
+
+    name = 'json'
+
+    def loads(self, text):
+        return json.loads(text)
+
+    def dumps(self, obj, pretty: bool = False):
+        if pretty:
+            return json.dumps(obj, indent=2, ensure_ascii=False)
+        return json.dumps(obj, separators=(',', ':'), ensure_ascii=False)
+
+    def dumpb(self, obj, pretty: bool = False):
+        return self.dumps(obj, pretty).encode('utf8')
+
+
+class UjsonCodec(StdlibCodec):
+
+    name = 'ujson'
+
+    def __init__(self):
+        import ujson
+        self.ujson = ujson
+
+    def loads(self, text):
+        return self.ujson.loads(text)
+
+    def dumps(self, obj, pretty: bool = False):
+        if pretty:
+            return self.ujson.dumps(obj, indent=2, ensure_ascii=False, escape_forward_slashes=False)
+        return self.ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+
+
+class OrjsonCodec(StdlibCodec):
+
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self.orjson = orjson
+
+    def loads(self, text):
+        return self.orjson.loads(text)
+
+    def dumps(self, obj, pretty: bool = False):
+        return self.dumpb(obj, pretty).decode('utf8')
+
+    def dumpb(self, obj, pretty: bool = False):
+        if pretty:
+            return self.orjson.dumps(obj, option=self.orjson.OPT_INDENT_2)
+        return self.orjson.dumps(obj)
+
+
+CODECS = { 'orjson': OrjsonCodec, 'ujson': UjsonCodec, 'json': StdlibCodec }
+
+
+def available():
+    """Returns the names of the backends that are installed, in order of preference."""
+    names = []
+    for name in BACKENDS:
+        try:
+            CODECS[name]()
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def use(name: str = None):
+    """Use the named backend, or the best available backend if name is None. Raises
+    an ImportError if the backend is not installed."""
+    global CODEC
+    if name is None:
+        name = available()[0]
+    if name not in CODECS:
+        raise ValueError(f'unknown JSON backend: {name}')
+    CODEC = CODECS[name]()
+    return CODEC
+
+
+def backend():
+    return CODEC.name
+
+
+def loads(text):
+    return CODEC.loads(text)
+
+
+def load(fname: str):
+    with open(fname, 'rb') as fh:
+        return CODEC.loads(fh.read())
+
+
+def dumps(obj, pretty: bool = False):
+    return CODEC.dumps(obj, pretty)
+
+
+def dumpb(obj, pretty: bool = False):
+    return CODEC.dumpb(obj, pretty)
+
+
+def dump(obj, fname: str, pretty: bool = False):
+    with open(fname, 'wb') as fh:
+        return fh.write(CODEC.dumpb(obj, pretty))
+
+
+CODEC = use(config.JSON_CODEC)
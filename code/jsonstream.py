@@ -0,0 +1,238 @@
+"""Reading parts of large JSON files
+
+The files from ScienceParse and the document structure parser can be large while
+the processing stages only use a few fields from them. This module reads a JSON
+file incrementally and only decodes the values that were asked for. Other values
+are skipped by scanning for the characters that delimit strings, objects and
+arrays, without building Python objects for them, and reading stops as soon as
+everything that was asked for has been found.
+
+What to read is given by a specification, which is a dictionary with keys of the
+top-level object. The values in the specification are:
+
+True      - decode the value
+dict      - the value is an object, read it using this dictionary as the
+            specification
+function  - the value is an array, decode its elements one at a time and hand
+            each to the function, which returns False when no more elements
+            are wanted (the element handed in is then not included)
+
+Example, taking the title and year from the metadata in a ScienceParse file:
+
+>>> load('54b4324ee138239d8684aeb2_input.pdf.json', {'metadata': {'title': True, 'year': True}})
+{'metadata': {'title': 'Nanomechanical properties of modern and fossil bone', 'year': 2010}}
+
+Keys that are not in the file are not in the result.
+
+"""
+
+import re, time
+import jsoncodec
+
+
+# read files in chunks of this many characters
+CHUNK_SIZE = 1 << 16
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+STRUCTURE = re.compile(r'["\[\]{}]')
+LITERAL = re.compile(r'[^,\]}\s]*')
+
+
+class Done(Exception):
+    """Raised when everything in the specification was read."""
+
+
+class Scanner:
+
+    """Scans a JSON text from a file handle, with a buffer that only keeps what is
+    still needed. The mark is the start of a value that is going to be decoded and
+    everything from the mark onwards is kept in the buffer. Counts the characters
+    read, the characters handed to the JSON decoder and the time spent decoding."""
+
+    def __init__(self, fh):
+        self.fh = fh
+        self.buffer = ''
+        self.pos = 0
+        self.mark = None
+        self.chars_read = 0
+        self.chars_decoded = 0
+        self.decode_time = 0.0
+
+    def fill(self):
+        chunk = self.fh.read(CHUNK_SIZE)
+        if not chunk:
+            raise ValueError('unexpected end of JSON data')
+        self.chars_read += len(chunk)
+        keep = self.pos if self.mark is None else self.mark
+        self.buffer = self.buffer[keep:] + chunk
+        self.pos -= keep
+        if self.mark is not None:
+            self.mark = 0
+
+    def peek(self):
+        """Skip whitespace and return the next character."""
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            self.fill()
+
+    def expect(self, character: str):
+        if self.peek() != character:
+            raise ValueError(f'expected {character!r} at character {self.chars_read}')
+        self.pos += 1
+
+    def skip_string(self):
+        """Skip a string, using find() to get to the next quote, which is a lot
+        faster than a regular expression on long strings, and then checking
+        whether the quote was escaped."""
+        self.pos += 1
+        while True:
+            end = self.buffer.find('"', self.pos)
+            if end == -1:
+                # keep trailing backslashes so escapes can be checked later
+                start = self.pos
+                self.pos = len(self.buffer)
+                while self.pos > start and self.buffer[self.pos-1] == '\\':
+                    self.pos -= 1
+                self.fill()
+                continue
+            backslashes = 0
+            while end - backslashes > self.pos and self.buffer[end-backslashes-1] == '\\':
+                backslashes += 1
+            self.pos = end + 1
+            if backslashes % 2 == 0:
+                return
+
+    def skip_value(self):
+        character = self.peek()
+        if character == '"':
+            self.skip_string()
+        elif character in '[{':
+            depth = 0
+            while True:
+                match = STRUCTURE.search(self.buffer, self.pos)
+                if match is None:
+                    self.pos = len(self.buffer)
+                    self.fill()
+                    continue
+                self.pos = match.start()
+                character = match.group()
+                if character == '"':
+                    self.skip_string()
+                    continue
+                self.pos += 1
+                depth += 1 if character in '[{' else -1
+                if depth == 0:
+                    return
+        else:
+            while True:
+                self.pos = LITERAL.match(self.buffer, self.pos).end()
+                if self.pos < len(self.buffer):
+                    return
+                self.fill()
+
+    def decode_value(self):
+        self.peek()
+        self.mark = self.pos
+        self.skip_value()
+        text = self.buffer[self.mark:self.pos]
+        self.mark = None
+        self.chars_decoded += len(text)
+        t0 = time.perf_counter()
+        value = jsoncodec.loads(text)
+        self.decode_time += time.perf_counter() - t0
+        return value
+
+    def object_keys(self):
+        """Generate the keys of an object, the caller has to read or skip the value
+        for each key before asking for the next one."""
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.decode_value()
+            self.expect(':')
+            yield key
+            if self.peek() == ',':
+                self.pos += 1
+            else:
+                self.expect('}')
+                return
+
+    def array_elements(self):
+        """Generate once for each element of an array, the caller has to read or
+        skip the element each time."""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield
+            if self.peek() == ',':
+                self.pos += 1
+            else:
+                self.expect(']')
+                return
+
+
+def load(fname: str, spec: dict, stats: dict = None):
+    """Read the parts of the JSON object in the file that are in the specification.
+    If a dictionary is handed in as stats, the number of characters read from the
+    file, the number of characters decoded and the time spent decoding are added
+    to it."""
+    result = {}
+    with open(fname, encoding='utf8', newline='') as fh:
+        scanner = Scanner(fh)
+        try:
+            read_object(scanner, spec, result, True)
+        except Done:
+            pass
+    if stats is not None:
+        stats['read'] = stats.get('read', 0) + scanner.chars_read
+        stats['decoded'] = stats.get('decoded', 0) + scanner.chars_decoded
+        stats['decode_time'] = stats.get('decode_time', 0.0) + scanner.decode_time
+    return result
+
+
+def read_object(scanner: Scanner, spec: dict, result: dict, last: bool):
+    """Read an object into result. If last is True nothing is needed after this
+    object so reading stops when all keys in the specification were found."""
+    remaining = set(spec)
+    if last and not remaining:
+        raise Done()
+    for key in scanner.object_keys():
+        if key not in remaining:
+            scanner.skip_value()
+            continue
+        remaining.discard(key)
+        wanted = spec[key]
+        done = last and not remaining
+        if isinstance(wanted, dict) and scanner.peek() == '{':
+            result[key] = {}
+            read_object(scanner, wanted, result[key], done)
+        elif callable(wanted) and scanner.peek() == '[':
+            result[key] = []
+            read_array(scanner, wanted, result[key], done)
+        else:
+            result[key] = scanner.decode_value()
+        if done:
+            raise Done()
+
+
+def read_array(scanner: Scanner, take, result: list, last: bool):
+    """Read array elements into result while the take function accepts them. If
+    last is True reading stops at the first element that is not taken."""
+    taking = True
+    for _ in scanner.array_elements():
+        if not taking:
+            scanner.skip_value()
+            continue
+        element = scanner.decode_value()
+        if take(element):
+            result.append(element)
+        else:
+            taking = False
+            if last:
+                raise Done()
@@ -15,10 +15,19 @@ curl http://localhost:9200/xdd-bio/_doc/_bulk \
     -H "Content-Type: application/json" \
     -X POST --data-binary @elastic-biomedical.json
 
+For a file compressed with gzip (FILE.json.gz) the command adds a Content-Encoding
+header, so the compressed file is sent and ElasticSearch decompresses it. A file
+compressed with zstd (FILE.json.zst) is decompressed with the zstd tool and piped
+into curl, since ElasticSearch does not accept zstd encoded requests.
+
+These post the whole file in one request, for large files use bulkload.py, which
+sends the file in chunks and retries requests that ElasticSearch rejects.
+
 '''
 
 
 import os, sys, getopt
+import bulkfile
 from config import TOPICS_DIR
 
 ELASTIC_HOST = 'localhost'
@@ -47,6 +56,11 @@ def build_command(db_index: str, input_file: str, messages: bool):
     url = f'http://{ELASTIC_HOST}:{ELASTIC_PORT}/{db_index}/_doc/_bulk'
     dev_null = '' if messages else '-o /dev/null'
     headers = '-H "Content-Type: application/json"'
+    compress = bulkfile.compression(input_file)
+    if compress == 'gzip':
+        headers += ' -H "Content-Encoding: gzip"'
+    if compress == 'zstd':
+        return f'zstd -dc {input_file} | curl {url} {dev_null} {headers} -X POST --data-binary @-'
     data = f'--data-binary @{input_file}'
     return f'curl {url} {dev_null} {headers} -X POST {data}'
 
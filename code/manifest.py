@@ -0,0 +1,142 @@
+"""Manifests for incremental processing
+
+A manifest records for each document processed by a stage a hash of the content
+of its inputs and a hash of the settings of the stage (like MAX_SIZE, the entity
+types and the spaCy model). On a rerun a document only needs to be processed
+again if its outputs are missing or if its inputs or the settings changed.
+
+The settings of each stage include the VERSION constant of its script, which is
+increased when a change to the code changes the output, since the manifest does
+not notice code changes otherwise.
+
+Manifests are JSON files written next to the output directory of a stage, so for
+output/ner the manifest is output/ner.manifest.json, with a shard suffix added
+for sharded runs. They are not written inside the output directory because later
+stages read all files in that directory.
+
+Each stage has a --status option that prints a report of which documents are
+up to date, which are stale and which are missing, without processing anything.
+
+"""
+
+import os, json, hashlib
+import utils
+
+
+# read files in blocks of this size when hashing
+BLOCK_SIZE = 1 << 20
+
+# how many updates are collected before the manifest is saved
+SAVE_INTERVAL = 100
+
+UP_TO_DATE = 'up-to-date'
+STALE = 'stale'
+MISSING = 'missing'
+
+
+def manifest_file(out_dir: str, shard: tuple = None):
+    """Returns the name of the manifest file for an output directory."""
+    return os.path.normpath(out_dir) + f'.manifest{utils.shard_suffix(shard)}.json'
+
+
+def file_hash(*fnames: str):
+    """Returns a hash of the contents of the files, a file that does not exist
+    hashes differently from an empty file. A file name can be None for a file that
+    is known not to exist."""
+    digest = hashlib.sha1()
+    for fname in fnames:
+        if fname is None:
+            digest.update(b'none\0')
+            continue
+        try:
+            with open(fname, 'rb') as fh:
+                digest.update(b'file\0')
+                for block in iter(lambda: fh.read(BLOCK_SIZE), b''):
+                    digest.update(block)
+        except FileNotFoundError:
+            digest.update(b'none\0')
+    return digest.hexdigest()
+
+
+def data_hash(obj):
+    """Returns a hash of a JSON-serializable object."""
+    data = json.dumps(obj, sort_keys=True, default=sorted)
+    return hashlib.sha1(data.encode('utf8')).hexdigest()
+
+
+class Manifest:
+
+    """The manifest for a stage, with settings and a dictionary of input hashes
+    indexed on document name. Use is_current() to check whether a document needs
+    to be processed and update() after it was processed. Updates are saved every
+    SAVE_INTERVAL documents and when save() is called."""
+
+    def __init__(self, fname: str, stage: str, settings: dict):
+        self.fname = fname
+        self.stage = stage
+        self.settings = settings
+        self.settings_hash = data_hash(settings)
+        self.documents = {}
+        self.updates = 0
+        if os.path.exists(fname):
+            with open(fname) as fh:
+                json_obj = json.load(fh)
+            if json_obj.get('stage') == stage:
+                self.documents = json_obj.get('documents', {})
+
+    def is_current(self, doc: str, input_hash: str):
+        """Returns True if the document was processed with the same inputs and the
+        same settings."""
+        entry = self.documents.get(doc)
+        return (entry is not None
+                and entry['inputs'] == input_hash
+                and entry['settings'] == self.settings_hash)
+
+    def update(self, doc: str, input_hash: str, output: bool = True):
+        """Record that the document was processed. Use output=False when the stage
+        deliberately did not create output, for example when merge.py rejects a
+        document, so that it does not show up as missing."""
+        self.documents[doc] = { 'inputs': input_hash, 'settings': self.settings_hash }
+        if not output:
+            self.documents[doc]['output'] = False
+        self.updates += 1
+        if self.updates % SAVE_INTERVAL == 0:
+            self.save()
+
+    def remove(self, doc: str):
+        self.documents.pop(doc, None)
+
+    def save(self):
+        json_obj = {
+            'stage': self.stage,
+            'settings': self.settings,
+            'documents': self.documents }
+        os.makedirs(os.path.dirname(os.path.abspath(self.fname)), exist_ok=True)
+        tmp_fname = self.fname + '.tmp'
+        with open(tmp_fname, 'w') as fh:
+            json.dump(json_obj, fh, indent=2, default=sorted)
+        os.replace(tmp_fname, self.fname)
+
+    def status(self, doc: str, input_hash: str, output_exists: bool):
+        if not self.documents.get(doc, {}).get('output', True):
+            output_exists = True
+        if not output_exists:
+            return MISSING
+        return UP_TO_DATE if self.is_current(doc, input_hash) else STALE
+
+
+def print_status(stage: str, statuses: dict, verbose: bool = True):
+    """Print a report from a dictionary of document names and statuses."""
+    groups = { UP_TO_DATE: [], STALE: [], MISSING: [] }
+    for doc, status in sorted(statuses.items()):
+        groups[status].append(doc)
+    print(f'\nStatus of {stage} for {len(statuses)} documents\n')
+    for status in (UP_TO_DATE, STALE, MISSING):
+        print(f'    {status:12} {len(groups[status]):7d}')
+    if verbose:
+        for status in (STALE, MISSING):
+            if groups[status]:
+                print(f'\n{status}:\n')
+                for doc in groups[status]:
+                    print(f'    {doc}')
+    print()
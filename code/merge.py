@@ -14,59 +14,406 @@ $ python merge.py \
       --scpa $DIR/scienceparse --doc $DIR/output/doc --ner $DIR/output/ner \
       --trm $DIR/output/trm --meta $DIR/metadata.json --out $DIR/output/mer
 
+Merging is incremental, a manifest next to the output directory records a hash of
+all inputs of each document (see manifest.py) and only documents with changed inputs
+are merged again, unless --overwrite is used. With --status a report on what is
+up to date is printed.
+
+Besides the log with failures, the time spent reading, decoding, merging and writing
+each document is written to a metrics file in the logs directory (see metrics.py).
+
+To split the work over several machines use --shard I/N, which makes the script
+process only the documents that belong to shard I of N (see utils.shard_index()).
+
+The metadata file is used through an index (see metaindex.py), which is created
+when it does not exist yet and looked up for each document instead of loading the
+whole file. Terms are read in the same way from a term store, which is created from
+frequencies.json in the term directory (see termstore.py).
+
+The layer directories are scanned once at the start and joined on the xDD identifier
+(see inventory.py). A coverage report with the documents that are missing layers is
+written to the logs directory before any documents are merged. Documents without
+a summary get an empty summary. Summaries are created by summarize.py and cut off
+at SUMMARY_MAX_TOKENS tokens (see config.py).
+
+Documents without a title, year or authors in the ScienceParse metadata are rejected.
+This is checked before the other layers are hashed for the manifest or loaded, and
+the log and the terminal get a report with the number of rejected documents for
+each reason.
+
+With --out-format jsonl the merged documents are not written as separate files but
+as compact JSON lines in a store of files of about --part-size Mb with an index (see
+mergedstore.py). Downstream scripts read both formats.
+
+With --elastic DIR each merged document is also turned into a pair of bulk lines
+for ElasticSearch, which are written to DIR/elastic.json as by prepare_elastic.py,
+without writing and reading back the merged document. The --tags option is used
+as with prepare_elastic.py. In this mode --out is optional, without it no merged
+documents are written and the manifest is DIR/merge-elastic.manifest.json, which
+is separate from the manifest that prepare_elastic.py keeps next to the bulk file. Lines of
+documents that are up to date are copied from the previous bulk file.
+
+With --workers N documents are merged by N processes. The terms and the metadata
+are loaded once and shared with the forked workers copy-on-write. Results are
+collected in document order so the log and the merged files are the same as for
+a sequential run.
+
 """
 
-import os, sys, json, argparse
-from collections import Counter
+import os, sys, argparse
+import utils, inventory, manifest, mergedstore, metaindex, metrics, jsonstream, termstore
+import jsoncodec, prepare_elastic, summarize
+from collections import Counter, namedtuple
 from io import StringIO
 from tqdm import tqdm
-from utils import timestamp
-from config import TOPICS_DIR, TOPICS, abbreviate_topic, ENTITY_TYPES
+from utils import timestamp, select_shard, shard_suffix
+from config import TOPICS_DIR, TOPICS, abbreviate_topic, ENTITY_TYPES, MERGED_FIELDS
+from config import SUMMARY_MAX_TOKENS
+
+# Version of the merged output, which is part of the manifest settings. Increase it
+# when a code change changes the output, so that all documents become stale.
+VERSION = 1
 
 # A limit on how much data we want to put in the abstract and text fields for each
 # document, now this is set to the same number as for spaCy processing.
 MAX_SIZE = 25000
 
-# In addition, we enter a summary, with just the data that will be returned from the
-# database. Any processing for ranking will be done using just these data. Setting it
-# higher will make ranking better but increase the size of the datastrucutres handed
-# from the database.
-SUMMARY_MAX_TOKENS = 2000
+# The fields needed from ScienceParse files, see jsonstream.py.
+SCIENCEPARSE_SPEC = {'metadata': {'title': True, 'year': True, 'authors': True}}
+
+# The processing layers that are merged, with the suffix that follows the xDD
+# identifier in the file names of each layer, see inventory.py.
+LAYERS = { 'scpa': '_input.pdf.json', 'doc': '.json', 'ner': '.json', 'sum': '.txt' }
+
+# Number of documents handed to a worker process at once.
+WORKER_CHUNK_SIZE = 8
+
+# Base name of the manifest in the elastic directory when there is no output
+# directory, see merge_manifest_file().
+MERGE_ELASTIC = 'merge-elastic'
+
+# The terms, the metadata, the inventory and the output directory used by
+# merge_doc(), which are set by merge_directory() before worker processes are
+# forked.
+SHARED = {}
+
+# Fields from the ScienceParse metadata that must have a value, documents without
+# them are rejected.
+REQUIRED_FIELDS = ('title', 'year', 'authors')
+
+# What merge_doc() hands back to merge_directory(). The output field is False if
+# no merged file was written, the message is what goes into the log, the error
+# is set when merging raised an exception and the rejection is set to the reason
+# when the document was rejected. For the jsonl output format the data has the
+# line that is written to the store and with a bulk file the bulk has the lines
+# that are written to it.
+MergeResult = namedtuple(
+    'MergeResult',
+    ['doc', 'output', 'message', 'error', 'times', 'bytes_in', 'bytes_out', 'rejection',
+     'data', 'bulk'],
+    defaults=[None, None, None])
 
 
 def merge_directory(
         scpa_dir: str, meta_file: str, doc_dir: str, ner_dir: str, trm_dir: str,
-        sum_dir: str, out_dir: str, limit: int):
-    os.makedirs(out_dir, exist_ok=True)
-    terms_file = os.path.join(trm_dir, 'frequencies.json')
-    terms = json.loads(open(terms_file).read())
-    meta = load_metadata(meta_file)
-    docs = os.listdir(doc_dir)
-    with open(f'logs/merger-{timestamp()}.log', 'w') as log:
-        for doc in tqdm(sorted(docs)[:limit]):
-            # scienceparse file format:  54b4324ee138239d8684aeb2_input.pdf.json
-            # processed_doc file format: 54b4324ee138239d8684aeb2.json
-            # processed_ner file format: 54b4324ee138239d8684aeb2.json
-            scp_obj = load_json(scpa_dir, doc[:-5] + '_input.pdf.json')
-            doc_obj = load_json(doc_dir, doc)
-            ner_obj = load_json(ner_dir, doc)
-            summary = get_summary(sum_dir, doc)
-            if 'entities' in ner_obj:
-                ner_obj['entities'] = sanitize_entities(ner_obj['entities'])
-            identifier = os.path.splitext(doc)[0]
-            trm_obj = terms.get(identifier, [])
-            try:
-                merged_obj = merge(doc, scp_obj, doc_obj, ner_obj, trm_obj, summary, meta)
-                if valid_merger(merged_obj):
-                    with open(os.path.join(out_dir, doc), 'w') as fh:
-                        json.dump(merged_obj, fh, indent=2)
-                else:
-                    log.write(f'{doc} -- object from merger was not complete\n')
-                    #with open(os.path.join(out_dir, doc), 'w') as fh:
-                    #    json.dump(merged_obj, fh, indent=2)
-            except Exception as e:
-                exception_type = type(e).__name__
-                log.write(f'{doc} -- {exception_type} - {e}\n')
+        sum_dir: str, out_dir: str, limit: int, shard: tuple = None,
+        overwrite: bool = False, status: bool = False, workers: int = 1,
+        out_format: str = mergedstore.FILES, part_size: int = mergedstore.PART_SIZE,
+        elastic_dir: str = None, tags: list = None):
+    """Merge all documents in doc_dir with the other layers and write the results to
+    out_dir and/or, if elastic_dir is given, to a bulk file in elastic_dir. Unless
+    overwrite is set, documents are skipped if according to the manifest none of
+    their inputs changed since the last run. With status set only a report on this
+    is printed. With more than one worker documents are merged in a pool of worker
+    processes. Before anything else the layer directories are scanned and a report
+    is written on which documents are missing which layers. With the jsonl output
+    format the documents are written to a store of JSON lines files in out_dir, see
+    mergedstore.py. Without out_dir there must be an elastic_dir and no merged
+    documents are written."""
+    if out_dir is None and elastic_dir is None:
+        sys.exit('merge.py: an output directory or an elastic directory is required')
+    tags = [] if tags is None else tags
+    directories = { 'scpa': scpa_dir, 'doc': doc_dir, 'ner': ner_dir, 'sum': sum_dir }
+    layers = inventory.build({name: (directories[name], suffix)
+                              for name, suffix in LAYERS.items() if directories[name]})
+    docs = select_shard(sorted(identifier + LAYERS['doc'] for identifier in layers['doc']),
+                        shard)[:limit]
+    coverage_fname = f'logs/coverage-merge-{timestamp()}{shard_suffix(shard)}.txt'
+    identifiers = [get_name(doc) for doc in docs]
+    counts = inventory.write_coverage(coverage_fname, layers, identifiers)
+    inventory.print_coverage(layers, identifiers, counts, coverage_fname)
+    terms = termstore.open_store(trm_dir)
+    meta = metaindex.open_index(meta_file)
+    elastic_fname = None
+    bulk_index = {}
+    if elastic_dir is not None:
+        elastic_fname = os.path.join(elastic_dir, prepare_elastic.elastic_file(shard))
+        bulk_index = prepare_elastic.index_bulk_file(elastic_fname)
+    mer_manifest = manifest.Manifest(
+        merge_manifest_file(out_dir, elastic_dir, shard), 'merge',
+        manifest_settings(tags if elastic_dir is not None else None))
+    # the ScienceParse metadata are checked first, so that the other layers are only
+    # read, for the hash and for merging, for documents that are not rejected, a
+    # ScienceParse file that cannot be read is an error for just that document
+    scienceparse = {doc: read_scienceparse(layers, doc) for doc in docs}
+    hashes = {doc: input_hash(inventory.paths(layers, get_name(doc)), doc, terms, meta,
+                              scienceparse[doc][2] is not None
+                              or rejection_reason(scienceparse[doc][0]) is not None)
+              for doc in docs}
+    previous = None
+    if out_dir is not None and out_format == mergedstore.JSONL:
+        prefix = mergedstore.store_prefix(shard_suffix(shard))
+        previous = mergedstore.MergedStore(out_dir, prefix)
+    statuses = {
+        doc: mer_manifest.status(
+            doc, hashes[doc],
+            output_exists(out_dir, doc, previous)
+            and (elastic_fname is None or get_name(doc) in bulk_index))
+        for doc in docs }
+    if status:
+        manifest.print_status('merge.py', statuses)
+        return
+    selected = docs
+    if not overwrite:
+        docs = [doc for doc in docs if statuses[doc] != manifest.UP_TO_DATE]
+    store = None
+    if out_dir is not None:
+        os.makedirs(out_dir, exist_ok=True)
+        if out_format == mergedstore.JSONL:
+            store = mergedstore.StoreWriter(out_dir, prefix, part_size)
+    if elastic_dir is not None:
+        os.makedirs(elastic_dir, exist_ok=True)
+        print(f'Creating elastic bulk file {elastic_fname}')
+    # set before the pool is created so forked workers share these copy-on-write
+    SHARED.update(terms=terms, meta=meta, layers=layers, out_dir=out_dir, out_format=out_format,
+                  elastic=elastic_dir is not None, tags=tags, scienceparse=scienceparse)
+    metrics_fname = metrics.metrics_file('merge', shard_suffix(shard))
+    with open(f'logs/merger-{timestamp()}{shard_suffix(shard)}.log', 'w') as log, \
+            metrics.MetricsFile(metrics_fname, 'merge') as doc_metrics, \
+            BulkWriter(elastic_fname, bulk_index) as bulk:
+        # results come back in the order of docs, so the log, the metrics and the
+        # manifest are written in the same order as in a sequential run
+        rejections = Counter()
+        results = utils.map_docs(merge_doc, docs, workers, WORKER_CHUNK_SIZE)
+        to_merge = set(docs)
+        for doc in tqdm(selected):
+            if doc not in to_merge:
+                # a store and a bulk file are written completely, so unchanged
+                # documents are copied
+                if store is not None and get_name(doc) in previous:
+                    store.write(get_name(doc), previous.read_bytes(get_name(doc)))
+                bulk.copy(get_name(doc))
+                continue
+            result = next(results)
+            if result.data is not None:
+                result = result._replace(
+                    bytes_out=result.bytes_out + store.write(get_name(doc), result.data))
+            if result.bulk is not None:
+                bulk.write(result.bulk)
+            if result.rejection is not None:
+                rejections[result.rejection] += 1
+            if result.error is None:
+                mer_manifest.update(doc, hashes[doc], output=result.output)
+            if result.message is not None:
+                log.write(f'{doc} -- {result.message}\n')
+            doc_metrics.record(
+                doc, result.times, result.bytes_in, result.bytes_out, result.error)
+        write_rejections(log, rejections, len(docs))
+    if store is not None:
+        # keep documents outside of the selection, like files in the files format
+        names = {get_name(doc) for doc in selected}
+        for name in previous.names():
+            if name not in names:
+                store.write(name, previous.read_bytes(name))
+        previous.close()
+        store.close()
+    mer_manifest.save()
+    if elastic_dir is not None:
+        print(f'Copied {bulk.reused} unchanged documents from the previous bulk file')
+
+
+class BulkWriter:
+
+    """Writes the bulk lines of documents to a temporary file that replaces the bulk
+    file when the writer is closed, lines of unchanged documents are copied from the
+    previous bulk file using its index (see prepare_elastic.index_bulk_file()). With
+    no file name nothing is written."""
+
+    def __init__(self, elastic_fname: str, index: dict):
+        self.elastic_fname = elastic_fname
+        self.index = index
+        self.reused = 0
+
+    def __enter__(self):
+        if self.elastic_fname is not None:
+            self.fh = open(self.elastic_fname + '.tmp', 'w', encoding='utf8')
+            self.old = prepare_elastic.open_previous(self.elastic_fname, self.index)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.elastic_fname is None:
+            return
+        self.old.close()
+        self.fh.write('\n')
+        self.fh.close()
+        if exc_type is None:
+            os.replace(self.elastic_fname + '.tmp', self.elastic_fname)
+
+    def write(self, data: str):
+        self.fh.write(data)
+
+    def copy(self, name: str):
+        if self.elastic_fname is None or name not in self.index:
+            return
+        offset, length = self.index[name]
+        self.old.seek(offset)
+        self.fh.write(self.old.read(length).decode('utf8'))
+        self.reused += 1
+
+
+def output_exists(out_dir: str, doc: str, store: mergedstore.MergedStore = None):
+    if out_dir is None:
+        return True
+    if store is not None:
+        return get_name(doc) in store
+    return os.path.exists(os.path.join(out_dir, doc))
+
+
+def merge_doc(doc: str):
+    """Merge the layers for one document and write the result to the output directory,
+    using the terms, metadata, inventory and output directory in SHARED. Returns a
+    MergeResult, which has the bulk lines of the document if there is a bulk file. This
+    runs in the worker processes when there is more than one worker. The required
+    metadata are checked first, so that the other layers are not loaded for documents
+    that are rejected. The metadata are taken from SHARED if merge_directory() read
+    them already."""
+    # scienceparse file format:  54b4324ee138239d8684aeb2_input.pdf.json
+    # processed_doc file format: 54b4324ee138239d8684aeb2.json
+    # processed_ner file format: 54b4324ee138239d8684aeb2.json
+    out_dir = SHARED['out_dir']
+    identifier = get_name(doc)
+    paths = inventory.paths(SHARED['layers'], identifier)
+    bytes_in = metrics.file_size(*input_files(paths)[:1])
+    if doc in SHARED.get('scienceparse', {}):
+        scp_obj, times, error = SHARED['scienceparse'][doc]
+        times = Counter(times)
+    else:
+        scp_obj, times, error = read_scienceparse(SHARED['layers'], doc)
+    if error is not None:
+        return MergeResult(
+            doc, False, f'{type(error).__name__} - {error}', str(error), times, bytes_in, 0)
+    reason = rejection_reason(scp_obj)
+    if reason is not None:
+        # remove output from an earlier run when the input was complete
+        if out_dir is not None and os.path.exists(os.path.join(out_dir, doc)):
+            os.remove(os.path.join(out_dir, doc))
+        return MergeResult(doc, False, f'rejected, {reason}', None, times, bytes_in, 0, reason)
+    bytes_in += metrics.file_size(*input_files(paths)[1:])
+    try:
+        # errors in the layers are returned as well, since an exception raised in
+        # a worker process would end the whole pool
+        doc_obj = load_json(paths['doc'], times)
+        ner_obj = load_json(paths['ner'], times)
+        with metrics.timed(times, 'read'):
+            summary = get_summary(paths.get('sum'))
+        if 'entities' in ner_obj:
+            ner_obj['entities'] = sanitize_entities(ner_obj['entities'])
+        trm_obj = SHARED['terms'].get(identifier, [])
+        with metrics.timed(times, 'merge'):
+            merged_obj = merge(doc, scp_obj, doc_obj, ner_obj, trm_obj, summary, SHARED['meta'])
+        data = None
+        if out_dir is not None:
+            # serialized before the bulk lines are created, which turns the counts
+            # and scores of the terms into strings in place
+            pretty = SHARED.get('out_format') != mergedstore.JSONL
+            with metrics.timed(times, 'serialize'):
+                data = jsoncodec.dumpb(merged_obj, pretty=pretty)
+        bulk = None
+        bytes_out = 0
+        if SHARED.get('elastic'):
+            # written to the bulk file by merge_directory()
+            with metrics.timed(times, 'build'):
+                elastic_obj = utils.create_elastic_object(merged_obj, SHARED['tags'])
+            with metrics.timed(times, 'serialize'):
+                bulk = (jsoncodec.dumps({"index": {"_id": merged_obj['name']}}) + '\n'
+                        + jsoncodec.dumps(elastic_obj) + '\n')
+            bytes_out += len(bulk)
+        if out_dir is None:
+            return MergeResult(doc, True, None, None, times, bytes_in, bytes_out, bulk=bulk)
+        if SHARED.get('out_format') == mergedstore.JSONL:
+            # written to the store by merge_directory()
+            return MergeResult(
+                doc, True, None, None, times, bytes_in, bytes_out, data=data, bulk=bulk)
+        with metrics.timed(times, 'write'):
+            with open(os.path.join(out_dir, doc), 'wb') as fh:
+                bytes_out += fh.write(data)
+        return MergeResult(doc, True, None, None, times, bytes_in, bytes_out, bulk=bulk)
+    except Exception as e:
+        exception_type = type(e).__name__
+        return MergeResult(doc, False, f'{exception_type} - {e}', str(e), times, bytes_in, 0)
+
+
+def rejection_reason(scp_obj: dict):
+    """Returns why a document is rejected, or None if all required metadata fields
+    from ScienceParse have a value."""
+    if not scp_obj.get('metadata'):
+        return 'no ScienceParse metadata'
+    missing = [field for field in REQUIRED_FIELDS if not get_meta(field, scp_obj)]
+    if missing:
+        return 'missing ' + ', '.join(missing)
+    return None
+
+
+def write_rejections(log, rejections: Counter, total: int):
+    """Write a report with the number of rejected documents for each reason to the
+    log and to the terminal."""
+    lines = [f'Rejected {sum(rejections.values())} of {total} documents']
+    for reason, count in rejections.most_common():
+        lines.append(f'    {count:7d}  {reason}')
+    print('\n' + '\n'.join(lines) + '\n')
+    log.write('\n' + ''.join(f'# {line}\n' for line in lines))
+
+
+def merge_manifest_file(out_dir: str, elastic_dir: str, shard: tuple = None):
+    """Returns the name of the manifest, which is next to the output directory or,
+    without one, in the elastic directory. The latter is not the manifest of the bulk
+    file, which belongs to prepare_elastic.py."""
+    if out_dir is not None:
+        return manifest.manifest_file(out_dir, shard)
+    return manifest.manifest_file(os.path.join(elastic_dir, MERGE_ELASTIC), shard)
+
+
+def manifest_settings(tags: list = None):
+    """The settings that determine the merged output for a document. With tags, which
+    are given when a bulk file is written, the settings for the bulk lines are added."""
+    settings = { 'MAX_SIZE': MAX_SIZE, 'ENTITY_TYPES': ENTITY_TYPES,
+                 'SUMMARY_MAX_TOKENS': SUMMARY_MAX_TOKENS, 'JSON_CODEC': jsoncodec.backend(),
+                 'VERSION': VERSION }
+    if tags is not None:
+        # the bulk lines are created as by prepare_elastic.py
+        settings.update(tags=tags, MERGED_FIELDS=MERGED_FIELDS,
+                        ELASTIC_VERSION=prepare_elastic.VERSION)
+    return settings
+
+
+def input_hash(paths: dict, doc: str, terms: termstore.TermStore,
+               meta: metaindex.MetadataIndex, rejected: bool = False):
+    """Returns a hash of all inputs for a document, which are the files from the
+    processing layers, the terms and the metadata record. For a rejected document
+    only the ScienceParse file is used, since the rejection depends on nothing else,
+    so that the other layers are not read."""
+    if rejected:
+        return manifest.file_hash(*input_files(paths)[:1])
+    identifier = get_name(doc)
+    return manifest.data_hash(
+        [manifest.file_hash(*input_files(paths)), terms.get(identifier, []),
+         meta.get(identifier)])
+
+
+def input_files(paths: dict):
+    """Returns the paths of the document in the processing layers, starting with
+    ScienceParse, with None for layers that do not have the document."""
+    return [paths[name] for name in LAYERS if name in paths]
 
 
 def sanitize_entities(ner_obj: dict):
@@ -77,24 +424,69 @@ def sanitize_entities(ner_obj: dict):
     return {k: v for k, v in ner_obj.items() if k in ENTITY_TYPES}
 
 
-def load_json(topic_dir: str, doc: str):
+def load_json(fname: str, times: Counter = None):
     """Return the JSON content of the file, but allow prior processing to not have
-    created the desired file and return an empty dictionary in that case."""
-    fname = os.path.join(topic_dir, doc)
+    created the desired file and return an empty dictionary in that case, where the
+    file name is None if the layer does not have the document. Time spent reading
+    and decoding is added to times."""
+    times = Counter() if times is None else times
+    if fname is None:
+        return {}
     try:
-        with open(fname) as fh:
-            return json.load(fh)
+        with metrics.timed(times, 'read'):
+            with open(fname, 'rb') as fh:
+                text = fh.read()
     except FileNotFoundError:
         return {}
+    with metrics.timed(times, 'decode'):
+        return jsoncodec.loads(text)
 
 
-def get_summary(directory: str, docname: str):
-    with open(os.path.join(directory, docname[:-4] + 'txt')) as fh:
+def read_scienceparse(layers: dict, doc: str):
+    """Returns the metadata fields needed from the ScienceParse file of a document in
+    the inventory, a Counter with the time spent reading and decoding them and the
+    exception raised when reading or None. The metadata are None after an error."""
+    times = Counter()
+    fname = inventory.paths(layers, get_name(doc)).get('scpa')
+    try:
+        return load_scienceparse(fname, times), times, None
+    except Exception as e:
+        return None, times, e
+
+
+def load_scienceparse(fname: str, times: Counter = None):
+    """Return the metadata fields needed from the ScienceParse file. ScienceParse
+    files can be large and the fields are in the metadata, which also has all the
+    sections and references, so the file is read with jsonstream, which skips what
+    is not needed. Returns an empty dictionary if there is no file. Time spent
+    reading and decoding is added to times."""
+    times = Counter() if times is None else times
+    if fname is None:
+        return {}
+    stats = {}
+    try:
+        with metrics.timed(times, 'read'):
+            return jsonstream.load(fname, SCIENCEPARSE_SPEC, stats)
+    except FileNotFoundError:
+        return {}
+    finally:
+        decode_time = stats.get('decode_time', 0.0)
+        times['read'] -= decode_time
+        times['decode'] += decode_time
+
+
+def get_summary(fname: str):
+    """Returns the summary in the file, with at most SUMMARY_MAX_TOKENS tokens, or an
+    empty string if there is no file."""
+    if fname is None:
+        return ''
+    with open(fname) as fh:
         summary = fh.read()
-    return summary
+    return summarize.truncate(summary, SUMMARY_MAX_TOKENS)
 
 
-def merge(doc: str, sp_obj: dict, doc_obj: dict, ner_obj: dict, trm_obj: dict, summary: str, meta: dict):
+def merge(doc: str, sp_obj: dict, doc_obj: dict, ner_obj: dict, trm_obj: dict, summary: str,
+          meta: metaindex.MetadataIndex):
     """Merge ScienceParse, DocumentParser and NER results into one JSON file, collecting
     all data that we want to load into ElasticSearch. Uses abstract and metadata from the
     first, the text from the second, and the entities from the third."""
@@ -113,30 +505,11 @@ def merge(doc: str, sp_obj: dict, doc_obj: dict, ner_obj: dict, trm_obj: dict, s
     return merged_obj
 
 
-def load_metadata(fname: str):
-    raw_meta = json.loads(open(fname).read())
-    meta = {}
-    for record in raw_meta:
-        identifier = None
-        for identifier_pair in record['identifier']:
-            if identifier_pair.get('type') == '_xddid':
-                identifier = identifier_pair['id']
-        if identifier is not None:
-            meta[identifier] = record
-    return meta
-
 def get_name(doc: str):
     return os.path.splitext(doc)[0]
 
-def get_url(name: str, meta: dict):
-    meta_data = meta.get(name)
-    if meta_data:
-        links = meta_data.get('link', [])
-        if links:
-            link = links[0]
-            if 'url' in link:
-                return link['url']
-    return None
+def get_url(name: str, meta: metaindex.MetadataIndex):
+    return meta.url(name)
 
 def get_meta(field: str, json_obj: dict):
     return json_obj.get('metadata', {}).get(field) 
@@ -153,24 +526,33 @@ def get_text(doc_obj: dict):
         text.write(f'{section["text"].strip()}\n\n')
     return text.getvalue()[:MAX_SIZE]
 
-def valid_merger(merged_obj: dict):
-    for field in ('title', 'year', 'authors'):
-        if not merged_obj[field]:
-            return False
-    return True
-
 
 def parse_args():
     parser = argparse.ArgumentParser(description='Merging processing layers and metadata')
     parser.add_argument('--scpa', help="directory with ScienceParse results")
-    parser.add_argument('--meta', help="file with meta data")
+    parser.add_argument('--meta', help="file with meta data or its index (see metaindex.py)")
     parser.add_argument('--doc', help="directory with document structure parses")
     parser.add_argument('--ner', help="directory with NER data")
     parser.add_argument('--trm', help="directory with term data")
     parser.add_argument('--sum', help="directory with summary data")
-    parser.add_argument('--out', help="output directory")
+    parser.add_argument('--out', help="output directory, optional with --elastic")
+    parser.add_argument('--elastic', help="also write an ElasticSearch bulk file to this directory")
+    parser.add_argument('--tags', help="comma-separated list of tags for the bulk file",
+                        default=[], type=lambda tagstring: tagstring.split(','))
     parser.add_argument('--limit', help="Maximum number of documents to process",
                         type=int, default=sys.maxsize)
+    parser.add_argument('--shard', help="Only process shard I of N documents",
+                        metavar='I/N', type=utils.shard)
+    parser.add_argument('--overwrite', help="Merge all documents, not just changed ones",
+                        action='store_true')
+    parser.add_argument('--status', help="Print which documents are up to date and exit",
+                        action='store_true')
+    parser.add_argument('--workers', help="Number of processes merging documents",
+                        type=int, default=1)
+    parser.add_argument('--out-format', help="Write a file per document or a JSON lines store",
+                        choices=mergedstore.FORMATS, default=mergedstore.FILES)
+    parser.add_argument('--part-size', help="Size in Mb of the files of a JSON lines store",
+                        type=int, default=mergedstore.PART_SIZE // 1000000)
     return parser.parse_args()
 
 
@@ -178,4 +560,4 @@ def parse_args():
 if __name__ == '__main__':
 
     args = parse_args()
-    merge_directory(args.scpa, args.meta, args.doc, args.ner, args.trm, args.sum, args.out, args.limit)
+    merge_directory(args.scpa, args.meta, args.doc, args.ner, args.trm, args.sum, args.out, args.limit, args.shard, args.overwrite, args.status, args.workers, args.out_format, args.part_size * 1000000, args.elastic, args.tags)
@@ -0,0 +1,233 @@
+"""Reading and writing merged documents
+
+merge.py writes merged documents either as one indented JSON file per document
+(the files format) or as a store of JSON lines files (the jsonl format). A store
+in an output directory consists of one or more part files, each with up to about
+PART_SIZE bytes of compact JSON objects, one per line, and an index file with for
+each document the part file, the offset and the length of its line:
+
+    merged-0000.jsonl
+    merged-0001.jsonl
+    merged.index.tsv
+
+For sharded merges the shard suffix is added to the names, so shards can write to
+the same directory (merged-shard-1-of-4-0000.jsonl, merged-shard-1-of-4.index.tsv).
+
+Scripts that read merged documents should use open_merged(), which takes an output
+directory in either format and returns an object with the same methods:
+
+    names()      sorted list of document names (xDD identifiers)
+    get(name)    the document as a dictionary
+    read(name)   the document as a string
+    read_bytes(name)  the document as bytes
+    items()      all documents as pairs of a name and a dictionary, for a store this
+                 reads the part files from start to end
+    input_hash(name)  a hash of the stored document, for manifests
+    close()      closes the files opened for get() and read()
+
+"""
+
+import os, glob, hashlib
+import jsoncodec, manifest
+
+
+FILES = 'files'
+JSONL = 'jsonl'
+FORMATS = (FILES, JSONL)
+
+PREFIX = 'merged'
+PART_EXTENSION = '.jsonl'
+INDEX_EXTENSION = '.index.tsv'
+
+# approximate maximum size of a part file in bytes
+PART_SIZE = 100 * 1000 * 1000
+
+
+def open_merged(directory: str, prefix: str = None):
+    """Returns a reader for the merged documents in a directory. With a prefix only
+    the store with that prefix is read, otherwise all stores in the directory."""
+    if prefix is not None or glob.glob(os.path.join(directory, f'*{INDEX_EXTENSION}')):
+        return MergedStore(directory, prefix)
+    return MergedFiles(directory)
+
+
+def store_prefix(suffix: str = ''):
+    """Returns the prefix of the file names of a store, suffix is a shard suffix."""
+    return f'{PREFIX}{suffix}'
+
+
+class MergedFiles:
+
+    """Reader for a directory with a JSON file for each document."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.documents = sorted(
+            fname[:-5] for fname in os.listdir(directory) if fname.endswith('.json'))
+
+    def path(self, name: str):
+        return os.path.join(self.directory, name + '.json')
+
+    def names(self):
+        return self.documents
+
+    def read_bytes(self, name: str):
+        with open(self.path(name), 'rb') as fh:
+            return fh.read()
+
+    def read(self, name: str):
+        return self.read_bytes(name).decode('utf8')
+
+    def get(self, name: str):
+        return jsoncodec.loads(self.read_bytes(name))
+
+    def items(self):
+        for name in self.documents:
+            yield name, self.get(name)
+
+    def input_hash(self, name: str):
+        return manifest.file_hash(self.path(name))
+
+    def close(self):
+        pass
+
+    def __contains__(self, name: str):
+        return os.path.exists(self.path(name))
+
+    def __len__(self):
+        return len(self.documents)
+
+
+class MergedStore:
+
+    """Reader for one or more stores in a directory, using their index files."""
+
+    def __init__(self, directory: str, prefix: str = None):
+        self.directory = directory
+        self.index = {}
+        if prefix is None:
+            index_files = sorted(glob.glob(os.path.join(directory, f'*{INDEX_EXTENSION}')))
+        else:
+            index_files = [os.path.join(directory, prefix + INDEX_EXTENSION)]
+        for index_file in index_files:
+            self.index.update(read_index(index_file))
+        self.documents = sorted(self.index)
+        self.handles = {}
+
+    def names(self):
+        return self.documents
+
+    def read_bytes(self, name: str):
+        """Returns the line of the document, without the newline."""
+        part, offset, length = self.index[name]
+        fh = self.handles.get(part)
+        if fh is None:
+            fh = self.handles[part] = open(os.path.join(self.directory, part), 'rb')
+        fh.seek(offset)
+        return fh.read(length)
+
+    def read(self, name: str):
+        return self.read_bytes(name).decode('utf8')
+
+    def get(self, name: str):
+        return jsoncodec.loads(self.read_bytes(name))
+
+    def items(self):
+        """Generate all documents in the order in which they are stored, reading
+        each part file from start to end."""
+        by_part = {}
+        for name, (part, offset, length) in self.index.items():
+            by_part.setdefault(part, []).append((offset, length, name))
+        for part in sorted(by_part):
+            with open(os.path.join(self.directory, part), 'rb') as fh:
+                position = 0
+                for offset, length, name in sorted(by_part[part]):
+                    if offset != position:
+                        fh.seek(offset)
+                    data = fh.read(length + 1)
+                    position = offset + length + 1
+                    yield name, jsoncodec.loads(data)
+
+    def input_hash(self, name: str):
+        return hashlib.sha1(self.read_bytes(name)).hexdigest()
+
+    def parts(self):
+        return sorted({part for part, _, _ in self.index.values()})
+
+    def close(self):
+        for fh in self.handles.values():
+            fh.close()
+        self.handles = {}
+
+    def __contains__(self, name: str):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.documents)
+
+
+def read_index(index_file: str):
+    index = {}
+    if not os.path.exists(index_file):
+        return index
+    with open(index_file) as fh:
+        for line in fh:
+            if line.startswith('#') or not line.strip():
+                continue
+            name, part, offset, length = line.rstrip('\n').split('\t')
+            index[name] = (part, int(offset), int(length))
+    return index
+
+
+class StoreWriter:
+
+    """Writes a store with the prefix to a directory. Documents are written to
+    temporary part files, which replace the parts of an existing store with the
+    same prefix when the writer is closed, after that the index is written. This
+    way a store can be written while documents are copied from the previous version
+    of the store."""
+
+    def __init__(self, directory: str, prefix: str = PREFIX, part_size: int = PART_SIZE):
+        self.directory = directory
+        self.prefix = prefix
+        self.part_size = part_size
+        self.index = {}
+        self.parts = []
+        self.fh = None
+        self.offset = 0
+
+    def part_name(self, n: int):
+        return f'{self.prefix}-{n:04d}{PART_EXTENSION}'
+
+    def write(self, name: str, line):
+        """Write a document, which is a compact JSON string or bytes without newlines."""
+        data = line.encode('utf8') if isinstance(line, str) else line
+        if self.fh is None or self.offset >= self.part_size:
+            self.new_part()
+        self.fh.write(data + b'\n')
+        self.index[name] = (self.parts[-1], self.offset, len(data))
+        self.offset += len(data) + 1
+        return len(data) + 1
+
+    def new_part(self):
+        if self.fh is not None:
+            self.fh.close()
+        self.parts.append(self.part_name(len(self.parts)))
+        self.fh = open(os.path.join(self.directory, self.parts[-1] + '.tmp'), 'wb')
+        self.offset = 0
+
+    def close(self):
+        if self.fh is not None:
+            self.fh.close()
+        index_file = os.path.join(self.directory, self.prefix + INDEX_EXTENSION)
+        old_parts = {part for part, _, _ in read_index(index_file).values()}
+        for part in self.parts:
+            os.replace(os.path.join(self.directory, part + '.tmp'),
+                       os.path.join(self.directory, part))
+        for part in old_parts - set(self.parts):
+            os.remove(os.path.join(self.directory, part))
+        with open(index_file + '.tmp', 'w') as fh:
+            for name in sorted(self.index):
+                part, offset, length = self.index[name]
+                fh.write(f'{name}\t{part}\t{offset}\t{length}\n')
+        os.replace(index_file + '.tmp', index_file)
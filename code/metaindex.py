@@ -0,0 +1,192 @@
+"""Index for bibjson metadata files
+
+The metadata for a topic comes as one large bibjson file with a list of records.
+Loading it takes time and memory that grow with the size of the file while merge.py
+only needs the record of each document it merges. This module turns a bibjson file
+into an SQLite database with the records indexed on their xDD identifier, so that
+records can be looked up one at a time.
+
+To create the index:
+
+$ python metaindex.py FILE.bibjson
+
+This creates FILE.bibjson.sqlite. The index is also created when a script opens
+a bibjson file with open_index() and there is no index yet or the bibjson file
+changed since the index was created.
+
+The index has three tables:
+
+records  - the xDD identifier, the URL of the first link and the record as JSON
+fields   - for each field the number of records where it has a value, this is
+           what analyze_metadata.py prints
+info     - size and modification time of the bibjson file
+
+"""
+
+import os, json, sqlite3, argparse
+from collections import Counter
+import jsonstream
+
+
+INDEX_EXTENSION = '.sqlite'
+
+# bumped when the layout of the database changes
+VERSION = 1
+
+# number of records inserted per transaction
+BATCH_SIZE = 1000
+
+SCHEMA = """
+CREATE TABLE records (xddid TEXT PRIMARY KEY, url TEXT, record TEXT);
+CREATE TABLE fields (field TEXT PRIMARY KEY, count INTEGER);
+CREATE TABLE info (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def index_file(bibjson_file: str):
+    return bibjson_file + INDEX_EXTENSION
+
+
+def open_index(fname: str):
+    """Returns a MetadataIndex for a bibjson file or an index file. For a bibjson
+    file the index is created first if it does not exist or is out of date."""
+    if fname.endswith(INDEX_EXTENSION):
+        return MetadataIndex(fname)
+    if not is_current(fname, index_file(fname)):
+        print(f'Indexing {fname}...')
+        build(fname)
+    return MetadataIndex(index_file(fname))
+
+
+class MetadataIndex:
+
+    """Lookup of metadata records in an index file. Use get() like the get method
+    of a dictionary. The database connection is opened on first use in each process,
+    so an index can be shared with forked worker processes."""
+
+    def __init__(self, fname: str):
+        if not os.path.exists(fname):
+            raise FileNotFoundError(fname)
+        self.fname = fname
+        self.connection = None
+        self.pid = None
+
+    def cursor(self):
+        if self.connection is None or self.pid != os.getpid():
+            self.connection = sqlite3.connect(f'file:{self.fname}?mode=ro', uri=True)
+            self.pid = os.getpid()
+        return self.connection.cursor()
+
+    def get(self, identifier: str, default=None):
+        """Returns the record for the identifier."""
+        row = self.cursor().execute(
+            'SELECT record FROM records WHERE xddid = ?', (identifier,)).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def url(self, identifier: str):
+        """Returns the URL of the first link of the record, without decoding it."""
+        row = self.cursor().execute(
+            'SELECT url FROM records WHERE xddid = ?', (identifier,)).fetchone()
+        return None if row is None else row[0]
+
+    def field_counts(self):
+        """Returns a dictionary with for each field the number of records where the
+        field has a value, this includes records without an xDD identifier."""
+        return dict(self.cursor().execute('SELECT field, count FROM fields'))
+
+    def __len__(self):
+        return self.cursor().execute('SELECT COUNT(*) FROM records').fetchone()[0]
+
+
+def source_info(bibjson_file: str):
+    stat = os.stat(bibjson_file)
+    return { 'version': str(VERSION), 'size': str(stat.st_size), 'mtime': str(stat.st_mtime_ns) }
+
+
+def is_current(bibjson_file: str, fname: str):
+    """Returns True if the index exists and was created from the bibjson file as
+    it is now."""
+    if not os.path.exists(fname):
+        return False
+    try:
+        connection = sqlite3.connect(f'file:{fname}?mode=ro', uri=True)
+        with connection:
+            info = dict(connection.execute('SELECT key, value FROM info'))
+        connection.close()
+    except sqlite3.Error:
+        return False
+    return info == source_info(bibjson_file)
+
+
+def build(bibjson_file: str, fname: str = None):
+    """Create the index for the bibjson file. The records are read one at a time, so
+    the bibjson file is never loaded completely."""
+    fname = index_file(bibjson_file) if fname is None else fname
+    tmp_fname = fname + '.tmp'
+    if os.path.exists(tmp_fname):
+        os.remove(tmp_fname)
+    connection = sqlite3.connect(tmp_fname)
+    connection.executescript(SCHEMA)
+    field_counts = Counter()
+    rows = []
+    for record in read_records(bibjson_file):
+        for field, value in record.items():
+            if value:
+                field_counts[field] += 1
+        identifier = record_identifier(record)
+        if identifier is not None:
+            rows.append((identifier, record_url(record), json.dumps(record, separators=(',', ':'))))
+        if len(rows) == BATCH_SIZE:
+            insert_records(connection, rows)
+            rows = []
+    insert_records(connection, rows)
+    with connection:
+        connection.executemany('INSERT INTO fields VALUES (?, ?)', field_counts.items())
+        connection.executemany(
+            'INSERT INTO info VALUES (?, ?)', source_info(bibjson_file).items())
+    connection.close()
+    os.replace(tmp_fname, fname)
+
+
+def insert_records(connection: sqlite3.Connection, rows: list):
+    # a later record with the same identifier replaces an earlier one, which is
+    # what happened when records were loaded into a dictionary
+    with connection:
+        connection.executemany('INSERT OR REPLACE INTO records VALUES (?, ?, ?)', rows)
+
+
+def read_records(bibjson_file: str):
+    """Generate the records in a bibjson file."""
+    with open(bibjson_file, encoding='utf8', newline='') as fh:
+        scanner = jsonstream.Scanner(fh)
+        for _ in scanner.array_elements():
+            yield scanner.decode_value()
+
+
+def record_identifier(record: dict):
+    identifier = None
+    for identifier_pair in record.get('identifier', []):
+        if identifier_pair.get('type') == '_xddid':
+            identifier = identifier_pair['id']
+    return identifier
+
+
+def record_url(record: dict):
+    links = record.get('link', [])
+    if links:
+        return links[0].get('url')
+    return None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Index bibjson metadata files')
+    parser.add_argument('files', help="bibjson files", nargs='+', metavar='FILE')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+    for bibjson_file in args.files:
+        build(bibjson_file)
+        print(f'{index_file(bibjson_file)}  {len(MetadataIndex(index_file(bibjson_file)))} records')
@@ -0,0 +1,197 @@
+"""Per-document processing metrics
+
+The processing stages (ner.py, merge.py and prepare_elastic.py) write a metrics
+file to the logs directory next to their regular log. The file has a JSON object
+on each line with the time spent in each phase of processing a document and with
+the number of bytes read and written for it:
+
+{"doc": "54b4324ee138239d8684aeb2.json", "time": {"read": 0.002, "decode": 0.001,
+ "spacy": 0.81, "filter": 0.05, "serialize": 0.004, "write": 0.001},
+ "total": 0.868, "bytes_in": 48213, "bytes_out": 10455}
+
+Documents that failed have an "error" field. The phases used depend on the stage:
+
+read       - reading input files, for partially read files (see jsonstream.py)
+             this includes skipping what is not needed
+decode     - decoding JSON
+prefilter  - removing non-language blocks before spaCy (ner.py)
+spacy      - running the spaCy pipeline (ner.py)
+filter     - accepting sentences and collecting entities (ner.py)
+merge      - creating the merged object (merge.py)
+build      - creating the ElasticSearch object (prepare_elastic.py)
+serialize  - creating the output data
+write      - writing the output files
+
+The total is the sum of the phases, which is not the same as wall-clock time since
+ner.py reads and writes in background threads. The last line of the file has a
+summary of the run with throughput, latency percentiles and the slowest documents.
+The summary is also printed at the end of a run and can be recreated from one or
+more metrics files with
+
+$ python metrics.py [--slowest N] FILE...
+
+"""
+
+import os, time, json, argparse
+from collections import Counter
+from contextlib import contextmanager
+import utils
+
+
+# number of slowest documents listed in the summary
+SLOWEST = 10
+
+PERCENTILES = (50, 95, 99)
+
+
+@contextmanager
+def timed(times: Counter, phase: str):
+    """Add the time spent in the body of the with statement to the phase."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        times[phase] += time.perf_counter() - t0
+
+
+def file_size(*fnames: str):
+    """Returns the total size in bytes of the files that exist, file names can be
+    None for files that are known not to exist."""
+    return sum(os.path.getsize(fname) for fname in fnames
+               if fname is not None and os.path.exists(fname))
+
+
+def metrics_file(stage: str, suffix: str = ''):
+    return f'logs/metrics-{stage}-{utils.timestamp()}{suffix}.jsonl'
+
+
+class MetricsFile:
+
+    """Writes metrics records for a stage to a file and keeps what is needed for the
+    summary, which is written and printed when the file is closed. Can be used as a
+    context manager."""
+
+    def __init__(self, fname: str, stage: str):
+        self.fname = fname
+        self.stage = stage
+        self.records = []
+        self.start = time.time()
+        os.makedirs(os.path.dirname(os.path.abspath(fname)), exist_ok=True)
+        self.fh = open(fname, 'w')
+
+    def record(self, doc: str, times: Counter, bytes_in: int = 0, bytes_out: int = 0,
+               error: Exception = None):
+        record = {
+            'doc': doc,
+            'time': {phase: round(seconds, 6) for phase, seconds in times.items()},
+            'total': round(sum(times.values()), 6),
+            'bytes_in': bytes_in,
+            'bytes_out': bytes_out }
+        if error is not None:
+            record['error'] = str(error)
+        self.fh.write(json.dumps(record) + '\n')
+        self.records.append(record)
+
+    def close(self):
+        summary = summarize(self.stage, self.records, time.time() - self.start)
+        self.fh.write(json.dumps({'summary': summary}) + '\n')
+        self.fh.close()
+        print_summary(summary)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def summarize(stage: str, records: list, wall_time: float, slowest: int = SLOWEST):
+    """Returns a dictionary with throughput, latency percentiles, time spent in
+    each phase and the slowest documents. Failed documents are counted but their
+    times are not used."""
+    processed = [record for record in records if 'error' not in record]
+    totals = sorted(record['total'] for record in processed)
+    phases = Counter()
+    for record in processed:
+        phases.update(record['time'])
+    bytes_in = sum(record['bytes_in'] for record in processed)
+    bytes_out = sum(record['bytes_out'] for record in processed)
+    slowest_records = sorted(processed, key=lambda record: -record['total'])[:slowest]
+    return {
+        'stage': stage,
+        'documents': len(processed),
+        'errors': len(records) - len(processed),
+        'wall_time': round(wall_time, 3),
+        'documents_per_second': round(len(processed) / wall_time, 3) if wall_time else None,
+        'megabytes_in_per_second': round(bytes_in / 1e6 / wall_time, 3) if wall_time else None,
+        'bytes_in': bytes_in,
+        'bytes_out': bytes_out,
+        'latency': {f'p{p}': round(percentile(totals, p), 6) for p in PERCENTILES},
+        'phases': {phase: round(seconds, 3) for phase, seconds in phases.most_common()},
+        'slowest': [[record['doc'], record['total']] for record in slowest_records] }
+
+
+def percentile(values: list, p: float):
+    """Nearest-rank percentile of a sorted list, 0 for an empty list."""
+    if not values:
+        return 0
+    rank = max(1, -(-len(values) * p // 100))
+    return values[int(rank) - 1]
+
+
+def print_summary(summary: dict):
+    print(f'\nMetrics for {summary["stage"]}\n')
+    print(f'    documents     {summary["documents"]:10d}')
+    print(f'    errors        {summary["errors"]:10d}')
+    print(f'    wall time     {summary["wall_time"]:10.2f}s')
+    if summary['documents_per_second'] is not None:
+        print(f'    documents/s   {summary["documents_per_second"]:10.2f}')
+        print(f'    Mb in/s       {summary["megabytes_in_per_second"]:10.2f}')
+    for name, value in summary['latency'].items():
+        print(f'    latency {name:5} {value:10.3f}s')
+    print('\n    time per phase\n')
+    for phase, seconds in summary['phases'].items():
+        print(f'    {phase:13} {seconds:10.2f}s')
+    if summary['slowest']:
+        print('\n    slowest documents\n')
+        for doc, seconds in summary['slowest']:
+            print(f'    {seconds:10.3f}s  {doc}')
+    print()
+
+
+def read_records(fname: str):
+    """Returns the document records and the summary from a metrics file, the
+    summary is None if the run did not finish."""
+    records = []
+    summary = None
+    with open(fname) as fh:
+        for line in fh:
+            json_obj = json.loads(line)
+            if 'summary' in json_obj:
+                summary = json_obj['summary']
+            else:
+                records.append(json_obj)
+    return records, summary
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Summarize metrics files')
+    parser.add_argument('files', help="metrics files", nargs='+', metavar='FILE')
+    parser.add_argument('--slowest', help="number of slowest documents to list",
+                        type=int, default=SLOWEST)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+    records = []
+    stages = set()
+    wall_time = 0
+    for fname in args.files:
+        file_records, summary = read_records(fname)
+        records.extend(file_records)
+        if summary is not None:
+            stages.add(summary['stage'])
+            wall_time += summary['wall_time']
+    print_summary(summarize('/'.join(sorted(stages)) or 'unknown', records, wall_time, args.slowest))
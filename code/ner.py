@@ -10,9 +10,68 @@ $ python -m spacy download en_core_web_sm
 Usage:
 
 $ python usage: ner.py [-h] [--doc DOC] [--pos POS] [--ner NER] [--limit LIMIT]
+                       [--batch-size N] [--workers N] [--profile PROFILE]
+                       [--shard I/N] [--no-prefilter] [--budget SECONDS]
+                       [--split-size N] [--pos-format FORMAT] [--overwrite]
+                       [--status] [--prefetch N]
 
 Without LIMIT all files in the DOC directory are processed.
 
+Processing is incremental, a manifest next to the output directory records a hash
+of the input of each document and of the settings used (see manifest.py). Without
+--overwrite a document is skipped when its output exists and its input and the
+settings did not change. With --status a report of up-to-date, stale and missing
+documents is printed and nothing is processed.
+
+With --shard I/N only the documents that belong to shard I of N are processed,
+see utils.shard_index(). The limit is applied after selecting the shard.
+
+With --batch-size the texts of N documents at a time are handed to nlp.pipe(),
+using --workers processes. Output is the same as when documents are processed
+one at a time, but the time in the log is the average time for the documents
+in the batch.
+
+With --profile one of the pipeline profiles in PROFILES is used, the default is
+the full pipeline. Profiles differ in what spaCy components run and in what
+output they create:
+
+full           - all components, writes entities to NER and tokens with lemmas,
+                 tags and noun chunks to POS
+entities-only  - only the tokenizer, the entity recognizer and a rule-based
+                 sentencizer, writes entities to NER, no POS output
+pos-only       - no entity recognizer, writes tokens and noun chunks to POS
+                 but without entity types, no NER output
+fast           - parser replaced by the rule-based sentencizer, writes entities
+                 to NER and tokens to POS, but there are no noun chunks and
+                 sentence boundaries may differ from the full profile
+
+Before texts are handed to spaCy, blocks of text that do not look like language,
+like tables and reference lists, are removed with a cheap regular expression
+based prefilter, see prefilter_texts(). Use --no-prefilter to switch this off.
+The log has the name of each document, the processing time and the number of
+characters removed by the prefilter.
+
+With --budget a document gets at most SECONDS of processing time. Texts of the
+document are processed one at a time and when the budget has run out the texts
+that are left are skipped. Truncated documents are marked in the log and in the
+NER output with a "truncated" field that has the number of texts processed and
+the total number of texts. The budget does not apply in batch mode.
+
+With --split-size documents with more than N characters of text have their texts
+spread over --workers processes, so that one huge document does not stall the run
+(this applies when documents are processed one at a time).
+
+POS output is written in a compact binary format, use --pos-format text for the
+older tab-separated text format. See posfile.py for both formats and for the
+functions to read them.
+
+Reading documents and writing results is done in background threads, so that
+spaCy does not have to wait for I/O, with --prefetch setting how many documents
+can be read ahead or be waiting to be written (0 means no background threads).
+When spaCy forks worker processes, that is with --workers N and --batch-size or
+--split-size, there are no background threads, since forking a process while
+other threads hold locks can make the worker processes hang.
+
 Only the first N characters of the data will be processed, the exact size is set
 by the MAX_SIZE variable.
 
@@ -21,15 +80,50 @@ by the MAX_SIZE variable.
 # TODO: add the domain/topic name to the log file
 
 
-import os, sys, json, time, argparse
+import os, re, sys, time, bisect, argparse
 from collections import Counter
 from pathlib import Path
 import spacy
 from tqdm import tqdm
-import frequencies, utils
+import background, frequencies, jsoncodec, jsonstream, manifest, metrics, posfile, utils
 from config import ENTITY_TYPES
 
-nlp = spacy.load("en_core_web_sm")
+SPACY_MODEL = "en_core_web_sm"
+
+# Version of the NER and POS output, which is part of the manifest settings.
+# Increase it when a code change changes the output, so that all documents
+# become stale.
+VERSION = 1
+
+# Pipeline profiles, for each profile we list the components that are disabled,
+# whether the rule-based sentencizer is added (needed when the parser is disabled
+# since sentences are taken from the parser), and which outputs are written. The
+# entity recognizer in the small model has its own embedding layer so tok2vec can
+# be dropped if the tagger and parser are both disabled.
+PROFILES = {
+    'full': {
+        'disable': (),
+        'sentencizer': False,
+        'outputs': ('ner', 'pos') },
+    'entities-only': {
+        'disable': ('tok2vec', 'tagger', 'parser', 'attribute_ruler', 'lemmatizer'),
+        'sentencizer': True,
+        'outputs': ('ner',) },
+    'pos-only': {
+        'disable': ('ner',),
+        'sentencizer': False,
+        'outputs': ('pos',) },
+    'fast': {
+        'disable': ('parser',),
+        'sentencizer': True,
+        'outputs': ('ner', 'pos') },
+}
+
+DEFAULT_PROFILE = 'full'
+
+# the spaCy pipeline and the name of its profile, set by load_pipeline()
+nlp = None
+profile = None
 
 
 # a limit on how much data we want to process for each file
@@ -39,70 +133,363 @@ MAX_SIZE = 25000
 FREQUENT_ENGLISH_WORDS = set(
     [line.split()[1] for line in frequencies.FREQUENCIES.split('\n') if line])
 
+# settings for the prefilter that removes blocks of text that are not language
+# before spaCy is run, the thresholds are lower than those in accept_sentence()
+# because the regular expression tokenizer is cruder and because blocks can mix
+# good and bad sentences, blocks with only a few tokens are always kept
+BLOCK_SEPARATOR = re.compile(r'\n\s*\n')
+TOKEN_EXPRESSION = re.compile(r'\w+|[^\w\s]')
+PREFILTER_MIN_TOKENS = 10
+PREFILTER_MIN_TOKEN_LENGTH = 2.5
+PREFILTER_MIN_LANGUAGE_SCORE = 0.1
+
+
+def load_pipeline(profile_name: str = DEFAULT_PROFILE):
+    """Load the spaCy pipeline for a profile and make it the pipeline used by all
+    processing functions. Does nothing if the profile is already loaded."""
+    global nlp, profile
+    if profile_name not in PROFILES:
+        raise ValueError(f'unknown profile: {profile_name}')
+    if nlp is None or profile != profile_name:
+        settings = PROFILES[profile_name]
+        nlp = spacy.load(SPACY_MODEL, exclude=list(settings['disable']))
+        if settings['sentencizer']:
+            nlp.add_pipe('sentencizer')
+        profile = profile_name
+    return nlp
+
+
+def outputs():
+    """Return the outputs written by the current profile."""
+    return PROFILES[profile]['outputs']
+
 
 def process_directory(
         doc_dir: str, pos_dir: str, ner_dir: str,
-        limit: int = sys.maxsize, overwrite: bool = False):
+        limit: int = sys.maxsize, overwrite: bool = False,
+        batch_size: int = 1, workers: int = 1, profile_name: str = DEFAULT_PROFILE,
+        shard: tuple = None, prefilter: bool = True, budget: float = None,
+        split_size: int = None, pos_format: str = 'binary', status: bool = False,
+        prefetch: int = 4):
     """Run NER over all documents in doc_dir and write part-of-speech output to
-    pos_dir and named entities to ner_dir."""
-    os.makedirs(pos_dir, exist_ok=True)
-    os.makedirs(ner_dir, exist_ok=True)
+    pos_dir and named entities to ner_dir. With a batch size larger than one the
+    documents are handed to spaCy in batches, see process_batch(). The profile
+    determines what spaCy components are used and what output is written. With
+    a shard only the documents in that shard are processed. With prefilter set
+    non-language blocks are removed before texts are handed to spaCy. The budget
+    and split size are handed to run_doc(). POS output is written in the
+    binary or text format, see posfile.py.
+
+    Documents are read in a background thread that stays at most prefetch
+    documents ahead and output is written in another background thread with at
+    most prefetch documents waiting, with prefetch set to 0 everything runs in
+    the main thread. This is also done when spaCy forks worker processes, see
+    forks_workers().
+
+    Unless overwrite is set, documents are skipped if their outputs exist and if
+    according to the manifest they were created from the same input and with the
+    same settings. With status set only a report on this is printed."""
+    load_pipeline(profile_name)
+    if prefetch and forks_workers(batch_size, workers, split_size):
+        print('Not using background threads for reading and writing with --workers')
+        prefetch = 0
+    docs = utils.select_shard(list(sorted(os.listdir(doc_dir))), shard)[:limit]
+    out_dir = ner_dir if 'ner' in outputs() else pos_dir
+    settings = manifest_settings(prefilter, budget, pos_format)
+    doc_manifest = manifest.Manifest(
+        manifest.manifest_file(out_dir, shard), 'ner', settings)
+    hashes = {doc: manifest.file_hash(os.path.join(doc_dir, doc)) for doc in docs}
+    statuses = {
+        doc: doc_manifest.status(
+            doc, hashes[doc], output_exists(doc, pos_dir, ner_dir, pos_format))
+        for doc in docs }
+    if status:
+        manifest.print_status('ner.py', statuses)
+        return
+    if not overwrite:
+        docs = [doc for doc in docs if statuses[doc] != manifest.UP_TO_DATE]
+    if 'pos' in outputs():
+        os.makedirs(pos_dir, exist_ok=True)
+    if 'ner' in outputs():
+        os.makedirs(ner_dir, exist_ok=True)
     print(f'\nProcessing {doc_dir}...')
     print(f'Writing to {pos_dir}...')
     print(f'Writing to {ner_dir}...\n')
-    docs = os.listdir(doc_dir)
 
-    logfile = f'logs/processing-ner-{utils.timestamp()}.txt'
-    with open(logfile, 'w') as log:
+    logfile = f'logs/processing-ner-{utils.timestamp()}{utils.shard_suffix(shard)}.txt'
+    metrics_fname = metrics.metrics_file('ner', utils.shard_suffix(shard))
+    with open(logfile, 'w') as log, metrics.MetricsFile(metrics_fname, 'ner') as doc_metrics:
         log.write(f'# SCRIPT     =  ner.py\n')
         log.write(f'# INPUT      =  {doc_dir}\n')
         log.write(f'# OUTPUT     =  {pos_dir}\n')
         log.write(f'# OUTPUT     =  {ner_dir}\n')
         log.write(f'# OVERWRITE  =  {str(overwrite)}\n')
-        log.write(f'# LIMIT:     =  {limit}\n\n')
-        n = 1
-        for doc in tqdm(list(sorted(docs))[:limit]):
-            n += 1
+        log.write(f'# LIMIT:     =  {limit}\n')
+        log.write(f'# BATCH SIZE =  {batch_size}\n')
+        log.write(f'# WORKERS    =  {workers}\n')
+        log.write(f'# PROFILE    =  {profile}\n')
+        log.write(f'# SHARD      =  {utils.shard_name(shard)}\n')
+        log.write(f'# PREFILTER  =  {str(prefilter)}\n')
+        log.write(f'# BUDGET     =  {budget}\n')
+        log.write(f'# SPLIT SIZE =  {split_size}\n')
+        log.write(f'# POS FORMAT =  {pos_format}\n')
+        log.write(f'# MANIFEST   =  {doc_manifest.fname}\n')
+        log.write(f'# PREFETCH   =  {prefetch}\n')
+        log.write(f'# METRICS    =  {metrics_fname}\n\n')
+        def save(doc: str, elapsed: float, result):
+            # runs in the writer thread, which is the only one writing to the log,
+            # the metrics and the manifest after the header was written
             try:
-                t0 = time.time()
-                # skip if the output already exists and you are not overwriting
-                if not overwrite and output_exists(doc, pos_dir, ner_dir):
-                    continue
-                entities, paragraphs = process_doc(doc_dir, doc, n + 1)
-                write_entities(ner_dir, doc, entities)
-                write_tokens(pos_dir, doc, paragraphs)
-                elapsed = time.time() - t0
-                log.write(f'{doc}\t{elapsed:.2f}\n')
+                if isinstance(result, Exception):
+                    raise result
+                entities, paragraphs, stats = result
+                write_results(
+                    ner_dir, pos_dir, doc, entities, paragraphs, stats, pos_format)
+                doc_manifest.update(doc, hashes[doc])
+                log_doc(log, doc, elapsed, stats)
+                doc_metrics.record(
+                    doc, stats['time'], stats['bytes_in'], stats['bytes_out'])
             except Exception as e:
                 log.write(f'{doc}\t{e}\n')
-
-
-def process_doc(doc_dir: str, doc: str, n: int):
-    fname = os.path.join(doc_dir, doc)
+                doc_metrics.record(doc, Counter(), error=e)
+        def load(doc: str):
+            return load_doc(doc_dir, doc, prefilter)
+        loaded_docs = tqdm(background.prefetch(load, docs, prefetch), total=len(docs))
+        with background.Writer(prefetch) as writer:
+            if batch_size > 1:
+                process_batches(loaded_docs, batch_size, workers, writer, save)
+            else:
+                for doc, loaded in loaded_docs:
+                    t0 = time.time()
+                    try:
+                        if isinstance(loaded, Exception):
+                            raise loaded
+                        result = run_doc(*loaded, budget, workers, split_size)
+                    except Exception as e:
+                        result = e
+                    writer.submit(save, doc, time.time() - t0, result)
+    doc_manifest.save()
+
+
+def forks_workers(batch_size: int, workers: int, split_size: int = None):
+    """Returns True if nlp.pipe() is called with more than one process, which forks
+    the main process, either for batches or for documents larger than split_size."""
+    return workers > 1 and (batch_size > 1 or split_size is not None)
+
+
+def manifest_settings(prefilter: bool, budget: float, pos_format: str):
+    """The settings that determine the output for a document, if any of them
+    change all documents need to be processed again."""
+    return {
+        'MAX_SIZE': MAX_SIZE,
+        'ENTITY_TYPES': ENTITY_TYPES,
+        'model': SPACY_MODEL,
+        'model_version': nlp.meta.get('version'),
+        'spacy_version': spacy.__version__,
+        'profile': profile,
+        'prefilter': prefilter and {
+            'min_tokens': PREFILTER_MIN_TOKENS,
+            'min_token_length': PREFILTER_MIN_TOKEN_LENGTH,
+            'min_language_score': PREFILTER_MIN_LANGUAGE_SCORE },
+        'budget': budget,
+        'pos_format': pos_format,
+        'VERSION': VERSION }
+
+
+def process_batches(loaded_docs, batch_size: int, workers: int, writer, save):
+    """Process documents in batches of batch_size documents, each batch goes through
+    spaCy in one call of nlp.pipe() using workers processes. The loaded documents
+    are pairs of a document name and what load_doc() returned for it. Results are
+    handed to the save function, which runs in the writer."""
+    batch = []
+    for doc, loaded in loaded_docs:
+        batch.append((doc, loaded))
+        if len(batch) == batch_size:
+            process_batch_and_save(batch, workers, writer, save)
+            batch = []
+    if batch:
+        process_batch_and_save(batch, workers, writer, save)
+
+
+def process_batch_and_save(batch: list, workers: int, writer, save):
+    t0 = time.time()
+    try:
+        results = process_batch(batch, workers)
+    except Exception as e:
+        # an error in spaCy loses the whole batch
+        results = [(doc, e) for doc, _ in batch]
+    elapsed = (time.time() - t0) / len(batch)
+    for doc, result in results:
+        writer.submit(save, doc, elapsed, result)
+
+
+def process_batch(batch: list, workers: int = 1):
+    """Run spaCy over the texts of all documents in the batch in one call to
+    nlp.pipe() and regroup the results per document. The batch has pairs of
+    document names and what load_doc() returned for them. Returns a list of
+    pairs of the document name and either a triple of entities, paragraphs and
+    statistics or the exception raised when reading the document. The results
+    are in the order of the batch and are the same as what process_doc() returns
+    for each document."""
+    results = []
+    texts = []
+    for doc, loaded in batch:
+        if isinstance(loaded, Exception):
+            results.append((doc, loaded))
+            continue
+        doc_texts, stats = loaded
+        results.append((doc, ({}, [], stats)))
+        texts.extend((len(results) - 1, text) for text in doc_texts)
+    spacy_docs = nlp.pipe((text for _, text in texts), n_process=workers)
+    t0 = time.perf_counter()
+    for (i, _), spacy_doc in zip(texts, spacy_docs):
+        entities, paragraphs, stats = results[i][1]
+        stats['time']['spacy'] += time.perf_counter() - t0
+        with metrics.timed(stats['time'], 'filter'):
+            analyze_doc(spacy_doc, entities, paragraphs)
+        t0 = time.perf_counter()
+    return results
+
+
+def process_doc(
+        doc_dir: str, doc: str, n: int, prefilter: bool = True,
+        budget: float = None, workers: int = 1, split_size: int = None):
+    """Run spaCy over the texts of a document and return the entities, the accepted
+    sentences and a dictionary with statistics on the document."""
+    texts, stats = load_doc(doc_dir, doc, prefilter)
+    return run_doc(texts, stats, budget, workers, split_size)
+
+
+def load_doc(doc_dir: str, doc: str, prefilter: bool = True):
+    """Read the texts of a document and prepare them for spaCy. Returns the texts
+    and a dictionary with statistics on the document, including the time spent in
+    each phase of processing the document, see metrics.py."""
+    stats = { 'time': Counter() }
+    times = stats['time']
+    stats['bytes_in'] = metrics.file_size(os.path.join(doc_dir, doc))
+    read_stats = {}
+    with metrics.timed(times, 'read'):
+        texts = read_texts(doc_dir, doc, read_stats)
+    times['read'] -= read_stats['decode_time']
+    times['decode'] += read_stats['decode_time']
+    if prefilter:
+        with metrics.timed(times, 'prefilter'):
+            texts = prefilter_texts(texts, stats)
+    return [prepare_text(text) for text in texts], stats
+
+
+def run_doc(
+        texts: list, stats: dict, budget: float = None, workers: int = 1,
+        split_size: int = None):
+    """Run spaCy over the texts of a document and return the entities, the accepted
+    sentences and the statistics. Texts are processed one at a time and if this
+    takes more than budget seconds the remaining texts are skipped, which is
+    recorded in the statistics. If the texts are larger than split_size they are
+    spread over workers processes."""
+    t0 = time.time()
+    times = stats.setdefault('time', Counter())
     entities = {}
     paragraphs = []
-    with open(fname) as fh:
-        json_obj = json.load(fh)
-        title = get_title(json_obj)
-        abstract = get_abstract(json_obj)
-        sections = json_obj['sections']
-        run_spacy(title, entities, paragraphs)
-        run_spacy(abstract, entities, paragraphs)
-        total_size = len(title) + len(abstract)
-        if sections is not None:
-            for section in sections:
-                text = section['text']
-                total_size += len(text)
-                if total_size > MAX_SIZE:
-                    break
-                run_spacy(text, entities, paragraphs)
-    return entities, paragraphs
-
-
-def output_exists(doc: str, pos_dir: str, ner_dir: str):
-    pos_file = Path(pos_dir, f'{doc[:-5]}.txt')
+    if split_size is not None and workers > 1 and sum(len(t) for t in texts) > split_size:
+        spacy_docs = nlp.pipe(texts, n_process=workers)
+    else:
+        spacy_docs = (nlp(text) for text in texts)
+    t1 = time.perf_counter()
+    for i, spacy_doc in enumerate(spacy_docs):
+        times['spacy'] += time.perf_counter() - t1
+        with metrics.timed(times, 'filter'):
+            analyze_doc(spacy_doc, entities, paragraphs)
+        t1 = time.perf_counter()
+        if budget is not None and i + 1 < len(texts) and time.time() - t0 > budget:
+            # closing the generator also stops the processes of nlp.pipe()
+            spacy_docs.close()
+            stats['truncated'] = { 'processed': i + 1, 'total': len(texts) }
+            break
+    return entities, paragraphs, stats
+
+
+def log_doc(log, doc: str, elapsed: float, stats: dict):
+    """Write the processing time and the number of characters removed by the
+    prefilter to the log, followed by a note if the document was truncated."""
+    fields = [doc, f'{elapsed:.2f}', str(stats.get('prefiltered', 0))]
+    if 'truncated' in stats:
+        truncated = stats['truncated']
+        fields.append(f'truncated after {truncated["processed"]} of {truncated["total"]} texts')
+    line = '\t'.join(fields)
+    log.write(f'{line}\n')
+
+
+def read_texts(doc_dir: str, doc: str, stats: dict = None):
+    """Return the title, the abstract and as many sections as fit in MAX_SIZE. The
+    file is read with jsonstream, which stops reading sections once they are over
+    MAX_SIZE by themselves, the exact cut-off is done here when the sizes of the
+    title and abstract are known. The stats are handed to jsonstream.load()."""
+    fname = os.path.join(doc_dir, doc)
+    json_obj = jsonstream.load(fname, doc_spec(), stats)
+    title = get_title(json_obj)
+    abstract = get_abstract(json_obj)
+    sections = json_obj['sections']
+    texts = [title, abstract]
+    total_size = len(title) + len(abstract)
+    if sections is not None:
+        for section in sections:
+            text = section['text']
+            total_size += len(text)
+            if total_size > MAX_SIZE:
+                break
+            texts.append(text)
+    return texts
+
+
+def doc_spec():
+    """Specification for jsonstream.load() of what is needed from a document
+    structure file."""
+    size = 0
+    def take_section(section):
+        nonlocal size
+        size += len(section['text'])
+        return size <= MAX_SIZE
+    return { 'title': True, 'abstract': True, 'sections': take_section }
+
+
+def prefilter_texts(texts: list, stats: dict):
+    """Remove blocks that do not look like language from the texts before they are
+    handed to spaCy. Texts are split into blocks on empty lines and each block is
+    tokenized with a regular expression and judged with the same measures as used
+    by accept_sentence(), but with lower thresholds since a block that just misses
+    the thresholds may still contain sentences that pass them. Adds the number of
+    characters removed to stats."""
+    filtered = []
+    removed = 0
+    for text in texts:
+        blocks = BLOCK_SEPARATOR.split(text)
+        kept = [block for block in blocks if accept_block(block)]
+        if len(kept) < len(blocks):
+            removed += len(text)
+            text = '\n\n'.join(kept)
+            removed -= len(text)
+        filtered.append(text)
+    stats['prefiltered'] = stats.get('prefiltered', 0) + removed
+    return filtered
+
+
+def accept_block(block: str):
+    tokens = TOKEN_EXPRESSION.findall(block)
+    if len(tokens) < PREFILTER_MIN_TOKENS:
+        return True
+    tokens_counter = Counter(tokens)
+    average_token_length = utils.average_token_length(len(tokens), tokens_counter)
+    language_score = utils.language_score(tokens_counter, FREQUENT_ENGLISH_WORDS)
+    return (average_token_length > PREFILTER_MIN_TOKEN_LENGTH
+            and language_score > PREFILTER_MIN_LANGUAGE_SCORE)
+
+
+def output_exists(doc: str, pos_dir: str, ner_dir: str, pos_format: str = 'binary'):
+    """Return True if all outputs of the current profile exist."""
+    pos_file = Path(posfile.pos_file(pos_dir, doc, pos_format))
     ner_file = Path(ner_dir, f'{doc}')
-    return pos_file.exists() and ner_file.exists()
+    return (('pos' not in outputs() or pos_file.exists())
+            and ('ner' not in outputs() or ner_file.exists()))
 
 def get_title(json_obj):
     title = json_obj.get('title')
@@ -115,21 +502,56 @@ def get_abstract(json_obj):
     return abstract or ''
 
 
-def run_spacy(text, entities, paragraphs):
-    text = text.replace('-\n', '')
-    doc = nlp(text)
-    paragraph = []
-    for sent in doc.sents:
+def prepare_text(text: str):
+    return text.replace('-\n', '')
+
+
+def analyze_doc(doc, entities, paragraphs):
+    """Collect entities and accepted sentences from a spaCy document. Each accepted
+    sentence is added to paragraphs as a triple of the sentence text, the token
+    fields and the noun chunks, see sentence_record(). Entities and noun chunks
+    are assigned to sentences in one pass over the document because Span.ents and
+    Span.noun_chunks loop over all of the document's entities and chunks for each
+    sentence."""
+    sentences = list(doc.sents)
+    sentence_entities = spans_by_sentence(sentences, doc.ents)
+    # noun chunks require the dependency parse, which some profiles do not have
+    noun_chunks = doc.noun_chunks if doc.has_annotation('DEP') else []
+    sentence_chunks = spans_by_sentence(sentences, noun_chunks)
+    for sent, ents, chunks in zip(sentences, sentence_entities, sentence_chunks):
         if accept_sentence(sent):
-            for entity in sent.ents:
+            for entity in ents:
                 if entity.label_ in ENTITY_TYPES:
                     entities.setdefault(entity.label_, Counter())
                     entities[entity.label_][entity.text] += 1
-            # t.i, t.text, t.lemma_, t.pos_, t.tag_, t.shape_, t.ent_type_) for th]
-            tokens = [t for t in doc]
-            # nc.start, nc.end, nc
-            noun_chunks = [nc for nc in doc.noun_chunks]
-            paragraphs.append((sent, tokens, noun_chunks))
+            paragraphs.append(sentence_record(sent, chunks))
+
+
+def spans_by_sentence(sentences: list, spans):
+    """Return for each sentence the list of spans that fall completely within it,
+    spans keep the order in which they were handed in."""
+    starts = [sent.start for sent in sentences]
+    buckets = [[] for sent in sentences]
+    for span in spans:
+        i = bisect.bisect_right(starts, span.start) - 1
+        if i >= 0 and span.end <= sentences[i].end:
+            buckets[i].append(span)
+    return buckets
+
+
+def sentence_record(sent, noun_chunks: list):
+    """Returns a triple with the text of the sentence, a list with the fields of
+    each token and a list with start, end and text of each noun chunk. It contains
+    no references to the spaCy document so the document can be freed."""
+    tokens = [token_fields(t) for t in sent]
+    chunks = [(nc.start, nc.end, ' '.join(nc.text.replace('\n', '').split()))
+              for nc in noun_chunks]
+    return str(sent), tokens, chunks
+
+
+def token_fields(t):
+    ent_type = t.ent_type_ if t.ent_type_ in ENTITY_TYPES else ''
+    return t.i, t.text.strip(), t.lemma_.strip(), t.pos_, t.tag_, ent_type
 
 
 def accept_sentence(sent):
@@ -144,37 +566,44 @@ def accept_sentence(sent):
             and language_score > 0.2)
 
 
-def write_entities(ner_dir, doc, entities):
+def write_results(ner_dir, pos_dir, doc, entities, paragraphs, stats=None,
+                  pos_format='binary'):
+    """Write the outputs of the current profile. If there are statistics the time
+    spent and the number of bytes written are added to them."""
+    stats = {} if stats is None else stats
+    times = stats.setdefault('time', Counter())
+    written = 0
+    if 'ner' in outputs():
+        truncated = stats.get('truncated')
+        written += write_entities(ner_dir, doc, entities, truncated, times)
+    if 'pos' in outputs():
+        written += write_tokens(pos_dir, doc, paragraphs, pos_format, times)
+    stats['bytes_out'] = written
+
+
+def write_entities(ner_dir, doc, entities, truncated=None, times=None):
     answer = { 'name': doc, 'entities': entities }
-    with open(os.path.join(ner_dir, doc), 'w') as fh:
-        json.dump(answer, fh, indent=2)
-
-
-def write_tokens(pos_dir, doc, paragraphs):
-    txt_doc = os.path.splitext(doc)[0] + '.txt'
-    with open(os.path.join(pos_dir, txt_doc), 'w') as fh:
-        fh.write('<p>\n\n')
-        for paragraph in paragraphs:
-            s = paragraph[0]
-            fh.write(f'\n<s>\n\n{str(s)}\n\n')
-            for t in s:
-                write_token(fh, t)
-            fh.write('\n')
-            for nc in s.noun_chunks:
-                text = nc.text
-                text = text.replace('\n', '')
-                text = ' '.join(text.split())
-                fh.write(f'{nc.start}\t{nc.end}\t{text}\n')
-
-
-def write_token(fh, t):
-    text = t.text.strip()
-    lemma = t.lemma_.strip()
-    ent_type = t.ent_type_ if t.ent_type_ in ENTITY_TYPES else ''
-    elements = [t.i, text, lemma, t.pos_, t.tag_, ent_type]
-    elements = [str(e) for e in elements]
-    line = "\t".join(elements)
-    fh.write(f'{line}\n')
+    if truncated is not None:
+        answer['truncated'] = truncated
+    return write_data(os.path.join(ner_dir, doc), times,
+                      lambda: jsoncodec.dumpb(answer, pretty=True))
+
+
+def write_tokens(pos_dir, doc, paragraphs, pos_format='binary', times=None):
+    return write_data(posfile.pos_file(pos_dir, doc, pos_format), times,
+                      lambda: posfile.serialize(paragraphs, pos_format))
+
+
+def write_data(path: str, times: Counter, serialize):
+    """Write what the serialize function returns to path, timing both steps, and
+    return the number of bytes written."""
+    times = Counter() if times is None else times
+    with metrics.timed(times, 'serialize'):
+        data = serialize()
+    with metrics.timed(times, 'write'):
+        with open(path, 'wb') as fh:
+            fh.write(data)
+    return len(data)
 
 
 def parse_args():
@@ -185,6 +614,26 @@ def parse_args():
     parser.add_argument('--limit', help="Maximum number of documents to process",
                         type=int, default=sys.maxsize)
     parser.add_argument('--overwrite', help="Overwrite prior output", action='store_true')
+    parser.add_argument('--status', help="Print which documents are up to date and exit",
+                        action='store_true')
+    parser.add_argument('--prefetch', help="Documents read ahead and waiting to be written",
+                        type=int, default=4)
+    parser.add_argument('--batch-size', help="Number of documents handed to spaCy at once",
+                        type=int, default=1)
+    parser.add_argument('--workers', help="Number of spaCy processes for batches or split documents",
+                        type=int, default=1)
+    parser.add_argument('--profile', help="Pipeline profile (default: full)",
+                        choices=list(PROFILES), default=DEFAULT_PROFILE)
+    parser.add_argument('--shard', help="Only process shard I of N documents",
+                        metavar='I/N', type=utils.shard)
+    parser.add_argument('--no-prefilter', help="Do not remove non-language blocks before spaCy",
+                        dest='prefilter', action='store_false')
+    parser.add_argument('--budget', help="Maximum number of seconds spent on a document",
+                        type=float)
+    parser.add_argument('--split-size', help="Spread documents larger than N characters over workers",
+                        metavar='N', type=int)
+    parser.add_argument('--pos-format', help="Format of the POS output (default: binary)",
+                        choices=posfile.FORMATS, default='binary')
     return parser.parse_args()
 
 
@@ -192,4 +641,8 @@ def parse_args():
 if __name__ == '__main__':
 
     args = parse_args()
-    process_directory(args.doc, args.pos, args.ner, args.limit, args.overwrite)
+    process_directory(
+        args.doc, args.pos, args.ner, args.limit, args.overwrite,
+        args.batch_size, args.workers, args.profile, args.shard, args.prefilter,
+        args.budget, args.split_size, args.pos_format, args.status,
+        args.prefetch)
@@ -15,6 +15,12 @@ could be an error message.
 54d0bed0e13823b501cdbeec_input.pdf.json	0.03
 54d5354ce138238471e7f573_input.pdf.json	1.11
 
+Lines may have more fields after the time, like the number of characters removed
+by the prefilter in ner.py, and lines starting with # are header lines.
+
+For runs that wrote a metrics file, metrics.py gives more detail, including time
+per phase and latency percentiles.
+
 """
 
 import sys
@@ -26,7 +32,9 @@ for logfile in logfiles:
 	with open(logfile) as fh:
 		times = []
 		for line in fh:
-			fname, message = line.strip().split('\t', 2)
+			if not line.strip() or line.startswith('#'):
+				continue
+			fname, message = line.strip().split('\t')[:2]
 			try:
 				times.append(float(message))
 			except ValueError:
@@ -0,0 +1,311 @@
+"""Reading and writing part-of-speech files
+
+The part-of-speech output of ner.py comes in two formats:
+
+text    - the original verbose format with <p> and <s> markers, where each
+          sentence has its text, a tab-separated line for each token and a
+          tab-separated line for each noun chunk (files end in .txt)
+binary  - a compact columnar format with all strings interned in a string
+          table (files end in .pos)
+
+The binary format starts with a magic string and a version number, followed by
+a zlib-compressed body with a header of counts, the string table and arrays of
+32-bit unsigned integers for each column:
+
+    tokens        i, text, lemma, pos, tag, entity type
+    sentences     text, first token, end token
+    noun chunks   sentence, start, end, text
+
+All strings in the columns are indexes into the string table. Token start and
+end of noun chunks are spaCy token offsets as in the text format, first token
+and end token of sentences are indexes into the token columns.
+
+Consumers should use the iterators in this module, which take a file in either
+format:
+
+    tokens(path)               all tokens as Token tuples
+    sentences(path)            all sentences as Sentence tuples
+    noun_chunks(path)          all noun chunks as NounChunk tuples
+    tokens_with_pos(path, pos) all tokens with a particular part of speech
+
+To export a directory with binary files to the text format, for example for
+the term extraction code which reads the text format:
+
+$ python posfile.py --export DIR1 DIR2
+
+"""
+
+import io, os, sys, zlib, array, struct, argparse
+from collections import namedtuple
+
+
+TEXT_EXTENSION = '.txt'
+BINARY_EXTENSION = '.pos'
+
+FORMATS = ('binary', 'text')
+EXTENSIONS = { 'binary': BINARY_EXTENSION, 'text': TEXT_EXTENSION }
+
+MAGIC = b'XPOS'
+VERSION = 1
+
+# magic and version, followed by counts for strings, string bytes, tokens,
+# sentences and noun chunks
+PREAMBLE = struct.Struct('<4sB')
+HEADER = struct.Struct('<5I')
+
+TOKEN_COLUMNS = 6
+SENTENCE_COLUMNS = 3
+CHUNK_COLUMNS = 4
+
+
+Token = namedtuple('Token', ['i', 'text', 'lemma', 'pos', 'tag', 'ent_type'])
+NounChunk = namedtuple('NounChunk', ['start', 'end', 'text'])
+Sentence = namedtuple('Sentence', ['text', 'tokens', 'noun_chunks'])
+
+
+def pos_file(pos_dir: str, doc: str, pos_format: str = 'binary'):
+    """Returns the path of the part-of-speech file for a document."""
+    return os.path.join(pos_dir, os.path.splitext(doc)[0] + EXTENSIONS[pos_format])
+
+
+def write(path: str, paragraphs: list, pos_format: str = 'binary'):
+    """Write paragraphs to a file. Paragraphs are triples of the sentence text, a
+    list of token field tuples and a list of noun chunk triples, as created by
+    ner.analyze_doc()."""
+    with open(path, 'wb') as fh:
+        fh.write(serialize(paragraphs, pos_format))
+
+
+def serialize(paragraphs: list, pos_format: str = 'binary'):
+    """Returns the content of a file in the format as bytes."""
+    if pos_format == 'binary':
+        return encode(paragraphs)
+    fh = io.StringIO()
+    write_text(fh, paragraphs)
+    return fh.getvalue().encode('utf8')
+
+
+def write_text(fh, paragraphs: list):
+    fh.write('<p>\n\n')
+    for text, tokens, noun_chunks in paragraphs:
+        fh.write(f'\n<s>\n\n{text}\n\n')
+        for fields in tokens:
+            write_token(fh, fields)
+        fh.write('\n')
+        for start, end, chunk_text in noun_chunks:
+            fh.write(f'{start}\t{end}\t{chunk_text}\n')
+
+
+def write_token(fh, fields):
+    line = "\t".join([str(e) for e in fields])
+    fh.write(f'{line}\n')
+
+
+def encode(paragraphs: list):
+    """Returns the binary format for the paragraphs as bytes."""
+    strings = {}
+    def intern(string: str):
+        return strings.setdefault(string, len(strings))
+    token_columns = [array.array('I') for _ in range(TOKEN_COLUMNS)]
+    sentence_columns = [array.array('I') for _ in range(SENTENCE_COLUMNS)]
+    chunk_columns = [array.array('I') for _ in range(CHUNK_COLUMNS)]
+    for n, (text, tokens, noun_chunks) in enumerate(paragraphs):
+        sentence_columns[0].append(intern(text))
+        sentence_columns[1].append(len(token_columns[0]))
+        for i, *fields in tokens:
+            token_columns[0].append(i)
+            for column, field in zip(token_columns[1:], fields):
+                column.append(intern(field))
+        sentence_columns[2].append(len(token_columns[0]))
+        for start, end, chunk_text in noun_chunks:
+            for column, value in zip(chunk_columns, (n, start, end, intern(chunk_text))):
+                column.append(value)
+    encoded = [string.encode('utf8') for string in strings]
+    offsets = array.array('I', [0])
+    for string in encoded:
+        offsets.append(offsets[-1] + len(string))
+    header = HEADER.pack(len(encoded), offsets[-1], len(token_columns[0]),
+                         len(sentence_columns[0]), len(chunk_columns[0]))
+    body = [header, little_endian(offsets), b''.join(encoded)]
+    body.extend(little_endian(column) for column in token_columns)
+    body.extend(little_endian(column) for column in sentence_columns)
+    body.extend(little_endian(column) for column in chunk_columns)
+    return PREAMBLE.pack(MAGIC, VERSION) + zlib.compress(b''.join(body), 1)
+
+
+def little_endian(column: array.array):
+    if sys.byteorder != 'little':
+        column = array.array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+class PosDocument:
+
+    """The content of a binary part-of-speech file, with the string table and
+    the columns decoded into lists."""
+
+    def __init__(self, data: bytes):
+        magic, version = PREAMBLE.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError('not a binary part-of-speech file')
+        if version != VERSION:
+            raise ValueError(f'unsupported part-of-speech file version {version}')
+        body = zlib.decompress(data[PREAMBLE.size:])
+        n_strings, n_bytes, n_tokens, n_sentences, n_chunks = HEADER.unpack_from(body)
+        offset = HEADER.size
+        offsets, offset = read_column(body, offset, n_strings + 1)
+        blob = body[offset:offset + n_bytes]
+        offset += n_bytes
+        self.strings = [blob[offsets[n]:offsets[n+1]].decode('utf8')
+                        for n in range(n_strings)]
+        self.token_columns = []
+        for _ in range(TOKEN_COLUMNS):
+            column, offset = read_column(body, offset, n_tokens)
+            self.token_columns.append(column)
+        self.sentence_columns = []
+        for _ in range(SENTENCE_COLUMNS):
+            column, offset = read_column(body, offset, n_sentences)
+            self.sentence_columns.append(column)
+        self.chunk_columns = []
+        for _ in range(CHUNK_COLUMNS):
+            column, offset = read_column(body, offset, n_chunks)
+            self.chunk_columns.append(column)
+
+    def tokens(self, start: int = 0, end: int = None):
+        strings = self.strings
+        i, text, lemma, pos, tag, ent_type = self.token_columns
+        for n in range(start, len(i) if end is None else end):
+            yield Token(i[n], strings[text[n]], strings[lemma[n]],
+                        strings[pos[n]], strings[tag[n]], strings[ent_type[n]])
+
+    def noun_chunks(self):
+        strings = self.strings
+        for _, start, end, text in zip(*self.chunk_columns):
+            yield NounChunk(start, end, strings[text])
+
+    def sentences(self):
+        chunks = [[] for _ in self.sentence_columns[0]]
+        for sentence, start, end, text in zip(*self.chunk_columns):
+            chunks[sentence].append(NounChunk(start, end, self.strings[text]))
+        for n, (text, first, end) in enumerate(zip(*self.sentence_columns)):
+            yield Sentence(self.strings[text], list(self.tokens(first, end)), chunks[n])
+
+    def tokens_with_pos(self, pos: str):
+        """Only the tokens with the part of speech, this compares integers in the
+        part-of-speech column and only builds tokens for the matches."""
+        try:
+            pos_id = self.strings.index(pos)
+        except ValueError:
+            return
+        for n, value in enumerate(self.token_columns[3]):
+            if value == pos_id:
+                yield from self.tokens(n, n + 1)
+
+
+def read_column(body: bytes, offset: int, length: int):
+    column = array.array('I')
+    end = offset + length * column.itemsize
+    column.frombytes(body[offset:end])
+    if sys.byteorder != 'little':
+        column.byteswap()
+    return column, end
+
+
+def read(path: str):
+    """Returns a PosDocument for a binary file."""
+    with open(path, 'rb') as fh:
+        return PosDocument(fh.read())
+
+
+def is_binary(path: str):
+    with open(path, 'rb') as fh:
+        return fh.read(len(MAGIC)) == MAGIC
+
+
+def read_text_sentences(path: str):
+    """Read sentences from a file in the text format. Lines with six tab-separated
+    fields are tokens and lines with three are noun chunks, all other lines after
+    an <s> marker and before the first token are the text of the sentence."""
+    sentence = None
+    with open(path) as fh:
+        for line in fh:
+            line = line.rstrip('\n')
+            if line == '<s>':
+                if sentence is not None:
+                    yield finish_sentence(*sentence)
+                sentence = ([], [], [])
+                continue
+            if sentence is None:
+                continue
+            fields = line.split('\t')
+            if len(fields) == TOKEN_COLUMNS and fields[0].isdigit():
+                fields[0] = int(fields[0])
+                sentence[1].append(Token(*fields))
+            elif len(fields) == 3 and fields[0].isdigit() and fields[1].isdigit():
+                sentence[2].append(NounChunk(int(fields[0]), int(fields[1]), fields[2]))
+            elif not sentence[1]:
+                sentence[0].append(line)
+    if sentence is not None:
+        yield finish_sentence(*sentence)
+
+
+def finish_sentence(lines: list, tokens: list, noun_chunks: list):
+    return Sentence('\n'.join(lines).strip('\n'), tokens, noun_chunks)
+
+
+def sentences(path: str):
+    if is_binary(path):
+        yield from read(path).sentences()
+    else:
+        yield from read_text_sentences(path)
+
+
+def tokens(path: str):
+    if is_binary(path):
+        yield from read(path).tokens()
+    else:
+        for sentence in read_text_sentences(path):
+            yield from sentence.tokens
+
+
+def noun_chunks(path: str):
+    if is_binary(path):
+        yield from read(path).noun_chunks()
+    else:
+        for sentence in read_text_sentences(path):
+            yield from sentence.noun_chunks
+
+
+def tokens_with_pos(path: str, pos: str):
+    if is_binary(path):
+        yield from read(path).tokens_with_pos(pos)
+    else:
+        for token in tokens(path):
+            if token.pos == pos:
+                yield token
+
+
+def export(in_dir: str, out_dir: str):
+    """Write all binary files in in_dir to out_dir in the text format."""
+    os.makedirs(out_dir, exist_ok=True)
+    for fname in sorted(os.listdir(in_dir)):
+        if not fname.endswith(BINARY_EXTENSION):
+            continue
+        paragraphs = [(s.text, s.tokens, s.noun_chunks)
+                      for s in read(os.path.join(in_dir, fname)).sentences()]
+        write(pos_file(out_dir, fname, 'text'), paragraphs, 'text')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Part-of-speech file utilities')
+    parser.add_argument('--export', help="export binary files in DIR1 to text files in DIR2",
+                        nargs=2, metavar=('DIR1', 'DIR2'))
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+    if args.export:
+        export(*args.export)
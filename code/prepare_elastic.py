@@ -2,15 +2,54 @@
 
 Takes the output of the merge.py script and creates input for ElasticSearch. 
 
-$ python prepare_elastic.py -i INDIR -o OUTDIR [--tags DOMAIN] [--limit N]
+$ python prepare_elastic.py -i INDIR -o OUTDIR [--tags DOMAIN] [--limit N] [--shard I/N]
+                            [--trm PATH] [--workers N] [--compress gzip|zstd] [--delta]
+                            [--schema flat|typed]
 
 Assumes that INDIR containes the merged files and creates OUTDIR/elastic.json,
-which can be used for a bulk import.
+which can be used for a bulk import. INDIR can also have a JSON lines store written
+by merge.py --out-format jsonl (see mergedstore.py).
+
+With --compress gzip or --compress zstd the bulk file is compressed while it is
+written, creating OUTDIR/elastic.json.gz or OUTDIR/elastic.json.zst, in blocks
+that can be decompressed on their own (see bulkfile.py). Zstd needs the zstandard
+package.
+
+With --delta a second bulk file OUTDIR/elastic-delta.json is written with only the
+changes since the last run: index actions for documents that are new or changed
+according to the manifest and delete actions for documents that are in the
+manifest but not in INDIR anymore (documents left out by --limit are not deleted).
+This file can be loaded into an index that has the previous bulk file. The full
+bulk file is written as usual, and a summary of the changes with the identifiers
+of the documents is written to OUTDIR/elastic-delta.summary.json.
+
+With --schema typed the terms and entities are written as objects with numeric
+counts and scores instead of as lists of strings, the index for this needs the
+mapping from elasticschema.py.
 
 The --tags option takes a comma-separated string where each string is added as a
 tag to each document (this is pending the addition of pre-processing functionality
 to classify documents into domains). Using --limit you can restinctprocessing to
-the first N documents from INDIR.
+the first N documents from INDIR. With --shard I/N only documents in shard I of N
+are used and the output is written to OUTDIR/elastic-shard-I-of-N.json.
+
+The conversion is incremental. A manifest next to the bulk file records a hash of
+each merged file (see manifest.py) and lines for documents that did not change
+are copied from the previous bulk file. Use --overwrite to convert all documents
+and --status to see what is up to date.
+
+With --trm PATH the terms are taken from the term store in PATH (see termstore.py)
+instead of from the merged files, so that new terms can be used without merging
+again. Terms are read from the store one document at a time.
+
+The time spent reading, decoding, building and writing each converted document is
+written to a metrics file in the logs directory (see metrics.py).
+
+With --workers N documents are converted by N processes, which hand back the bulk
+lines of each document as bytes. The lines are written by the main process in the
+order of the documents, so the bulk file is the same as for a sequential run. Use
+"python benchmark.py elastic" to see the throughput for different numbers of
+workers.
 
 Uses the following fields:
 - name
@@ -44,11 +83,27 @@ $ curl -X GET "http://localhost:9200/test/_mapping?pretty"
 
 """
 
-import os, sys, json, argparse
-from utils import create_elastic_object
+import os, sys, argparse
+from collections import Counter
+import utils, bulkfile, elasticschema, jsoncodec, manifest, mergedstore, metrics, termstore
+from config import MERGED_FIELDS
 
 ELASTIC_FILE = 'elastic.json'
 
+# Version of the bulk lines, which is part of the manifest settings. Increase it
+# when a code change changes the output, so that all documents become stale.
+VERSION = 1
+
+# Added to the name of the bulk file for the file with the changes, see --delta.
+DELTA = '-delta'
+
+# Number of documents handed to a worker process at once.
+WORKER_CHUNK_SIZE = 16
+
+# The merged documents, the terms, the tags and the schema used by convert_doc(),
+# which are set by prepare() before worker processes are forked.
+SHARED = {}
+
 
 def parse_args():
     def tags(tagstring: str):
@@ -61,29 +116,229 @@ def parse_args():
         '--tags', help="comma-separated list of tags", default=[], type=tags)
     parser.add_argument(
         '--limit', help="number of documents to process", default=sys.maxsize, type=int)
+    parser.add_argument(
+        '--shard', help="only process shard I of N documents", metavar='I/N', type=utils.shard)
+    parser.add_argument(
+        '--overwrite', help="convert all documents, not just changed ones", action='store_true')
+    parser.add_argument(
+        '--trm', metavar='PATH', help="term directory, use its terms instead of the merged terms")
+    parser.add_argument(
+        '--status', help="print which documents are up to date and exit", action='store_true')
+    parser.add_argument(
+        '--workers', help="number of processes converting documents", type=int, default=1)
+    parser.add_argument(
+        '--compress', help="compress the bulk file", choices=bulkfile.COMPRESSIONS)
+    parser.add_argument(
+        '--delta', help="also write a bulk file with the changes since the last run",
+        action='store_true')
+    parser.add_argument(
+        '--schema', help="schema of the documents, see elasticschema.py",
+        choices=elasticschema.SCHEMAS, default=elasticschema.FLAT)
     return parser.parse_args()
 
 
-def prepare(indir: str, outdir: str, tags: list, limit: int):
-    fnames = [os.path.join(indir, fname) for fname in os.listdir(indir)]
-    elastic_fname = os.path.join(outdir, ELASTIC_FILE)
+def prepare(indir: str, outdir: str, tags: list, limit: int, shard: tuple = None,
+            overwrite: bool = False, status: bool = False, trm_dir: str = None,
+            workers: int = 1, compress: str = None, delta: bool = False,
+            schema: str = elasticschema.FLAT):
+    """Write the bulk file for all merged documents in indir. Unless overwrite is set,
+    the lines of documents that did not change since the last run, according to
+    the manifest, are copied from the previous bulk file instead of being created
+    again. With status set only a report on this is printed. With a term directory
+    the terms are taken from its term store instead of from the merged files. With
+    more than one worker documents are converted in a pool of worker processes. With
+    compress set to gzip or zstd the bulk file is compressed. With delta set a bulk
+    file with the changes since the last run and a summary of them are written. The
+    schema is one of the schemas in elasticschema.py."""
+    store = mergedstore.open_merged(indir)
+    # manifest keys are the names of the merged files, also for a store
+    fnames = [name + '.json' for name in store.names()]
+    # all documents of the shard, --limit does not make the others deleted documents
+    available = set(utils.select_shard(fnames, shard))
+    fnames = sorted(available)[:limit]
+    elastic_fname = os.path.join(outdir, elastic_file(shard, compress))
+    settings = { 'tags': tags, 'MERGED_FIELDS': MERGED_FIELDS,
+                 'JSON_CODEC': jsoncodec.backend(), 'VERSION': VERSION }
+    if schema != elasticschema.FLAT:
+        settings['schema'] = schema
+    terms = None
+    if trm_dir is not None:
+        terms = termstore.open_store(trm_dir)
+        settings['terms'] = termstore.STORE_FILE
+    ela_manifest = manifest.Manifest(
+        manifest.manifest_file(os.path.join(outdir, os.path.splitext(elastic_file(shard))[0])),
+        'prepare_elastic',
+        settings)
+    previous = index_bulk_file(elastic_fname)
+    hashes = {fname: input_hash(store, document_name(fname), terms) for fname in fnames}
+    statuses = {
+        fname: ela_manifest.status(fname, hashes[fname], document_name(fname) in previous)
+        for fname in fnames }
+    if status:
+        manifest.print_status('prepare_elastic.py', statuses)
+        return
+    # compared to the manifest before it is updated
+    changes = compare(ela_manifest, fnames, hashes, available)
     print(f'Creating elastic bulk file {elastic_fname}')
     os.makedirs(outdir, exist_ok=True)
-    with open(elastic_fname, 'w') as fh:
-        for n, fname in enumerate(sorted(fnames)):
+    tmp_fname = elastic_fname + '.tmp'
+    reused = 0
+    metrics_fname = metrics.metrics_file('prepare_elastic', utils.shard_suffix(shard))
+    to_convert = [fname for fname in fnames
+                  if overwrite or statuses[fname] != manifest.UP_TO_DATE]
+    # the store is closed so that forked workers do not share its file handles
+    store.close()
+    SHARED.update(store=store, terms=terms, tags=tags, schema=schema)
+    delta_fname = os.path.join(outdir, elastic_file(shard, compress, DELTA))
+    with bulkfile.open_write(tmp_fname, compress) as fh, open_previous(elastic_fname, previous) as old, \
+            metrics.MetricsFile(metrics_fname, 'prepare_elastic') as doc_metrics, \
+            open_delta(delta_fname + '.tmp', compress, delta) as delta_fh:
+        # results come back in the order of to_convert, which is the order of fnames
+        results = utils.map_docs(convert_doc, to_convert, workers, WORKER_CHUNK_SIZE)
+        converted = set(to_convert)
+        for n, fname in enumerate(fnames):
             if n and n % 100 == 0:
                 print(n, end=' ')
-            if n + 1 > limit:
-                break
-            json_obj = json.load(open(fname))
-            elastic_obj = create_elastic_object(json_obj, tags)
-            fh.write(json.dumps({"index": {"_id": json_obj['name']}}) + '\n')
-            fh.write(json.dumps(elastic_obj) + '\n')
+            if fname not in converted:
+                offset, length = previous[document_name(fname)]
+                old.seek(offset)
+                fh.write(old.read(length))
+                reused += 1
+                continue
+            data, times, bytes_in = next(results)
+            with metrics.timed(times, 'write'):
+                fh.write(data)
+                if delta and fname not in changes['unchanged']:
+                    delta_fh.write(data)
+            doc_metrics.record(fname, times, bytes_in, len(data))
+            ela_manifest.update(fname, hashes[fname])
         print()
-        fh.write('\n')
+        fh.write(b'\n')
+        if delta:
+            for doc in changes['deleted']:
+                delta_fh.write(jsoncodec.dumpb({"delete": {"_id": document_name(doc)}}) + b'\n')
+            delta_fh.write(b'\n')
+    store.close()
+    os.replace(tmp_fname, elastic_fname)
+    if delta:
+        os.replace(delta_fname + '.tmp', delta_fname)
+        write_delta_summary(
+            os.path.join(outdir, delta_summary_file(shard)), elastic_fname, delta_fname, changes)
+    # documents that were deleted from indir should not be in the manifest
+    for doc in changes['deleted']:
+        ela_manifest.remove(doc)
+    ela_manifest.save()
+    print(f'Copied {reused} unchanged documents from the previous bulk file')
+
+
+def compare(ela_manifest: manifest.Manifest, fnames: list, hashes: dict, available: set):
+    """Compare the documents to the manifest of the previous run and return a
+    dictionary with the new, changed, unchanged and deleted documents. Documents
+    are deleted if they are in the manifest but not in available, which has all
+    documents in the input for the shard, also those not selected by the limit."""
+    changes = { 'new': [], 'changed': [], 'unchanged': set(), 'deleted': [] }
+    for fname in fnames:
+        if fname not in ela_manifest.documents:
+            changes['new'].append(fname)
+        elif not ela_manifest.is_current(fname, hashes[fname]):
+            changes['changed'].append(fname)
+        else:
+            changes['unchanged'].add(fname)
+    changes['deleted'] = sorted(set(ela_manifest.documents) - available)
+    return changes
+
+
+def write_delta_summary(fname: str, elastic_fname: str, delta_fname: str, changes: dict):
+    """Write a JSON file with the number of documents and the identifiers of the new,
+    changed and deleted documents, and print the numbers."""
+    counts = {change: len(docs) for change, docs in changes.items()}
+    summary = {
+        'created': utils.timestamp(),
+        'bulk_file': os.path.basename(elastic_fname),
+        'delta_file': os.path.basename(delta_fname),
+        'counts': counts }
+    for change in ('new', 'changed', 'deleted'):
+        summary[change] = [document_name(doc) for doc in changes[change]]
+    jsoncodec.dump(summary, fname, pretty=True)
+    print(f'Wrote {delta_fname} with {counts["new"]} new, {counts["changed"]} changed'
+          f' and {counts["deleted"]} deleted documents')
+
+
+def open_delta(fname: str, compress: str, delta: bool):
+    if not delta:
+        return open(os.devnull, 'wb')
+    return bulkfile.open_write(fname, compress)
+
+
+def convert_doc(fname: str):
+    """Return the bulk lines for a merged document as bytes, with the times spent on
+    each step and the number of bytes read, using the store, terms, tags and schema
+    in SHARED.
+    This runs in the worker processes when there is more than one worker."""
+    name = document_name(fname)
+    times = Counter()
+    with metrics.timed(times, 'read'):
+        text = SHARED['store'].read_bytes(name)
+    with metrics.timed(times, 'decode'):
+        json_obj = jsoncodec.loads(text)
+    if SHARED['terms'] is not None:
+        with metrics.timed(times, 'read'):
+            json_obj['terms'] = SHARED['terms'].get(name, [])
+    with metrics.timed(times, 'build'):
+        elastic_obj = elasticschema.create_object(json_obj, SHARED['tags'], SHARED['schema'])
+    with metrics.timed(times, 'serialize'):
+        data = (jsoncodec.dumpb({"index": {"_id": json_obj['name']}}) + b'\n'
+                + jsoncodec.dumpb(elastic_obj) + b'\n')
+    return data, times, len(text)
+
+
+def input_hash(store, name: str, terms: termstore.TermStore = None):
+    """Returns a hash of the merged document and, if there is a term store, of the
+    terms of the document."""
+    if terms is None:
+        return store.input_hash(name)
+    return manifest.data_hash([store.input_hash(name), terms.get(name, [])])
+
+
+def document_name(fname: str):
+    return os.path.splitext(os.path.basename(fname))[0]
+
+
+def index_bulk_file(elastic_fname: str):
+    """Returns a dictionary with the offset and length in bytes of the action and
+    source lines for each document in an existing bulk file."""
+    index = {}
+    if not os.path.exists(elastic_fname):
+        return index
+    offset = 0
+    with bulkfile.open_read(elastic_fname) as fh:
+        for line in fh:
+            if line.startswith(b'{"index"'):
+                identifier = jsoncodec.loads(line)['index']['_id']
+                source = fh.readline()
+                index[identifier] = (offset, len(line) + len(source))
+                offset += len(source)
+            offset += len(line)
+    return index
+
+
+def open_previous(elastic_fname: str, previous: dict):
+    if not previous:
+        return open(os.devnull, 'rb')
+    return bulkfile.open_read(elastic_fname)
+
+
+def elastic_file(shard: tuple = None, compress: str = None, kind: str = ''):
+    base, ext = os.path.splitext(ELASTIC_FILE)
+    return f'{base}{kind}{utils.shard_suffix(shard)}{ext}{bulkfile.extension(compress)}'
+
+
+def delta_summary_file(shard: tuple = None):
+    base = os.path.splitext(ELASTIC_FILE)[0]
+    return f'{base}{DELTA}{utils.shard_suffix(shard)}.summary.json'
 
 
 if __name__ in '__main__':
 
     args = parse_args()
-    prepare(args.i, args.o, args.tags, args.limit)
+    prepare(args.i, args.o, args.tags, args.limit, args.shard, args.overwrite, args.status, args.trm, args.workers, args.compress, args.delta, args.schema)
@@ -16,7 +16,7 @@ total_time_in_outliers = 0
 
 for line in open(logfile):
 	try:
-		fname, time = line.strip().split('\t')
+		fname, time = line.strip().split('\t')[:2]
 		file_number += 1
 		time = float(time)
 		total_time += int(time)
@@ -53,8 +53,10 @@ elif [ $mode == 'ner' ]; then
 elif [ $mode == 'trm' ]; then
 
 	echo "Running term extraction"
+	# term extraction reads the text format of the part-of-speech output
+	python posfile.py --export $data/output/pos $data/output/pos-txt
 	cd ../../xdd-terms/code
-	python pos2phr.py --pos $data/output/pos --out /$data/output/trm
+	python pos2phr.py --pos $data/output/pos-txt --out /$data/output/trm
 	python accumulate.py --terms $data/output/trm
 
 elif [ $mode == 'cla' ]; then
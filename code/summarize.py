@@ -0,0 +1,262 @@
+"""Creating summaries
+
+Creates an extractive summary for each document structure file, to be used as the
+summary layer for merge.py (--sum). The summary is the data that ElasticSearch
+returns for ranking, so it is bounded by SUMMARY_MAX_TOKENS from the config file.
+
+$ python summarize.py --doc DIR1 [--pos DIR2] --out DIR3 [--limit N] [--shard I/N]
+                      [--workers N] [--max-tokens N] [--overwrite] [--status]
+
+For each document in DIR1 a file IDENTIFIER.txt is written to DIR3. The summary
+starts with the abstract and is filled up with the highest scoring sentences from
+the sections, in the order in which they appear in the document, until adding
+another sentence would go over the maximum number of tokens (whitespace separated
+words). An abstract that is too long by itself is cut off.
+
+Sentences are scored on the frequency in the document of their content words,
+which are the words not in the list of frequent English words from frequencies.py.
+When there is a part-of-speech directory from ner.py (in either format, see
+posfile.py), its sentences are used and the content words are the lemmas of the
+nouns, proper nouns, verbs and adjectives. Otherwise the sections are split into
+sentences with a regular expression. Very short and very long sentences, which
+tend to be headers, captions or tables, are not used.
+
+With --workers N documents are summarized by N processes. As with the other
+stages, a manifest next to DIR3 makes reruns incremental, --status prints what is
+up to date, --shard I/N processes one shard and a metrics file is written to the
+logs directory.
+
+"""
+
+import os, re, sys, argparse
+from collections import Counter
+import utils, frequencies, jsonstream, manifest, metrics, posfile
+from config import SUMMARY_MAX_TOKENS
+
+# Version of the summaries, which is part of the manifest settings. Increase it
+# when a code change changes the output, so that all documents become stale.
+VERSION = 1
+
+# a limit on how much text is read from the sections of a document
+MAX_SIZE = 100000
+
+# sentences with fewer or more tokens than this are not used
+MIN_SENTENCE_TOKENS = 6
+MAX_SENTENCE_TOKENS = 80
+
+# parts of speech of the content words when there is POS data
+CONTENT_POS = {'NOUN', 'PROPN', 'VERB', 'ADJ'}
+
+FREQUENT_ENGLISH_WORDS = set(
+    [line.split()[1] for line in frequencies.FREQUENCIES.split('\n') if line])
+
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9])')
+WORD_EXPRESSION = re.compile(r'[^\W\d_]{3,}')
+
+# Number of documents handed to a worker process at once.
+WORKER_CHUNK_SIZE = 16
+
+# The input and output directories and the maximum number of tokens used by
+# summarize_doc(), which are set by summarize_directory() before worker processes
+# are forked.
+SHARED = {}
+
+
+def summarize_directory(
+        doc_dir: str, pos_dir: str, out_dir: str, limit: int = sys.maxsize,
+        shard: tuple = None, overwrite: bool = False, status: bool = False,
+        workers: int = 1, max_tokens: int = SUMMARY_MAX_TOKENS):
+    """Write a summary for each document in doc_dir to out_dir, using the sentences
+    in pos_dir if it is given. Unless overwrite is set, documents are skipped if
+    according to the manifest their input did not change since the last run. With
+    status set only a report on this is printed. With more than one worker
+    documents are summarized in a pool of worker processes."""
+    docs = utils.select_shard(sorted(os.listdir(doc_dir)), shard)[:limit]
+    settings = { 'max_tokens': max_tokens, 'pos': pos_dir is not None,
+                 'MAX_SIZE': MAX_SIZE, 'MIN_SENTENCE_TOKENS': MIN_SENTENCE_TOKENS,
+                 'MAX_SENTENCE_TOKENS': MAX_SENTENCE_TOKENS, 'VERSION': VERSION }
+    sum_manifest = manifest.Manifest(
+        manifest.manifest_file(out_dir, shard), 'summarize', settings)
+    hashes = {doc: manifest.file_hash(*input_files(doc_dir, pos_dir, doc)) for doc in docs}
+    statuses = {
+        doc: sum_manifest.status(
+            doc, hashes[doc], os.path.exists(summary_file(out_dir, doc)))
+        for doc in docs }
+    if status:
+        manifest.print_status('summarize.py', statuses)
+        return
+    if not overwrite:
+        docs = [doc for doc in docs if statuses[doc] != manifest.UP_TO_DATE]
+    os.makedirs(out_dir, exist_ok=True)
+    SHARED.update(doc_dir=doc_dir, pos_dir=pos_dir, out_dir=out_dir, max_tokens=max_tokens)
+    print(f'Summarizing {len(docs)} documents from {doc_dir}')
+    metrics_fname = metrics.metrics_file('summarize', utils.shard_suffix(shard))
+    log_fname = f'logs/summarize-{utils.timestamp()}{utils.shard_suffix(shard)}.log'
+    with open(log_fname, 'w') as log, \
+            metrics.MetricsFile(metrics_fname, 'summarize') as doc_metrics:
+        results = utils.map_docs(summarize_doc, docs, workers, WORKER_CHUNK_SIZE)
+        for n, (doc, error, times, bytes_in, bytes_out) in enumerate(results):
+            if n and n % 100 == 0:
+                print(n, end=' ', flush=True)
+            if error is None:
+                sum_manifest.update(doc, hashes[doc])
+            else:
+                log.write(f'{doc} -- {error}\n')
+            doc_metrics.record(doc, times, bytes_in, bytes_out, error)
+        print()
+    sum_manifest.save()
+
+
+def summarize_doc(doc: str):
+    """Create the summary for a document and write it to the output directory, using
+    the directories and the maximum number of tokens in SHARED. Returns the document,
+    an error message or None, the times and the number of bytes read and written.
+    This runs in the worker processes when there is more than one worker."""
+    times = Counter()
+    fnames = input_files(SHARED['doc_dir'], SHARED['pos_dir'], doc)
+    bytes_in = metrics.file_size(*fnames)
+    try:
+        with metrics.timed(times, 'read'):
+            json_obj = jsonstream.load(fnames[0], doc_spec())
+            abstract = get_abstract(json_obj)
+            if len(fnames) > 1 and os.path.exists(fnames[1]):
+                sentences = pos_sentences(fnames[1], abstract)
+            else:
+                sentences = text_sentences(
+                    [section['text'] for section in json_obj.get('sections') or []])
+        with metrics.timed(times, 'summarize'):
+            summary = summarize(abstract, sentences, SHARED['max_tokens'])
+        with metrics.timed(times, 'write'):
+            with open(summary_file(SHARED['out_dir'], doc), 'w', encoding='utf8') as fh:
+                bytes_out = fh.write(summary)
+        return doc, None, times, bytes_in, bytes_out
+    except Exception as e:
+        return doc, f'{type(e).__name__} - {e}', times, bytes_in, 0
+
+
+def input_files(doc_dir: str, pos_dir: str, doc: str):
+    fnames = [os.path.join(doc_dir, doc)]
+    if pos_dir is not None:
+        fnames.append(pos_path(pos_dir, doc))
+    return fnames
+
+
+def pos_path(pos_dir: str, doc: str):
+    """Returns the path of the POS file of the document, in the binary format if it
+    exists and in the text format otherwise."""
+    path = posfile.pos_file(pos_dir, doc, 'binary')
+    if os.path.exists(path):
+        return path
+    return posfile.pos_file(pos_dir, doc, 'text')
+
+
+def summary_file(out_dir: str, doc: str):
+    return os.path.join(out_dir, os.path.splitext(doc)[0] + '.txt')
+
+
+def doc_spec():
+    """Specification for jsonstream.load() of what is needed from a document
+    structure file, sections are read up to MAX_SIZE characters."""
+    size = 0
+    def take_section(section):
+        nonlocal size
+        size += len(section['text'])
+        return size <= MAX_SIZE
+    return { 'abstract': True, 'sections': take_section }
+
+
+def get_abstract(json_obj: dict):
+    abstract = json_obj.get('abstract')
+    abstract = '' if abstract is None else abstract.get('abstract')
+    return ' '.join((abstract or '').split())
+
+
+def pos_sentences(path: str, abstract: str = ''):
+    """Returns pairs of a sentence and its content words from a POS file, skipping
+    sentences that are in the abstract."""
+    sentences = []
+    for sentence in posfile.sentences(path):
+        text = ' '.join(sentence.text.split())
+        if not text or text in abstract:
+            continue
+        words = [token.lemma.lower() for token in sentence.tokens
+                 if token.pos in CONTENT_POS and token.lemma.lower() not in FREQUENT_ENGLISH_WORDS]
+        sentences.append((text, words))
+    return sentences
+
+
+def text_sentences(texts: list):
+    """Returns pairs of a sentence and its content words from the texts, which are
+    split into sentences with a regular expression."""
+    sentences = []
+    for text in texts:
+        for sentence in SENTENCE_BOUNDARY.split(text):
+            sentence = ' '.join(sentence.replace('-\n', '').split())
+            if not sentence:
+                continue
+            words = [word for word in WORD_EXPRESSION.findall(sentence.lower())
+                     if word not in FREQUENT_ENGLISH_WORDS]
+            sentences.append((sentence, words))
+    return sentences
+
+
+def summarize(abstract: str, sentences: list, max_tokens: int = SUMMARY_MAX_TOKENS):
+    """Returns a summary of at most max_tokens tokens, with the abstract followed by
+    the sentences with the highest scores, in their original order. Sentences are
+    pairs of a text and a list of content words."""
+    tokens = abstract.split()
+    if len(tokens) >= max_tokens:
+        return ' '.join(tokens[:max_tokens])
+    budget = max_tokens - len(tokens)
+    counts = Counter(word for _, words in sentences for word in words)
+    scored = []
+    for n, (text, words) in enumerate(sentences):
+        length = len(text.split())
+        if not words or not MIN_SENTENCE_TOKENS <= length <= MAX_SENTENCE_TOKENS:
+            continue
+        score = sum(counts[word] for word in set(words)) / length
+        scored.append((-score, n, length))
+    selected = []
+    for _, n, length in sorted(scored):
+        if length <= budget:
+            selected.append(n)
+            budget -= length
+    parts = [abstract] if abstract else []
+    parts.extend(sentences[n][0] for n in sorted(selected))
+    return ' '.join(parts)
+
+
+def truncate(summary: str, max_tokens: int = SUMMARY_MAX_TOKENS):
+    """Returns the summary cut off after max_tokens tokens, a shorter summary is
+    returned unchanged."""
+    tokens = summary.split()
+    if len(tokens) <= max_tokens:
+        return summary
+    return ' '.join(tokens[:max_tokens])
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Creating extractive summaries')
+    parser.add_argument('--doc', help="directory with document structure parses")
+    parser.add_argument('--pos', help="directory with part-of-speech data (optional)")
+    parser.add_argument('--out', help="output directory")
+    parser.add_argument('--limit', help="Maximum number of documents to process",
+                        type=int, default=sys.maxsize)
+    parser.add_argument('--shard', help="Only process shard I of N documents",
+                        metavar='I/N', type=utils.shard)
+    parser.add_argument('--workers', help="Number of processes summarizing documents",
+                        type=int, default=1)
+    parser.add_argument('--max-tokens', help="Maximum number of tokens in a summary",
+                        type=int, default=SUMMARY_MAX_TOKENS)
+    parser.add_argument('--overwrite', help="Summarize all documents, not just changed ones",
+                        action='store_true')
+    parser.add_argument('--status', help="Print which documents are up to date and exit",
+                        action='store_true')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+    summarize_directory(args.doc, args.pos, args.out, args.limit, args.shard,
+                        args.overwrite, args.status, args.workers, args.max_tokens)
@@ -0,0 +1,240 @@
+"""Indexed store for term frequencies
+
+Term extraction writes all terms for a topic to one frequencies.json file, which
+maps document identifiers to lists of [term, count, score] triples. Loading that
+file is the largest allocation in merge.py while each document only needs its own
+terms. This module converts frequencies.json into a binary store next to it,
+frequencies.terms, with random access to the terms of a document.
+
+The store starts with a magic string and a version number, followed by a header
+with the size and modification time of the frequencies.json it was created from
+and the counts of terms, documents and entries. Then come arrays of little-endian
+numbers and two blobs with UTF-8 strings:
+
+    term offsets     offsets of the terms in the term blob
+    doc offsets      offsets of the document identifiers in the document blob
+    entry offsets    for each document the index of its first entry
+    term ids         for each entry the index of the term
+    counts           for each entry the count
+    scores           for each entry the score, as a double
+    term blob        all terms, each term is stored once
+    document blob    all document identifiers, in sorted order
+
+The file is memory-mapped and documents are found with a binary search, only the
+terms of the documents that are looked up are decoded. Because the file is mapped
+read-only, a store opened before forking worker processes is shared with them.
+
+To convert a frequencies file:
+
+$ python termstore.py DIR/frequencies.json
+
+The store is also created when a script opens a term directory with open_store()
+and there is no store yet or frequencies.json changed.
+
+"""
+
+import os, sys, mmap, array, struct, bisect, argparse
+import jsonstream
+from posfile import little_endian
+
+
+JSON_FILE = 'frequencies.json'
+STORE_FILE = 'frequencies.terms'
+
+MAGIC = b'XTRM'
+VERSION = 1
+
+# magic and version, size and modification time of the source file, and counts
+# for terms, term bytes, documents, document bytes and entries
+PREAMBLE = struct.Struct('<4sB')
+HEADER = struct.Struct('<2Q5I')
+
+
+def open_store(trm_dir: str):
+    """Returns a TermStore for the term directory, creating or updating the store
+    from frequencies.json if needed."""
+    json_file = os.path.join(trm_dir, JSON_FILE)
+    store_file = os.path.join(trm_dir, STORE_FILE)
+    if os.path.exists(json_file) and not is_current(json_file, store_file):
+        print(f'Converting {json_file}...')
+        convert(json_file, store_file)
+    return TermStore(store_file)
+
+
+class TermStore:
+
+    """Lookup of the terms of a document in a store. Use get() like the get method
+    of the dictionary in frequencies.json."""
+
+    def __init__(self, fname: str):
+        self.fname = fname
+        with open(fname, 'rb') as fh:
+            self.data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = PREAMBLE.unpack_from(self.data)
+        if magic != MAGIC:
+            raise ValueError('not a term store')
+        if version != VERSION:
+            raise ValueError(f'unsupported term store version {version}')
+        (self.source_size, self.source_mtime, n_terms, term_bytes,
+         n_docs, doc_bytes, n_entries) = HEADER.unpack_from(self.data, PREAMBLE.size)
+        offset = PREAMBLE.size + HEADER.size
+        self.term_offsets, offset = self.column('I', offset, n_terms + 1)
+        self.doc_offsets, offset = self.column('I', offset, n_docs + 1)
+        self.entry_offsets, offset = self.column('I', offset, n_docs + 1)
+        self.term_ids, offset = self.column('I', offset, n_entries)
+        self.counts, offset = self.column('I', offset, n_entries)
+        offset = padded(offset)
+        self.scores, offset = self.column('d', offset, n_entries)
+        self.term_blob = offset
+        self.doc_blob = offset + term_bytes
+        self.n_docs = n_docs
+        self.terms = {}
+
+    def column(self, typecode: str, offset: int, length: int):
+        """Returns a view on a column in the file and the offset after the column.
+        On big-endian machines the column is copied and byte-swapped."""
+        size = length * array.array(typecode).itemsize
+        view = memoryview(self.data)[offset:offset + size].cast(typecode)
+        if sys.byteorder != 'little':
+            view = array.array(typecode, view)
+            view.byteswap()
+        return view, offset + size
+
+    def doc_identifier(self, n: int):
+        start = self.doc_blob + self.doc_offsets[n]
+        end = self.doc_blob + self.doc_offsets[n + 1]
+        return self.data[start:end].decode('utf8')
+
+    def term(self, n: int):
+        term = self.terms.get(n)
+        if term is None:
+            start = self.term_blob + self.term_offsets[n]
+            end = self.term_blob + self.term_offsets[n + 1]
+            term = self.terms[n] = self.data[start:end].decode('utf8')
+        return term
+
+    def find(self, identifier: str):
+        """Returns the index of the document or -1 if it is not in the store."""
+        n = bisect.bisect_left(DocumentList(self), identifier)
+        if n < self.n_docs and self.doc_identifier(n) == identifier:
+            return n
+        return -1
+
+    def get(self, identifier: str, default=None):
+        """Returns the list of [term, count, score] triples for the document."""
+        n = self.find(identifier)
+        if n == -1:
+            return default
+        return [[self.term(self.term_ids[i]), self.counts[i], self.scores[i]]
+                for i in range(self.entry_offsets[n], self.entry_offsets[n + 1])]
+
+    def __len__(self):
+        return self.n_docs
+
+
+class DocumentList:
+
+    """Sequence view on the document identifiers of a store, for bisect."""
+
+    def __init__(self, store: TermStore):
+        self.store = store
+
+    def __len__(self):
+        return self.store.n_docs
+
+    def __getitem__(self, n: int):
+        return self.store.doc_identifier(n)
+
+
+def padded(offset: int):
+    """Doubles are aligned on 8 bytes."""
+    return offset + (-offset % 8)
+
+
+def is_current(json_file: str, store_file: str):
+    """Returns True if the store exists and was created from the JSON file as it
+    is now."""
+    if not os.path.exists(store_file):
+        return False
+    stat = os.stat(json_file)
+    # only the header is needed, so the store is not opened and mapped
+    with open(store_file, 'rb') as fh:
+        data = fh.read(PREAMBLE.size + HEADER.size)
+    try:
+        magic, version = PREAMBLE.unpack_from(data)
+        source_size, source_mtime = HEADER.unpack_from(data, PREAMBLE.size)[:2]
+    except struct.error:
+        return False
+    return ((magic, version) == (MAGIC, VERSION)
+            and (source_size, source_mtime) == (stat.st_size, stat.st_mtime_ns))
+
+
+def convert(json_file: str, store_file: str = None):
+    """Create a store from a frequencies file. The documents in the file are read
+    one at a time, so the file is never loaded completely."""
+    if store_file is None:
+        store_file = os.path.join(os.path.dirname(json_file), STORE_FILE)
+    term_index = {}
+    # a dictionary so that a later entry for a document replaces an earlier one,
+    # as it does when the JSON file is loaded
+    documents = {}
+    for identifier, triples in read_frequencies(json_file):
+        ids = array.array('I', (term_index.setdefault(t[0], len(term_index)) for t in triples))
+        counts = array.array('I', (t[1] for t in triples))
+        scores = array.array('d', (t[2] for t in triples))
+        documents[identifier] = (identifier, ids, counts, scores)
+    documents = [documents[identifier] for identifier in sorted(documents)]
+    terms = [term.encode('utf8') for term in term_index]
+    identifiers = [document[0].encode('utf8') for document in documents]
+    columns = [offsets(terms), offsets(identifiers), array.array('I', [0])]
+    term_ids, counts, scores = array.array('I'), array.array('I'), array.array('d')
+    for _, document_ids, document_counts, document_scores in documents:
+        term_ids.extend(document_ids)
+        counts.extend(document_counts)
+        scores.extend(document_scores)
+        columns[2].append(len(term_ids))
+    columns.extend([term_ids, counts])
+    stat = os.stat(json_file)
+    header = PREAMBLE.pack(MAGIC, VERSION) + HEADER.pack(
+        stat.st_size, stat.st_mtime_ns, len(terms), columns[0][-1],
+        len(identifiers), columns[1][-1], len(term_ids))
+    tmp_fname = store_file + '.tmp'
+    with open(tmp_fname, 'wb') as fh:
+        fh.write(header)
+        for column in columns:
+            fh.write(little_endian(column))
+        fh.write(b'\0' * (padded(fh.tell()) - fh.tell()))
+        fh.write(little_endian(scores))
+        fh.write(b''.join(terms))
+        fh.write(b''.join(identifiers))
+    os.replace(tmp_fname, store_file)
+
+
+def read_frequencies(json_file: str):
+    """Generate pairs of document identifiers and lists of triples."""
+    with open(json_file, encoding='utf8', newline='') as fh:
+        scanner = jsonstream.Scanner(fh)
+        for identifier in scanner.object_keys():
+            yield identifier, scanner.decode_value()
+
+
+def offsets(strings: list):
+    column = array.array('I', [0])
+    for string in strings:
+        column.append(column[-1] + len(string))
+    return column
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Convert frequencies.json into a term store')
+    parser.add_argument('files', help="frequencies.json files", nargs='+', metavar='FILE')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+    for json_file in args.files:
+        convert(json_file)
+        store_file = os.path.join(os.path.dirname(json_file), STORE_FILE)
+        print(f'{store_file}  {len(TermStore(store_file))} documents')
@@ -0,0 +1,170 @@
+"""Tests for bulkload.py
+
+Run from the code directory with
+
+$ python -m pytest test_bulkload.py
+
+The loader is run against a stub of the ElasticSearch bulk API on a local port,
+which records the requests and answers them as configured by each test.
+
+"""
+
+import gzip, json, threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import bulkload
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        status, response = self.server.respond(self.path, body)
+        data = json.dumps(response).encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+
+    """Records the request bodies and answers each request with the status and the
+    response from respond(), which by default accepts all documents. Tests replace
+    the statuses attribute with a list of statuses for the first requests and the
+    item_status attribute with a function from an identifier and the number of
+    times the document was sent to the status of the item."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.lock = threading.Lock()
+        self.bodies = []
+        self.statuses = []
+        self.sent = Counter()
+        self.item_status = lambda identifier, count: 201
+
+    def respond(self, path: str, body: bytes):
+        with self.lock:
+            self.bodies.append(body)
+            if self.statuses:
+                status = self.statuses.pop(0)
+                return status, {'error': {'type': 'busy', 'reason': 'try again'}}
+            items = []
+            for identifier in action_identifiers(body):
+                self.sent[identifier] += 1
+                status = self.item_status(identifier, self.sent[identifier])
+                result = {'_id': identifier, 'status': status}
+                if status >= 300:
+                    result['error'] = {'type': f'error_{status}', 'reason': 'rejected'}
+                items.append({'index': result})
+            return 200, {'errors': any('error' in item['index'] for item in items),
+                         'items': items}
+
+
+def action_identifiers(body: bytes):
+    lines = body.splitlines()
+    return [json.loads(line)['index']['_id'] for line in lines[::2]]
+
+
+@pytest.fixture
+def server():
+    server = StubServer()
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def bulk_file(tmp_path):
+    """A bulk file with 50 documents of different sizes."""
+    fname = tmp_path / 'elastic.json'
+    with open(fname, 'wb') as fh:
+        for n in range(50):
+            fh.write(json.dumps({'index': {'_id': f'doc{n}'}}).encode('utf8') + b'\n')
+            fh.write(json.dumps({'title': 'x' * (10 * n)}).encode('utf8') + b'\n')
+        fh.write(b'\n')
+    return str(fname)
+
+
+def loader(server, **kwargs):
+    host, port = server.server_address
+    return bulkload.BulkLoader(host, port, 'test', **kwargs)
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_chunks_split_on_action_boundaries(server, bulk_file, compress):
+    chunk_size = 1000
+    bulk_loader = loader(server, concurrency=3, compress=compress)
+    results = bulk_loader.load(bulk_file, chunk_size)
+    bulk_loader.close()
+    assert results == Counter(loaded=50)
+    assert len(server.bodies) > 1
+    for body in server.bodies:
+        lines = body.splitlines()
+        assert len(lines) % 2 == 0
+        assert all(line.startswith(b'{"index"') for line in lines[::2])
+        assert all(line.startswith(b'{"title"') for line in lines[1::2])
+        # only a single action can be larger than the chunk size
+        assert len(body) <= chunk_size or len(lines) == 2
+    identifiers = [identifier for body in server.bodies
+                   for identifier in action_identifiers(body)]
+    assert sorted(identifiers) == sorted(f'doc{n}' for n in range(50))
+
+
+@pytest.mark.parametrize('status', [429, 503])
+def test_busy_responses_are_retried_with_backoff(server, bulk_file, status, monkeypatch):
+    delays = []
+    monkeypatch.setattr(bulkload.time, 'sleep', delays.append)
+    server.statuses = [status, status, status]
+    bulk_loader = loader(server, concurrency=1, retries=4, backoff=0.5)
+    results = bulk_loader.load(bulk_file, 10 ** 6)
+    bulk_loader.close()
+    assert results == Counter(loaded=50)
+    assert len(server.bodies) == 4
+    assert delays == [0.5, 1.0, 2.0]
+
+
+def test_too_many_retries_fail_the_chunk(server, bulk_file, monkeypatch):
+    monkeypatch.setattr(bulkload.time, 'sleep', lambda seconds: None)
+    server.statuses = [503] * 3
+    bulk_loader = loader(server, concurrency=1, retries=2)
+    results = bulk_loader.load(bulk_file, 10 ** 6)
+    bulk_loader.close()
+    assert results == Counter({'http-503': 50})
+
+
+def test_item_errors_are_reported_and_counted(server, bulk_file, tmp_path, monkeypatch):
+    monkeypatch.setattr(bulkload.time, 'sleep', lambda seconds: None)
+
+    def item_status(identifier, count):
+        n = int(identifier[3:])
+        if n % 10 == 0:
+            return 400
+        if n % 10 == 1 and count == 1:
+            # rejected once because of a full queue, accepted when sent again
+            return 429
+        return 201
+
+    server.item_status = item_status
+    bulk_loader = loader(server, concurrency=2)
+    log_fname = tmp_path / 'bulkload.log'
+    with open(log_fname, 'w') as log:
+        results = bulk_loader.load(bulk_file, 1000, log)
+    bulk_loader.close()
+    assert results == Counter({'loaded': 45, 'error_400': 5})
+    assert all(server.sent[f'doc{n}'] == 2 for n in range(1, 50, 10))
+    logged = sorted(line.split('\t')[:2] for line in log_fname.read_text().splitlines())
+    assert logged == sorted([f'doc{n}', 'error_400'] for n in range(0, 50, 10))
@@ -0,0 +1,26 @@
+"""Tests for check_shards.py
+
+Run from the code directory with
+
+$ python -m pytest test_check_shards.py
+
+"""
+
+import pytest
+import bulkfile, check_shards, jsoncodec
+
+
+IDENTIFIERS = [f'{n:024x}' for n in range(5)]
+
+
+@pytest.mark.parametrize('compress', [None, 'gzip', 'zstd'])
+def test_bulk_file_identifiers(tmp_path, compress):
+    if compress == 'zstd':
+        pytest.importorskip('zstandard')
+    fname = str(tmp_path / ('elastic.json' + bulkfile.extension(compress)))
+    with bulkfile.open_write(fname, compress, block_size=100) as fh:
+        for identifier in IDENTIFIERS:
+            fh.write(jsoncodec.dumpb({'index': {'_id': identifier}}) + b'\n'
+                     + jsoncodec.dumpb({'title': 'Café über alles'}) + b'\n')
+        fh.write(b'\n')
+    assert check_shards.output_identifiers(fname) == IDENTIFIERS
@@ -0,0 +1,150 @@
+"""Tests for merge.py
+
+Run from the code directory with
+
+$ python -m pytest test_merge.py
+
+The tests merge a small synthetic topic from benchmark.synthetic_topic().
+
+"""
+
+import os, sys, json
+import pytest
+import benchmark, merge
+
+
+DOCS = 12
+
+
+@pytest.fixture
+def topic(tmp_path, monkeypatch):
+    """A synthetic topic in a temporary directory, which is also the working
+    directory so the logs go there."""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('logs')
+    topic_dir = str(tmp_path / 'topic')
+    benchmark.synthetic_topic(topic_dir, DOCS, 0.25, 1)
+    return topic_dir
+
+
+def run_merge(topic_dir: str, out_dir: str = None, elastic_dir: str = None, **kwargs):
+    layers = {name: os.path.join(topic_dir, name) for name in ('scpa', 'doc', 'ner', 'trm', 'sum')}
+    merge.merge_directory(
+        layers['scpa'], os.path.join(topic_dir, 'metadata.bibjson'), layers['doc'],
+        layers['ner'], layers['trm'], layers['sum'], out_dir, sys.maxsize,
+        elastic_dir=elastic_dir, **kwargs)
+
+
+def read_files(directory: str):
+    return {fname: open(os.path.join(directory, fname), 'rb').read()
+            for fname in sorted(os.listdir(directory)) if fname.endswith('.json')}
+
+
+def test_merged_files_are_the_same_with_elastic(topic):
+    run_merge(topic, os.path.join(topic, 'mer'))
+    run_merge(topic, os.path.join(topic, 'mer-ela'), os.path.join(topic, 'ela'))
+    merged = read_files(os.path.join(topic, 'mer'))
+    assert merged
+    assert read_files(os.path.join(topic, 'mer-ela')) == merged
+
+
+def test_bulk_file_is_the_same_as_from_prepare_elastic(topic):
+    import prepare_elastic
+    run_merge(topic, os.path.join(topic, 'mer'))
+    prepare_elastic.prepare(os.path.join(topic, 'mer'), os.path.join(topic, 'ela'), [],
+                            sys.maxsize, overwrite=True)
+    run_merge(topic, None, os.path.join(topic, 'ela-fused'))
+    fname = prepare_elastic.ELASTIC_FILE
+    with open(os.path.join(topic, 'ela', fname), 'rb') as fh1, \
+            open(os.path.join(topic, 'ela-fused', fname), 'rb') as fh2:
+        assert fh1.read() == fh2.read()
+
+
+def test_rejected_documents_only_read_scienceparse(topic, monkeypatch):
+    read = []
+    def spy(function):
+        def wrapper(*fnames, **kwargs):
+            read.extend(fname for fname in fnames if isinstance(fname, str))
+            return function(*fnames, **kwargs)
+        return wrapper
+    monkeypatch.setattr(merge.manifest, 'file_hash', spy(merge.manifest.file_hash))
+    monkeypatch.setattr(merge, 'load_json', spy(merge.load_json))
+    monkeypatch.setattr(merge, 'get_summary', spy(merge.get_summary))
+    run_merge(topic, os.path.join(topic, 'mer'))
+    merged = set(os.listdir(os.path.join(topic, 'mer')))
+    rejected = [doc for doc in sorted(os.listdir(os.path.join(topic, 'doc')))
+                if doc not in merged]
+    assert rejected
+    for doc in rejected:
+        identifier = merge.get_name(doc)
+        assert [fname for fname in read if identifier in fname] \
+            == [os.path.join(topic, 'scpa', identifier + '_input.pdf.json')]
+
+
+def test_changing_the_json_backend_makes_merged_documents_stale(topic, monkeypatch, capsys):
+    import jsoncodec
+    monkeypatch.setattr(jsoncodec, 'CODEC', jsoncodec.StdlibCodec())
+    run_merge(topic, os.path.join(topic, 'mer'))
+    run_merge(topic, os.path.join(topic, 'mer'), status=True)
+    assert 'up-to-date        12' in capsys.readouterr().out
+    monkeypatch.setattr(jsoncodec, 'CODEC', type('OtherCodec', (jsoncodec.StdlibCodec,),
+                                                 {'name': 'other'})())
+    run_merge(topic, os.path.join(topic, 'mer'), status=True)
+    assert 'stale             12' in capsys.readouterr().out
+
+
+def test_fused_merge_and_prepare_elastic_keep_their_own_manifests(topic, capsys):
+    import prepare_elastic
+    ela_dir = os.path.join(topic, 'ela')
+    run_merge(topic, os.path.join(topic, 'mer'))
+    prepare_elastic.prepare(os.path.join(topic, 'mer'), ela_dir, [], sys.maxsize)
+    run_merge(topic, None, ela_dir)
+    assert os.path.exists(os.path.join(ela_dir, 'merge-elastic.manifest.json'))
+    capsys.readouterr()
+    run_merge(topic, None, ela_dir, status=True)
+    assert 'stale              0\n    missing            0' in capsys.readouterr().out
+    prepare_elastic.prepare(os.path.join(topic, 'mer'), ela_dir, [], sys.maxsize, status=True)
+    assert 'stale              0\n    missing            0' in capsys.readouterr().out
+
+
+def test_fused_merge_manifest_with_shards(topic):
+    ela_dir = os.path.join(topic, 'ela')
+    run_merge(topic, None, ela_dir, shard=(1, 2))
+    assert sorted(fname for fname in os.listdir(ela_dir) if 'manifest' in fname) \
+        == ['merge-elastic.manifest-shard-1-of-2.json']
+
+
+def test_unreadable_scienceparse_file_is_an_error_for_one_document(topic):
+    broken = sorted(os.listdir(os.path.join(topic, 'scpa')))[0]
+    with open(os.path.join(topic, 'scpa', broken), 'w') as fh:
+        fh.write('{"name": "x", "metadata": {"title": "trunc')
+    run_merge(topic, os.path.join(topic, 'mer'))
+    identifier = broken[:-len(merge.LAYERS['scpa'])]
+    merged = os.listdir(os.path.join(topic, 'mer'))
+    assert merged and identifier + '.json' not in merged
+    log = [fname for fname in os.listdir('logs') if fname.startswith('merger-')][0]
+    with open(os.path.join('logs', log)) as fh:
+        assert any(line.startswith(identifier + '.json -- ') and 'rejected' not in line
+                   for line in fh)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_broken_layer_file_is_an_error_for_one_document(topic, workers):
+    run_merge(topic, os.path.join(topic, 'mer-ok'))
+    merged = sorted(os.listdir(os.path.join(topic, 'mer-ok')))
+    broken = merged[0]
+    with open(os.path.join(topic, 'ner', broken), 'w') as fh:
+        fh.write('{"entities": {')
+    run_merge(topic, os.path.join(topic, 'mer'), workers=workers)
+    assert sorted(os.listdir(os.path.join(topic, 'mer'))) == merged[1:]
+    manifest_fname = merge.manifest.manifest_file(os.path.join(topic, 'mer'))
+    with open(manifest_fname) as fh:
+        assert broken not in json.load(fh)['documents']
+
+
+def test_changing_the_version_makes_merged_documents_stale(topic, monkeypatch, capsys):
+    run_merge(topic, os.path.join(topic, 'mer'))
+    monkeypatch.setattr(merge, 'VERSION', merge.VERSION + 1)
+    capsys.readouterr()
+    run_merge(topic, os.path.join(topic, 'mer'), status=True)
+    assert f'stale             {DOCS}' in capsys.readouterr().out
@@ -0,0 +1,62 @@
+"""Tests for prepare_elastic.py
+
+Run from the code directory with
+
+$ python -m pytest test_prepare_elastic.py
+
+The tests convert synthetic merged files from benchmark.synthetic_merged().
+
+"""
+
+import os, sys
+import pytest
+import benchmark, jsoncodec, manifest, prepare_elastic
+
+
+DOCS = 10
+
+
+@pytest.fixture
+def merged(tmp_path, monkeypatch):
+    """A directory with merged files, the working directory is a temporary directory
+    so the logs go there."""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('logs')
+    mer_dir = tmp_path / 'mer'
+    mer_dir.mkdir()
+    for text in benchmark.synthetic_merged(DOCS, 5, 2):
+        name = jsoncodec.loads(text)['name']
+        (mer_dir / f'{name}.json').write_bytes(text)
+    return str(mer_dir)
+
+
+def read_summary(ela_dir: str):
+    return jsoncodec.load(os.path.join(ela_dir, prepare_elastic.delta_summary_file()))
+
+
+def manifest_documents(ela_dir: str):
+    fname = manifest.manifest_file(os.path.join(ela_dir, 'elastic'))
+    return set(jsoncodec.load(fname)['documents'])
+
+
+def test_delta_with_limit_does_not_delete(merged, tmp_path):
+    ela_dir = str(tmp_path / 'ela')
+    prepare_elastic.prepare(merged, ela_dir, [], sys.maxsize, delta=True)
+    assert read_summary(ela_dir)['counts']['new'] == DOCS
+    prepare_elastic.prepare(merged, ela_dir, [], 3, delta=True)
+    summary = read_summary(ela_dir)
+    assert summary['counts']['deleted'] == 0
+    assert len(manifest_documents(ela_dir)) == DOCS
+    with open(os.path.join(ela_dir, 'elastic-delta.json'), 'rb') as fh:
+        assert b'"delete"' not in fh.read()
+
+
+def test_delta_deletes_removed_documents(merged, tmp_path):
+    ela_dir = str(tmp_path / 'ela')
+    prepare_elastic.prepare(merged, ela_dir, [], sys.maxsize, delta=True)
+    removed = sorted(os.listdir(merged))[-1]
+    os.remove(os.path.join(merged, removed))
+    prepare_elastic.prepare(merged, ela_dir, [], 3, delta=True)
+    summary = read_summary(ela_dir)
+    assert summary['deleted'] == [removed[:-5]]
+    assert manifest_documents(ela_dir) == set(os.listdir(merged))
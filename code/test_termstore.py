@@ -0,0 +1,42 @@
+"""Tests for termstore.py
+
+Run from the code directory with
+
+$ python -m pytest test_termstore.py
+
+"""
+
+import os, json
+import termstore
+
+
+FREQUENCIES = {
+    'doc1': [['radiocarbon samples', 3, 1.5], ['charcoal', 1, 0.25]],
+    'doc2': [['charcoal', 2, 0.5]] }
+
+
+def write_frequencies(trm_dir, frequencies: dict = FREQUENCIES):
+    with open(os.path.join(trm_dir, termstore.JSON_FILE), 'w') as fh:
+        json.dump(frequencies, fh)
+
+
+def test_store_has_the_terms(tmp_path):
+    write_frequencies(tmp_path)
+    store = termstore.open_store(str(tmp_path))
+    assert store.get('doc1') == FREQUENCIES['doc1']
+    assert store.get('doc2') == FREQUENCIES['doc2']
+    assert store.get('doc3', []) == []
+
+
+def test_is_current(tmp_path):
+    json_file = os.path.join(tmp_path, termstore.JSON_FILE)
+    store_file = os.path.join(tmp_path, termstore.STORE_FILE)
+    write_frequencies(tmp_path)
+    assert not termstore.is_current(json_file, store_file)
+    termstore.convert(json_file, store_file)
+    assert termstore.is_current(json_file, store_file)
+    write_frequencies(tmp_path, {'doc1': FREQUENCIES['doc1']})
+    assert not termstore.is_current(json_file, store_file)
+    with open(store_file, 'wb') as fh:
+        fh.write(b'XTRM')
+    assert not termstore.is_current(json_file, store_file)
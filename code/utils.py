@@ -1,3 +1,4 @@
+import os, zlib, argparse, multiprocessing
 from collections import Counter
 from datetime import datetime
 from config import MERGED_FIELDS
@@ -44,6 +45,60 @@ def timestamp():
     return datetime.strftime(datetime.now(), '%Y%m%d:%H%M%S')
 
 
+def identifier(fname: str):
+    """Returns the xDD identifier of a file name from any of the processing stages,
+    for example 54b4324ee138239d8684aeb2_input.pdf.json, 54b4324ee138239d8684aeb2.json
+    and 54b4324ee138239d8684aeb2.txt all have identifier 54b4324ee138239d8684aeb2."""
+    return os.path.basename(fname).split('.')[0].split('_')[0]
+
+
+def shard(shard_string: str):
+    """Argument type for the --shard option, turns a string I/N into a pair of two
+    integers where I is the shard index from 1 to N and N the number of shards."""
+    try:
+        index, count = [int(n) for n in shard_string.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'shard should be I/N, not {shard_string}')
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f'shard index should be from 1 to {count}')
+    return index, count
+
+
+def shard_index(fname: str, count: int):
+    """Returns the shard, from 1 to count, that a file belongs to. This uses a CRC of
+    the xDD identifier, which unlike hash() is the same across runs and machines."""
+    return zlib.crc32(identifier(fname).encode('utf8')) % count + 1
+
+
+def select_shard(fnames: list, shard: tuple):
+    """Returns the file names that belong to the shard, which is a pair of the shard
+    index and the number of shards or None to select all file names."""
+    if shard is None:
+        return fnames
+    index, count = shard
+    return [fname for fname in fnames if shard_index(fname, count) == index]
+
+
+def shard_name(shard: tuple):
+    return 'all' if shard is None else f'{shard[0]}/{shard[1]}'
+
+
+def shard_suffix(shard: tuple):
+    """Suffix for log and output files created by a shard."""
+    return '' if shard is None else f'-shard-{shard[0]}-of-{shard[1]}'
+
+
+def map_docs(function, docs: list, workers: int, chunksize: int = 1):
+    """Generate the results of the function on the documents, in the order of the
+    documents. With more than one worker a pool of forked processes is used, which
+    gets the documents in chunks of chunksize."""
+    if workers > 1:
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            yield from pool.imap(function, docs, chunksize=chunksize)
+    else:
+        yield from map(function, docs)
+
+
 def create_elastic_object(json_obj: dict, tags: list):
     """Creates a dictionary meant for bulk import into ElasticSearch."""
     elastic_obj = {"tags": tags}